@@ -0,0 +1,266 @@
+# flake8: noqa
+import os
+import json
+import argparse
+import multiprocessing
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import chess
+import chess.engine
+from app.Domains.Engine.resource_sizing import (
+    EngineLayout,
+    plan_engine_layout,
+    log_layout,
+)
+from app.utils.error_handling import log_success, log_error, log_debug, ChessGameError
+from app.utils.ChessPositions.positions_store import (
+    PositionsStore,
+    DEFAULT_STORE_DIR,
+)
+
+CHECKPOINT_FILE = "eval_checkpoint.json"
+MOVE_WIDTH = 5  # longest UCI move, e.g. "e7e8q"
+MAX_MULTIPV = 3
+
+# Output columns written next to the positions store
+EVAL_COLUMNS = {
+    "eval_score": (np.float32, ()),  # centipawns from white's view, NaN on mate
+    "eval_mate": (np.int16, ()),  # signed mate distance from white's view, 0 if none
+    "eval_depth": (np.int16, ()),
+    "eval_top_moves": (f"S{MOVE_WIDTH}", (MAX_MULTIPV,)),  # best first, b"" padded
+}
+
+
+class BulkEvaluationError(ChessGameError):
+    pass
+
+
+# One engine per worker process, created by the pool initializer
+_worker_engine = None
+
+
+def _init_worker(layout: EngineLayout, slots):
+    global _worker_engine
+    from app.Domains.Engine.engine_manager import StockfishEngine
+
+    with slots.get_lock():
+        slot = slots.value
+        slots.value += 1
+    _worker_engine = StockfishEngine(layout=layout, slot=slot)
+    # Quit before the worker joins its threads, the engine thread would block exit
+    Finalize(_worker_engine, _worker_engine.quit_engine, exitpriority=10)
+
+
+def _evaluate_chunk(
+    start: int, fens: list[str], depth: int | None, nodes: int | None, multipv: int
+) -> tuple[int, list[dict]]:
+    from app.Domains.Engine.engine_manager import evaluate_position
+
+    limit = chess.engine.Limit(depth=depth, nodes=nodes)
+    return start, [
+        evaluate_position(_worker_engine, fen, limit=limit, multipv=multipv)
+        for fen in fens
+    ]
+
+
+def _open_outputs(store_dir: str, rows: int, resume: bool) -> dict[str, np.memmap]:
+    outputs = {}
+    for name, (dtype, shape) in EVAL_COLUMNS.items():
+        path = os.path.join(store_dir, f"{name}.npy")
+        if resume and os.path.isfile(path):
+            outputs[name] = np.load(path, mmap_mode="r+")
+            continue
+        column = np.lib.format.open_memmap(
+            path, mode="w+", dtype=dtype, shape=(rows, *shape)
+        )
+        if name == "eval_score":
+            column[:] = np.nan
+        outputs[name] = column
+    return outputs
+
+
+def _load_checkpoint(store_dir: str, params: dict, restart: bool) -> set[int]:
+    path = os.path.join(store_dir, CHECKPOINT_FILE)
+    if restart or not os.path.isfile(path):
+        return set()
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("params") != params:
+        raise BulkEvaluationError(
+            f"Checkpoint was written with {checkpoint.get('params')}, "
+            "pass --restart to discard it"
+        )
+    return set(checkpoint["done_chunks"])
+
+
+def _save_checkpoint(store_dir: str, params: dict, done_chunks: set[int]):
+    path = os.path.join(store_dir, CHECKPOINT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"params": params, "done_chunks": sorted(done_chunks)}, f)
+    os.replace(tmp_path, path)  # atomic, a crash never leaves a torn checkpoint
+
+
+def _write_results(outputs: dict, start: int, results: list[dict]):
+    for offset, result in enumerate(results):
+        row = start + offset
+        if result["error"] is not None or "moves" not in result:
+            continue
+        if result["score"] is not None:
+            outputs["eval_score"][row] = result["score"]
+        outputs["eval_mate"][row] = result["mate"]
+        outputs["eval_depth"][row] = result["depth"]
+        moves = result["moves"][:MAX_MULTIPV]
+        outputs["eval_top_moves"][row] = moves + [""] * (MAX_MULTIPV - len(moves))
+
+
+def run_bulk_evaluation(
+    store_dir: str = DEFAULT_STORE_DIR,
+    workers: int | None = None,
+    chunksize: int = 256,
+    depth: int | None = 16,
+    nodes: int | None = None,
+    multipv: int = MAX_MULTIPV,
+    seed_cache: bool = False,
+    restart: bool = False,
+    limit_rows: int | None = None,
+) -> dict:
+    """Annotates every position of the store with engine evaluations.
+
+    Chunks of positions are fanned out to a pool of engine processes, results
+    land in eval_*.npy columns next to the store and finished chunks are
+    checkpointed so an interrupted run resumes where it stopped."""
+    if depth is None and nodes is None:
+        raise BulkEvaluationError("A fixed depth or nodes budget is required")
+    multipv = max(1, min(multipv, MAX_MULTIPV))
+    layout = plan_engine_layout(engines=workers)
+    workers = layout.pool_size
+    log_layout(layout, "Bulk evaluation")
+
+    store = PositionsStore(store_dir)
+    rows = len(store) if limit_rows is None else min(len(store), limit_rows)
+    fens = store.column("fen")
+
+    params = {
+        "rows": rows,
+        "chunksize": chunksize,
+        "depth": depth,
+        "nodes": nodes,
+        "multipv": multipv,
+    }
+    done_chunks = _load_checkpoint(store_dir, params, restart)
+    outputs = _open_outputs(store_dir, len(store), resume=bool(done_chunks))
+    pending_chunks = [
+        c for c in range(0, rows, chunksize) if c // chunksize not in done_chunks
+    ]
+    log_success(
+        "Evaluating %s positions with %s workers, %s chunks left",
+        rows,
+        workers,
+        len(pending_chunks),
+    )
+
+    redis_client = None
+    if seed_cache:
+        from app.services.redis.redis_setup import get_redis_client
+
+        redis_client = get_redis_client()
+        if redis_client is None:
+            raise BulkEvaluationError("--seed-cache needs a reachable Redis")
+
+    errors = 0
+    seeded = 0
+    # Spawned workers set up their own logging instead of inheriting its thread
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(layout, mp_context.Value("i", 0)),
+    ) as pool:
+        in_flight = set()
+        chunk_iter = iter(pending_chunks)
+        # Keep a bounded number of chunks queued so memory stays flat
+        max_in_flight = workers * 2
+        while True:
+            for start in chunk_iter:
+                end = min(start + chunksize, rows)
+                chunk_fens = [f.decode() for f in fens[start:end]]
+                in_flight.add(
+                    pool.submit(
+                        _evaluate_chunk, start, chunk_fens, depth, nodes, multipv
+                    )
+                )
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                start, results = future.result()
+                _write_results(outputs, start, results)
+                errors += sum(1 for r in results if r["error"] is not None)
+
+                if redis_client is not None:
+                    from app.services.redis.redis_services import (
+                        redis_seed_analysis_cache,
+                    )
+
+                    seeded += redis_seed_analysis_cache(
+                        entries={
+                            r["fen"]: r["top_moves"]
+                            for r in results
+                            if r.get("top_moves")
+                        },
+                        redis_client=redis_client,
+                    )
+
+                for column in outputs.values():
+                    column.flush()
+                done_chunks.add(start // chunksize)
+                _save_checkpoint(store_dir, params, done_chunks)
+                log_debug("Finished chunk starting at row %s", start)
+
+    summary = {"rows": rows, "errors": errors, "seeded": seeded}
+    log_success("Bulk evaluation finished: %s", summary)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Annotate the positions store with Stockfish evaluations"
+    )
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=256)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--nodes", type=int, default=None)
+    parser.add_argument("--multipv", type=int, default=MAX_MULTIPV)
+    parser.add_argument("--limit-rows", type=int, default=None)
+    parser.add_argument(
+        "--seed-cache",
+        action="store_true",
+        help="Also write top moves into the shared Redis analysis cache",
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore an existing checkpoint"
+    )
+    args = parser.parse_args()
+
+    try:
+        run_bulk_evaluation(
+            store_dir=args.store,
+            workers=args.workers,
+            chunksize=args.chunksize,
+            depth=args.depth if args.depth or args.nodes else 16,
+            nodes=args.nodes,
+            multipv=args.multipv,
+            seed_cache=args.seed_cache,
+            restart=args.restart,
+            limit_rows=args.limit_rows,
+        )
+    except (BulkEvaluationError, ChessGameError) as b:
+        log_error("Bulk evaluation failed: %s", b)
+        raise SystemExit(1)
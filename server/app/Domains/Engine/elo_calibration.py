@@ -0,0 +1,330 @@
+# flake8: noqa
+import os
+import json
+import math
+import random
+import argparse
+import multiprocessing
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+import numpy as np
+import chess
+import chess.engine
+from app.Domains.Engine.resource_sizing import (
+    EngineLayout,
+    plan_engine_layout,
+    log_layout,
+)
+from app.utils.error_handling import log_success, log_error, ChessGameError
+
+DEFAULT_TABLE_FILE = "skill_elo_table.json"
+ELO_SCALE = math.log(10) / 400
+
+
+class CalibrationError(ChessGameError):
+    pass
+
+
+@dataclass(frozen=True)
+class Player:
+    """A Skill Level playing under one search budget"""
+
+    skill: int
+    time: float | None = None
+    nodes: int | None = None
+    depth: int | None = None
+
+    def limit(self) -> chess.engine.Limit:
+        return chess.engine.Limit(time=self.time, nodes=self.nodes, depth=self.depth)
+
+    @property
+    def label(self) -> str:
+        budget = ",".join(
+            f"{k}={v}" for k, v in asdict(self).items() if k != "skill" and v
+        )
+        return f"skill={self.skill}[{budget}]"
+
+
+# One engine per worker process, created by the pool initializer
+_worker_engine = None
+
+
+def _init_worker(move_mode: str, layout: EngineLayout, slots):
+    global _worker_engine
+    from app.Domains.Engine.engine_manager import StockfishEngine
+
+    with slots.get_lock():
+        slot = slots.value
+        slots.value += 1
+    _worker_engine = StockfishEngine(layout=layout, slot=slot)
+    _worker_engine.move_mode = move_mode
+    # Quit before the worker joins its threads, the engine thread would block exit
+    Finalize(_worker_engine, _worker_engine.quit_engine, exitpriority=10)
+
+
+def random_opening(plies: int, rng: random.Random) -> list[str]:
+    board = chess.Board()
+    moves = []
+    for _ in range(plies):
+        legal = list(board.legal_moves)
+        if not legal:
+            break
+        move = rng.choice(legal)
+        board.push(move)
+        moves.append(move.uci())
+    return moves
+
+
+def _play_game(white: Player, black: Player, opening: list[str], max_plies: int):
+    """Plays one game and returns white's score (1, 0.5 or 0)"""
+    board = chess.Board()
+    for uci in opening:
+        board.push_uci(uci)
+    players = {chess.WHITE: white, chess.BLACK: black}
+    while board.outcome(claim_draw=True) is None and board.ply() < max_plies:
+        player = players[board.turn]
+        result = _worker_engine.play_at_skill(
+            board=board, skill=player.skill, limit=player.limit()
+        )
+        board.push(result.move)
+    outcome = board.outcome(claim_draw=True)
+    if outcome is None or outcome.winner is None:
+        return 0.5  # drawn or adjudicated at the ply cap
+    return 1.0 if outcome.winner == chess.WHITE else 0.0
+
+
+def _play_pair(
+    a: Player, b: Player, opening: list[str], max_plies: int
+) -> tuple[Player, Player, float, int]:
+    """Both colours from the same opening, returns a's points out of 2"""
+    points = _play_game(a, b, opening, max_plies)
+    points += 1.0 - _play_game(b, a, opening, max_plies)
+    return a, b, points, 2
+
+
+def fit_ratings(
+    players: list[Player],
+    results: dict[tuple[int, int], list[float]],
+    anchor: int,
+    anchor_elo: float,
+    iterations: int = 50,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Maximum likelihood Elo for every player from pairwise points, with the
+    anchor player fixed. One virtual draw per pairing keeps players that won
+    or lost everything finite. Returns ratings and their standard errors."""
+    n = len(players)
+    free = [i for i in range(n) if i != anchor]
+    ratings = np.full(n, anchor_elo, dtype=float)
+    for _ in range(iterations):
+        grad = np.zeros(n)
+        hess = np.zeros((n, n))
+        for (i, j), (points, games) in results.items():
+            points, games = points + 0.5, games + 1
+            expected = 1 / (1 + math.exp(-ELO_SCALE * (ratings[i] - ratings[j])))
+            grad[i] += ELO_SCALE * (points - games * expected)
+            grad[j] -= ELO_SCALE * (points - games * expected)
+            w = games * ELO_SCALE**2 * expected * (1 - expected)
+            hess[i, i] -= w
+            hess[j, j] -= w
+            hess[i, j] += w
+            hess[j, i] += w
+        sub = hess[np.ix_(free, free)]
+        step = np.linalg.solve(sub, grad[free])
+        ratings[free] -= step
+        if np.max(np.abs(step)) < 0.01:
+            break
+    errors = np.zeros(n)
+    errors[free] = np.sqrt(np.diag(np.linalg.inv(-hess[np.ix_(free, free)])))
+    return ratings, errors
+
+
+def run_calibration(
+    skills: list[int],
+    budget: dict,
+    anchor: Player,
+    anchor_elo: float,
+    pairs: int = 20,
+    spread: int = 2,
+    opening_plies: int = 4,
+    max_plies: int = 300,
+    workers: int | None = None,
+    move_mode: str = "skill",
+    seed: int | None = None,
+) -> dict:
+    """Plays engine-vs-engine games across a process pool and estimates the
+    Elo of each Skill Level under `budget`.
+
+    Every level meets the anchor and the levels within `spread` of it, each
+    pairing plays `pairs` randomised openings with both colours."""
+    if not budget:
+        raise CalibrationError("A time, nodes or depth budget is required")
+    layout = plan_engine_layout(engines=workers)
+    workers = layout.pool_size
+    log_layout(layout, "Calibration")
+    rng = random.Random(seed)
+    players = [anchor] + [Player(skill=s, **budget) for s in skills if s >= 0]
+    players = list(dict.fromkeys(players))
+    index = {player: i for i, player in enumerate(players)}
+
+    pairings = set()
+    for i, player in enumerate(players[1:], start=1):
+        pairings.add((0, i))
+        for j, other in enumerate(players[1:], start=1):
+            if i < j and abs(player.skill - other.skill) <= spread:
+                pairings.add((i, j))
+
+    jobs = [
+        (players[i], players[j], random_opening(opening_plies, rng))
+        for i, j in sorted(pairings)
+        for _ in range(pairs)
+    ]
+    log_success(
+        "Playing %s games over %s pairings with %s workers",
+        len(jobs) * 2,
+        len(pairings),
+        workers,
+    )
+
+    results: dict[tuple[int, int], list[float]] = {p: [0.0, 0] for p in pairings}
+    failed = 0
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(move_mode, layout, mp_context.Value("i", 0)),
+    ) as pool:
+        futures = [pool.submit(_play_pair, a, b, o, max_plies) for a, b, o in jobs]
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                a, b, points, games = future.result()
+            except Exception as e:
+                failed += 1
+                log_error(f"Calibration game failed: {e}")
+                continue
+            entry = results[(index[a], index[b])]
+            entry[0] += points
+            entry[1] += games
+            if done % 50 == 0:
+                log_success("%s/%s pairs played", done, len(jobs))
+
+    ratings, errors = fit_ratings(players, results, anchor=0, anchor_elo=anchor_elo)
+    levels = []
+    calibrated = {Player(skill=s, **budget) for s in skills}
+    for i, player in enumerate(players):
+        if player not in calibrated:
+            continue  # an anchor on another budget is not part of the table
+        games = sum(g for (a, b), (_, g) in results.items() if i in (a, b))
+        levels.append(
+            {
+                "skill": player.skill,
+                "elo": round(float(ratings[i]), 1),
+                "ci_low": round(float(ratings[i] - 1.96 * errors[i]), 1),
+                "ci_high": round(float(ratings[i] + 1.96 * errors[i]), 1),
+                "games": games,
+            }
+        )
+    return {
+        "budget": budget,
+        "move_mode": move_mode,
+        "anchor": {"player": anchor.label, "elo": anchor_elo},
+        "failed_pairs": failed,
+        "levels": levels,
+    }
+
+
+def write_table(table: dict, path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(table, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _parse_skills(text: str) -> list[int]:
+    skills = []
+    for part in text.split(","):
+        if "-" in part:
+            low, high = part.split("-")
+            skills.extend(range(int(low), int(high) + 1))
+        else:
+            skills.append(int(part))
+    return skills
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Estimate the Elo of each Skill Level from engine matches"
+    )
+    parser.add_argument("--skills", default="0-19", help="e.g. 0-19 or 0,5,10")
+    parser.add_argument("--time", type=float, default=None, help="Seconds per move")
+    parser.add_argument("--nodes", type=int, default=None, help="Nodes per move")
+    parser.add_argument("--depth", type=int, default=None, help="Depth per move")
+    parser.add_argument("--anchor-skill", type=int, default=10)
+    parser.add_argument("--anchor-time", type=float, default=None)
+    parser.add_argument("--anchor-nodes", type=int, default=None)
+    parser.add_argument("--anchor-depth", type=int, default=None)
+    parser.add_argument(
+        "--anchor-elo",
+        type=float,
+        default=None,
+        help="Rating fixed for the anchor, defaults to the current table",
+    )
+    parser.add_argument("--pairs", type=int, default=20, help="Openings per pairing")
+    parser.add_argument("--spread", type=int, default=2)
+    parser.add_argument("--opening-plies", type=int, default=4)
+    parser.add_argument("--max-plies", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--move-mode", choices=["skill", "shared"], default="skill")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=DEFAULT_TABLE_FILE)
+    args = parser.parse_args()
+
+    budget = {
+        k: v
+        for k, v in {
+            "time": args.time,
+            "nodes": args.nodes,
+            "depth": args.depth,
+        }.items()
+        if v is not None
+    }
+    anchor_budget = {
+        k: v
+        for k, v in {
+            "time": args.anchor_time,
+            "nodes": args.anchor_nodes,
+            "depth": args.anchor_depth,
+        }.items()
+        if v is not None
+    } or budget
+
+    anchor_elo = args.anchor_elo
+    if anchor_elo is None:
+        from app.Domains.Engine.engine_manager import StockfishEngine
+
+        known = {int(e["skill"]): e["elo"] for e in StockfishEngine._skill_elo_map}
+        if args.anchor_skill not in known:
+            raise SystemExit("No rating known for the anchor, pass --anchor-elo")
+        anchor_elo = float(known[args.anchor_skill])
+
+    table = run_calibration(
+        skills=_parse_skills(args.skills),
+        budget=budget,
+        anchor=Player(skill=args.anchor_skill, **anchor_budget),
+        anchor_elo=anchor_elo,
+        pairs=args.pairs,
+        spread=args.spread,
+        opening_plies=args.opening_plies,
+        max_plies=args.max_plies,
+        workers=args.workers,
+        move_mode=args.move_mode,
+        seed=args.seed,
+    )
+    write_table(table, args.output)
+    for level in table["levels"]:
+        print(
+            f"skill {level['skill']:>2}: {level['elo']:7.1f} "
+            f"[{level['ci_low']:.1f}, {level['ci_high']:.1f}] over {level['games']} games"
+        )
+    log_success(f"Strength table written to {args.output}")
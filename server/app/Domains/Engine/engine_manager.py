@@ -1,5 +1,6 @@
 # flake8: noqa
 import os
+import json
 import asyncio
 import bisect
 import chess.engine
@@ -16,7 +17,24 @@ from typing import Dict
 from dotenv import load_dotenv
 from fastapi import HTTPException
 from app.utils.error_handling import log_debug, log_success, log_error, ChessGameError
+from app.utils.tracing import traced
+from app.utils.profiling import record_engine_wait
 from app.Domains.Engine.models import TopStockfishMoves
+from app.Domains.Engine.engine_supervisor import (
+    EngineSupervisor,
+    EngineUnavailableError,
+)
+from app.Domains.Engine.resource_sizing import (
+    EngineLayout,
+    plan_engine_layout,
+    log_layout,
+)
+from app.Domains.Engine.skill_model import (
+    SKILL_MULTIPV,
+    SearchCache,
+    pick_skill_move,
+    new_skill_rng,
+)
 
 
 class EngineError(ChessGameError):
@@ -26,14 +44,44 @@ class EngineError(ChessGameError):
 if "DOCKER" not in os.environ:
     load_dotenv()
 
-# Get the Stockfish path - prioritize environment variable
+# Get the Stockfish path - prioritize environment variable. Checked when an
+# engine starts, so the API (and remote engine mode) imports without it
 STOCKFISH_PATH = os.environ.get("STOCKFISH_PATH")
 
-if not STOCKFISH_PATH:
-    log_error("STOCKFISH_PATH is not set. Please check your environment.")
-    raise EngineError("STOCKFISH_PATH is not set. Please check your environment.")
+# "skill": one weakened search per move, "shared": one cached full strength
+# MultiPV search per position, weakened locally for each Elo level
+ENGINE_MOVE_MODE = os.getenv("ENGINE_MOVE_MODE", "skill")
+# Strength table written by app.Domains.Engine.elo_calibration
+SKILL_ELO_TABLE = os.getenv("SKILL_ELO_TABLE")
+# Thinking time per engine move in games without a time control
+ENGINE_MOVE_TIME = float(os.getenv("ENGINE_MOVE_TIME", "2"))
+# Lines of analysis served as top moves
+TOP_MOVES_COUNT = 3
+
+
+def move_limit(clock: dict | None) -> chess.engine.Limit:
+    """Search limit for an engine move. With a clock Stockfish budgets its own
+    time, moving fast in simple positions and saving time for hard ones."""
+    if not clock:
+        return chess.engine.Limit(time=ENGINE_MOVE_TIME)
+    return chess.engine.Limit(
+        white_clock=clock["white_clock"],
+        black_clock=clock["black_clock"],
+        white_inc=clock["white_inc"],
+        black_inc=clock["black_inc"],
+    )
+
+
+def load_skill_elo_table(path: str) -> list[dict]:
+    """Reads a calibrated strength table as {skill, elo} entries ordered by Elo"""
+    with open(path) as f:
+        table = json.load(f)
+    levels = sorted(table["levels"], key=lambda level: float(level["elo"]))
+    return [
+        {"skill": str(level["skill"]), "elo": str(round(float(level["elo"])))}
+        for level in levels
+    ]
 
-log_debug(f"STOCKFISH_PATH loaded: {STOCKFISH_PATH}")
 
 # Centralized engine class
 
@@ -64,92 +112,252 @@ class StockfishEngine:
         {"skill": "19", "elo": "2886"},
     ]
 
-    def __new__(cls):
+    def __new__(cls, *args, **kwargs):
         if not cls._instance:
             cls._instance = super(StockfishEngine, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, layout: EngineLayout | None = None, slot: int = 0):
+        """`layout` sizes Threads and Hash, by default this process's single
+        engine gets the CPUs and memory budget it may use. `slot` selects the
+        CPUs it is pinned to when affinity is enabled."""
 
         if hasattr(self, "_initialized") and self._initialized:
             return
 
         try:
-            self.engine: chess.engine.SimpleEngine = (
-                chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
-            )
-            self.engine.configure(
-                {
-                    "Hash": 128,
-                }
+            if not STOCKFISH_PATH:
+                raise EngineError(
+                    "STOCKFISH_PATH is not set. Please check your environment."
+                )
+            log_debug("STOCKFISH_PATH loaded: %s", STOCKFISH_PATH)
+            if layout is None:
+                layout = plan_engine_layout(engines=1)
+                log_layout(layout, "Server")
+            self.layout = layout
+            # Respawns Stockfish if it crashes or hangs, see engine_supervisor
+            self.supervisor = EngineSupervisor(
+                STOCKFISH_PATH,
+                options=layout.options(),
+                affinity=layout.cpus_for(slot),
             )
+            if SKILL_ELO_TABLE and os.path.isfile(SKILL_ELO_TABLE):
+                self._skill_elo_map = load_skill_elo_table(SKILL_ELO_TABLE)
+                log_success(f"Loaded calibrated strength table {SKILL_ELO_TABLE}")
+            self.move_mode = ENGINE_MOVE_MODE
+            self.search_cache = SearchCache()
+            self._skill_rng = new_skill_rng()
             self._initialized = True
             log_success(f"Stockfish central engine initialized:{self.engine}")
-        except EngineError as ee:
+        except (EngineError, chess.engine.EngineError, OSError) as ee:
             log_error(f"Error creating engine: {ee}")
             raise EngineError(f"Error initializing engine: {ee}")
 
+    @property
+    def engine(self) -> chess.engine.SimpleEngine | None:
+        """The Stockfish process currently alive, replaced after a crash"""
+        supervisor = getattr(self, "supervisor", None)
+        return supervisor.engine if supervisor else None
+
+    def configure(self, options: dict):
+        """Sets engine options that are kept across restarts"""
+        self.supervisor.configure(options)
+
+    def engine_stats(self) -> dict:
+        return {**self.supervisor.stats(), "layout": self.layout.as_dict()}
+
     def quit_engine(self):
-        if hasattr(self, "engine") and self.engine is not None:
+        if getattr(self, "supervisor", None) is not None and self._initialized:
             try:
-                self.engine.quit()
-                self.engine = None
+                self.supervisor.quit()
                 self._initialized = False
                 log_success("Stockfish engine successfully shut down.")
             except Exception as e:
                 raise EngineError(f"Error while quitting Stockfish engine: {e}")
 
-    def get_engine_move(self, board: chess.Board, user_elo: str | int) -> PlayResult:
-        """Get stockfish engine move for the current board and given elo strength"""
-        user_elo_int = int(user_elo)
-        idx = bisect.bisect_left(
-            [int(item["elo"]) for item in self._skill_elo_map], user_elo_int
+    @traced("engine.play")
+    def get_engine_move(
+        self, board: chess.Board, user_elo: str | int, clock: dict | None = None
+    ) -> PlayResult:
+        """Get stockfish engine move for the current board and given elo strength.
+        `clock` holds the remaining times and increments of a timed game.
+        The search's score and principal variation come back in result.info"""
+        stockfish_skill = self.skill_for_elo(user_elo)
+        return self.play_at_skill(
+            board=board, skill=int(stockfish_skill), limit=move_limit(clock)
         )
 
-        stockfish_skill = self._skill_elo_map[idx]["skill"]
+    def play_at_skill(
+        self, board: chess.Board, skill: int, limit: chess.engine.Limit
+    ) -> PlayResult:
+        """Move at the given Skill Level under the current move mode. Strength
+        is set by Skill Level alone, UCI_LimitStrength would make Stockfish
+        ignore it in favour of UCI_Elo, which the calibrated table knows
+        nothing about."""
+        if self.move_mode == "shared":
+            return self.get_shared_search_move(board=board, skill=skill, limit=limit)
 
-        result = self.engine.play(
-            board=board,
-            limit=chess.engine.Limit(time=2),
-            options={
-                "UCI_LimitStrength": True,
-                "Skill Level": stockfish_skill,
-            },
-        )
+        with record_engine_wait():
+            result = self.supervisor.call(
+                lambda engine: engine.play(
+                    board=board,
+                    limit=limit,
+                    info=chess.engine.INFO_SCORE | chess.engine.INFO_PV,
+                    options={"Skill Level": str(skill)},
+                ),
+                limit=limit,
+            )
 
         return result
 
-    def get_top_stockfish_moves(self, board: chess.Board) -> list[TopStockfishMoves]:
-        top_moves = []
+    def skill_for_elo(self, user_elo: str | int) -> str:
+        idx = bisect.bisect_left(
+            [int(item["elo"]) for item in self._skill_elo_map], int(user_elo)
+        )
+        return self._skill_elo_map[min(idx, len(self._skill_elo_map) - 1)]["skill"]
+
+    @traced("engine.shared_play")
+    def get_shared_search_move(
+        self,
+        board: chess.Board,
+        skill: int,
+        limit: chess.engine.Limit = chess.engine.Limit(time=ENGINE_MOVE_TIME),
+    ) -> PlayResult:
+        """Weakened move picked from a full strength MultiPV search, which is
+        cached by position so every Elo level reuses it"""
+        infos = self.search_cache.get(board)
+        if infos is None:
+            n = min(SKILL_MULTIPV, board.legal_moves.count())
+            infos = self.analyse_position(board=board, limit=limit, multipv=n)
+            self.search_cache.put(board, infos)
+        chosen = pick_skill_move(infos, skill=skill, rng=self._skill_rng)
+        return PlayResult(chosen["pv"][0], None, dict(chosen))
+
+    @traced("engine.analyse")
+    def analyse_position(
+        self,
+        board: chess.Board,
+        limit: chess.engine.Limit,
+        multipv: int,
+        background: bool = False,
+    ) -> list[InfoDict]:
+        """Full strength MultiPV search, one InfoDict per principal variation.
+        A background search waits for queued foreground calls such as moves."""
+        with record_engine_wait():
+            # Analysis has no side effects, so it is retried once on a new engine
+            return self.supervisor.call(
+                lambda engine: engine.analyse(
+                    board=board,
+                    limit=limit,
+                    options={"UCI_Elo": 3000},
+                    multipv=multipv,
+                ),
+                limit=limit,
+                retry=True,
+                background=background,
+            )
+
+    def get_top_stockfish_moves(
+        self,
+        board: chess.Board,
+        limit: chess.engine.Limit = chess.engine.Limit(time=3.0),
+    ) -> list[TopStockfishMoves]:
         n = min(
-            3, len(list(board.legal_moves))
+            TOP_MOVES_COUNT, len(list(board.legal_moves))
         )  # number of moves to return back for AI analysis
-        log_debug(f"Number of moves analysing = {n}")
+        log_debug("Number of moves analysing = %s", n)
         try:
-            possible_moves: list[InfoDict] = self.engine.analyse(
-                board=board,
-                limit=chess.engine.Limit(time=3.0),
-                options={"UCI_Elo": 3000},
-                multipv=n,
-            )
-
-            for p_move in possible_moves:
-                move = p_move["pv"][0].uci()
-                abs_score: Score = p_move[
-                    "score"
-                ].white()  # evalutation always from whites perspective
-                score = (
-                    abs_score.score() / 100
-                    if not abs_score.is_mate()
-                    else f"Mate in {abs_score.mate()}"
-                )
-                top_moves.append({"move": move, "score": str(score)})
+            possible_moves = self.analyse_position(board=board, limit=limit, multipv=n)
+            top_moves = format_top_moves(possible_moves)
+        except EngineUnavailableError:
+            raise
         except Exception as e:
             raise EngineError(f"Error while getting top moves from stockfish:{e}")
-        # sort temp moves in the order of decreasing score
-        top_moves.sort(key=lambda x: x["score"], reverse=True)
         return top_moves
 
+    @traced("engine.evaluate")
+    def evaluate_positions(self, fens: list[str], depth: int) -> list[dict]:
+        """Best move and score of each position at a fixed depth, one result
+        per FEN in the format of evaluate_position"""
+        limit = chess.engine.Limit(depth=depth)
+        return [evaluate_position(self, fen, limit=limit, multipv=1) for fen in fens]
+
+
+def evaluate_position(
+    engine: "StockfishEngine", fen: str, limit: chess.engine.Limit, multipv: int
+) -> dict:
+    """Searches one position for batch work (bulk evaluation, game reviews).
+    The score is in centipawns from white's view, `mate` is signed and 0
+    without a mate. A failure is returned in `error` instead of raised so one
+    bad position does not sink its batch. Each position is its own background
+    call, so moves of live games are searched in between."""
+    result = {"fen": fen, "error": None}
+    try:
+        board = chess.Board(fen)
+        legal = board.legal_moves.count()
+        n = min(multipv, legal)
+        if n > 0:
+            infos = engine.analyse_position(
+                board=board, limit=limit, multipv=n, background=True
+            )
+            score = infos[0]["score"].white()
+            result.update(
+                score=None if score.is_mate() else score.score(),
+                mate=score.mate() if score.is_mate() else 0,
+                depth=infos[0].get("depth", 0),
+                moves=[info["pv"][0].uci() for info in infos if info.get("pv")],
+            )
+            # only seed the cache with as many lines as a live analysis has
+            if len(infos) >= min(TOP_MOVES_COUNT, legal):
+                result["top_moves"] = format_top_moves(infos)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def format_top_moves(possible_moves: list[InfoDict]) -> list[TopStockfishMoves]:
+    """Converts analysis lines into the {move, score} entries served to clients,
+    at most TOP_MOVES_COUNT of them in the order get_top_stockfish_moves returns.
+    Anything written to the analysis cache goes through here, so a cache hit
+    matches a miss."""
+    top_moves = []
+    for p_move in possible_moves[:TOP_MOVES_COUNT]:
+        move = p_move["pv"][0].uci()
+        abs_score: Score = p_move[
+            "score"
+        ].white()  # evalutation always from whites perspective
+        score = (
+            abs_score.score() / 100
+            if not abs_score.is_mate()
+            else f"Mate in {abs_score.mate()}"
+        )
+        top_moves.append({"move": move, "score": str(score)})
+    # sort temp moves in the order of decreasing score
+    top_moves.sort(key=lambda x: x["score"], reverse=True)
+    return top_moves
+
+
+def format_engine_eval(result: PlayResult) -> dict | None:
+    """Evaluation of the search that produced the engine move, for eval bars.
+    The score is from white's perspective like format_top_moves. With a
+    reduced skill level the engine may play a move other than the head of its
+    principal variation, in which case the line is left out."""
+    info = result.info or {}
+    if "score" not in info:
+        return None
+    abs_score: Score = info["score"].white()
+    score = (
+        abs_score.score() / 100
+        if not abs_score.is_mate()
+        else f"Mate in {abs_score.mate()}"
+    )
+    pv = info.get("pv") or []
+    return {
+        "score": str(score),
+        "depth": info.get("depth"),
+        "pv": [move.uci() for move in pv] if pv and pv[0] == result.move else [],
+    }
+
 
 if __name__ == "__main__":
     se = StockfishEngine()
@@ -0,0 +1,256 @@
+# flake8: noqa
+import os
+import threading
+import concurrent.futures
+from contextlib import contextmanager
+from typing import Callable, TypeVar
+import chess.engine
+from dotenv import load_dotenv
+from app.utils.error_handling import log_error, log_success, ChessGameError
+from app.Domains.Engine.resource_sizing import pin_process
+
+load_dotenv()
+
+# Seconds a search may run past its time limit before the engine counts as hung
+ENGINE_WATCHDOG_GRACE = float(os.getenv("ENGINE_WATCHDOG_GRACE", "5"))
+# Watchdog for searches bounded by depth or nodes instead of time
+ENGINE_WATCHDOG_TIMEOUT = float(os.getenv("ENGINE_WATCHDOG_TIMEOUT", "30"))
+ENGINE_RESTART_BACKOFF = float(os.getenv("ENGINE_RESTART_BACKOFF", "0.2"))
+ENGINE_RESTART_MAX_BACKOFF = float(os.getenv("ENGINE_RESTART_MAX_BACKOFF", "5"))
+# Seconds an idempotent call waits for the respawn before its one retry
+ENGINE_RETRY_WAIT = float(os.getenv("ENGINE_RETRY_WAIT", "2"))
+
+T = TypeVar("T")
+
+# Raised by a call on an engine that died or was killed by the watchdog
+ENGINE_FAILURES = (
+    chess.engine.EngineTerminatedError,
+    concurrent.futures.TimeoutError,
+    TimeoutError,
+)
+
+
+class EngineUnavailableError(ChessGameError):
+    pass
+
+
+class EngineSupervisor:
+    """Owns one Stockfish process: spawns it, kills it when a call overruns its
+    watchdog, and respawns it with exponential backoff after a crash. The
+    respawn runs in a background thread, calls made meanwhile fail fast with
+    EngineUnavailableError. Options set through configure() survive restarts.
+    Calls run one at a time: python-chess cancels the command in flight when
+    another one is sent to the same engine. Background calls (reviews, batch
+    evaluation) wait while a foreground one is queued."""
+
+    def __init__(
+        self,
+        command: str,
+        options: dict | None = None,
+        affinity: list[int] | None = None,
+    ):
+        self.command = command
+        self.options = dict(options or {})
+        self.affinity = affinity
+        self.engine: chess.engine.SimpleEngine | None = None
+        self._lock = threading.Lock()
+        self._turn = threading.Condition()  # one command at the engine
+        self._busy = False
+        self._foreground_waiting = 0
+        self._failures = 0  # consecutive, drives the backoff
+        self._closed = False
+        self._alive = threading.Event()  # set while self.engine is usable
+        self._stop = threading.Event()  # interrupts the respawn backoff on quit
+        self._respawner: threading.Thread | None = None
+        self.restarts = 0
+        self.crashes = 0
+        self.watchdog_kills = 0
+        self.retries = 0
+        self.last_failure: str | None = None
+        self.engine = self._spawn()
+        self._alive.set()
+
+    def _spawn(self) -> chess.engine.SimpleEngine:
+        engine = chess.engine.SimpleEngine.popen_uci(self.command)
+        try:
+            pin_process(engine.transport.get_pid(), self.affinity)
+            if self.options:
+                engine.configure(self.options)
+        except Exception:
+            engine.close()
+            raise
+        return engine
+
+    def configure(self, options: dict):
+        self.options.update(options)
+        self.call(lambda engine: engine.configure(options))
+
+    def _ensure_engine(self) -> chess.engine.SimpleEngine:
+        """The live engine, while a restart is pending this raises at once"""
+        with self._lock:
+            if self._closed:
+                raise EngineUnavailableError("Engine has been shut down")
+            if self.engine is None:
+                self._start_respawn()
+                raise EngineUnavailableError(
+                    f"Stockfish is restarting after {self.last_failure}"
+                )
+            return self.engine
+
+    def _start_respawn(self):
+        """Starts the background restart unless one is running. Call with the
+        lock held."""
+        if self._respawner is None or not self._respawner.is_alive():
+            self._respawner = threading.Thread(
+                target=self._respawn, name="stockfish-respawn", daemon=True
+            )
+            self._respawner.start()
+
+    def _respawn(self):
+        """Spawns a replacement engine, backing off exponentially between
+        failed attempts, until one starts or the supervisor is shut down"""
+        while True:
+            with self._lock:
+                if self._closed or self.engine is not None:
+                    return
+                delay = min(
+                    ENGINE_RESTART_BACKOFF * 2 ** (self._failures - 1),
+                    ENGINE_RESTART_MAX_BACKOFF,
+                )
+            if self._stop.wait(delay):
+                return
+            try:
+                engine = self._spawn()
+            except Exception as e:
+                with self._lock:
+                    self._failures += 1
+                    self.last_failure = f"spawn failed: {e}"
+                log_error(f"Could not restart Stockfish: {e}")
+                continue
+            with self._lock:
+                closed = self._closed
+                if not closed:
+                    self.engine = engine
+                    self.restarts += 1
+                    self._alive.set()
+            if closed:
+                engine.close()  # shut down while it was starting
+                return
+            log_success(
+                "Stockfish restarted after %s (restart #%s)",
+                self.last_failure,
+                self.restarts,
+            )
+            return
+
+    def _discard(self, engine: chess.engine.SimpleEngine, reason: str):
+        with self._lock:
+            if self.engine is not engine:
+                return  # another thread already replaced it
+            self.engine = None
+            self._alive.clear()
+            self._failures += 1
+            self.crashes += 1
+            self.last_failure = reason
+            self._start_respawn()
+        try:
+            engine.close()
+        except Exception:
+            pass
+
+    def _watchdog(self, engine: chess.engine.SimpleEngine):
+        self.watchdog_kills += 1
+        log_error("Stockfish call overran its watchdog, killing the engine")
+        try:
+            engine.close()  # pending calls fail with EngineTerminatedError
+        except Exception:
+            pass
+
+    @contextmanager
+    def _engine_turn(self, background: bool):
+        """Waits until no other call is at the engine, and for background
+        calls until no foreground call is queued either"""
+        with self._turn:
+            if not background:
+                self._foreground_waiting += 1
+            try:
+                while self._busy or (background and self._foreground_waiting):
+                    self._turn.wait()
+            finally:
+                if not background:
+                    self._foreground_waiting -= 1
+            self._busy = True
+        try:
+            yield
+        finally:
+            with self._turn:
+                self._busy = False
+                self._turn.notify_all()
+
+    @staticmethod
+    def watchdog_timeout(limit: chess.engine.Limit | None) -> float:
+        if limit is not None and limit.time is not None:
+            return limit.time + ENGINE_WATCHDOG_GRACE
+        if limit is not None and (limit.white_clock or limit.black_clock):
+            # the engine never spends more than the time left on its clock
+            clock = max(limit.white_clock or 0, limit.black_clock or 0)
+            return clock + ENGINE_WATCHDOG_GRACE
+        return ENGINE_WATCHDOG_TIMEOUT
+
+    def call(
+        self,
+        fn: Callable[[chess.engine.SimpleEngine], T],
+        limit: chess.engine.Limit | None = None,
+        retry: bool = False,
+        background: bool = False,
+    ) -> T:
+        """Runs fn against the live engine under a watchdog, once it is its
+        turn. When the engine dies or hangs it is replaced in the background,
+        and idempotent calls (retry=True) wait briefly for the fresh process to
+        run once more. Background calls give way to every foreground call."""
+        attempts = 2 if retry else 1
+        for attempt in range(attempts):
+            if attempt:
+                self._alive.wait(ENGINE_RETRY_WAIT)
+            with self._engine_turn(background):
+                engine = self._ensure_engine()
+                # started once it is our turn, queueing is not a hang
+                timer = threading.Timer(
+                    self.watchdog_timeout(limit), self._watchdog, args=(engine,)
+                )
+                timer.daemon = True
+                timer.start()
+                try:
+                    result = fn(engine)
+                    self._failures = 0
+                    return result
+                except ENGINE_FAILURES as e:
+                    reason = f"{type(e).__name__}: {e}"
+                    log_error(f"Stockfish call failed, engine discarded: {reason}")
+                    self._discard(engine, reason)
+                    if attempt + 1 == attempts:
+                        raise EngineUnavailableError(f"Stockfish call failed: {reason}")
+                    self.retries += 1
+                finally:
+                    timer.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "alive": self.engine is not None,
+            "restarting": self._respawner is not None and self._respawner.is_alive(),
+            "pid": self.engine.transport.get_pid() if self.engine else None,
+            "affinity": self.affinity,
+            "restarts": self.restarts,
+            "crashes": self.crashes,
+            "watchdog_kills": self.watchdog_kills,
+            "retries": self.retries,
+            "last_failure": self.last_failure,
+        }
+
+    def quit(self):
+        with self._lock:
+            self._closed = True
+            self._stop.set()
+            engine, self.engine = self.engine, None
+        if engine is not None:
+            engine.quit()
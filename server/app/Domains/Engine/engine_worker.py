@@ -0,0 +1,158 @@
+# flake8: noqa
+import os
+import json
+import time
+import socket
+import argparse
+import redis
+from app.utils.error_handling import log_success, log_error, log_debug
+from app.Domains.Engine.remote_engine import (
+    ENGINE_JOB_STREAM,
+    ENGINE_CONSUMER_GROUP,
+    ENGINE_RESULT_TTL,
+    JOB_MOVE,
+    JOB_ANALYSIS,
+    JOB_EVALUATE,
+    result_key,
+    board_from_job,
+    info_to_job,
+)
+
+# Jobs left unacknowledged this long by a dead worker are taken over
+RECLAIM_IDLE_MS = int(os.getenv("ENGINE_RECLAIM_IDLE_MS", "30000"))
+
+
+class EngineWorker:
+    """Consumes engine jobs from the Redis stream and replies per request id.
+    Run one worker process per core, each owns a single Stockfish process."""
+
+    def __init__(self, redis_client: redis.Redis, engine, consumer_name: str = None):
+        self.redis_client = redis_client
+        self.engine = engine
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self._running = False
+        self._ensure_group()
+
+    def _ensure_group(self):
+        try:
+            self.redis_client.xgroup_create(
+                ENGINE_JOB_STREAM, ENGINE_CONSUMER_GROUP, id="0", mkstream=True
+            )
+        except redis.ResponseError as re:
+            if "BUSYGROUP" not in str(re):
+                raise
+
+    def _handle(self, job: dict) -> dict:
+        if job.get("deadline") and time.time() > job["deadline"]:
+            # The caller already timed out, searching would only waste the engine
+            return {"ok": False, "error": "expired"}
+
+        if job["type"] == JOB_EVALUATE:
+            results = self.engine.evaluate_positions(
+                fens=job["fens"], depth=job["depth"]
+            )
+            return {"ok": True, "results": results}
+        board = board_from_job(job)
+        if job["type"] == JOB_MOVE:
+            result = self.engine.get_engine_move(
+                board=board, user_elo=job["user_elo"], clock=job.get("clock")
+            )
+            return {
+                "ok": True,
+                "move": result.move.uci(),
+                "info": info_to_job(result.info),
+            }
+        if job["type"] == JOB_ANALYSIS:
+            top_moves = self.engine.get_top_stockfish_moves(board=board)
+            return {"ok": True, "top_moves": top_moves}
+        return {"ok": False, "error": f"Unknown job type: {job['type']}"}
+
+    def _process(self, entry_id, fields: dict):
+        raw = fields.get(b"job", fields.get("job"))
+        request_id = None
+        try:
+            job = json.loads(raw)
+            request_id = job["request_id"]
+            reply = self._handle(job)
+        except Exception as e:
+            log_error(f"Engine job {entry_id} failed: {e}")
+            reply = {"ok": False, "error": str(e)}
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        if request_id is not None and reply.get("error") != "expired":
+            key = result_key(request_id)
+            pipe.rpush(key, json.dumps(reply))
+            pipe.expire(key, ENGINE_RESULT_TTL)
+        pipe.xack(ENGINE_JOB_STREAM, ENGINE_CONSUMER_GROUP, entry_id)
+        pipe.xdel(ENGINE_JOB_STREAM, entry_id)
+        pipe.execute()
+
+    def reclaim_stale_jobs(self) -> int:
+        """Takes over jobs a crashed worker read but never acknowledged"""
+        _, entries, *_ = self.redis_client.xautoclaim(
+            ENGINE_JOB_STREAM,
+            ENGINE_CONSUMER_GROUP,
+            self.consumer_name,
+            min_idle_time=RECLAIM_IDLE_MS,
+            start_id="0-0",
+            count=10,
+        )
+        for entry_id, fields in entries:
+            if fields:
+                self._process(entry_id, fields)
+        return len(entries)
+
+    def run_once(self, block_ms: int = 1000, count: int = 1) -> int:
+        """Reads and processes up to `count` new jobs, returns how many ran"""
+        response = self.redis_client.xreadgroup(
+            ENGINE_CONSUMER_GROUP,
+            self.consumer_name,
+            {ENGINE_JOB_STREAM: ">"},
+            count=count,
+            block=block_ms,
+        )
+        processed = 0
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                self._process(entry_id, fields)
+                processed += 1
+        return processed
+
+    def run_forever(self, reclaim_every: float = 30.0):
+        self._running = True
+        last_reclaim = 0.0
+        log_success(f"Engine worker {self.consumer_name} consuming {ENGINE_JOB_STREAM}")
+        while self._running:
+            try:
+                if time.monotonic() - last_reclaim > reclaim_every:
+                    self.reclaim_stale_jobs()
+                    last_reclaim = time.monotonic()
+                self.run_once()
+            except redis.RedisError as re:
+                log_error(f"Engine worker lost Redis connection: {re}")
+                time.sleep(1)
+
+    def stop(self):
+        self._running = False
+
+
+if __name__ == "__main__":
+    from app.services.redis.redis_setup import get_redis_client
+    from app.Domains.Engine.engine_manager import StockfishEngine
+
+    parser = argparse.ArgumentParser(description="Stockfish worker fed by Redis")
+    parser.add_argument("--name", default=None, help="Consumer name in the group")
+    args = parser.parse_args()
+
+    redis_client = get_redis_client()
+    if redis_client is None:
+        raise SystemExit("Engine worker needs a reachable Redis")
+
+    engine = StockfishEngine()
+    worker = EngineWorker(redis_client, engine, consumer_name=args.name)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        log_debug("Engine worker interrupted")
+    finally:
+        engine.quit_engine()
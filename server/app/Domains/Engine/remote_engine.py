@@ -0,0 +1,177 @@
+# flake8: noqa
+import os
+import json
+import time
+import uuid
+import chess
+import chess.engine
+import redis
+from chess.engine import PlayResult
+from dotenv import load_dotenv
+from app.utils.error_handling import log_error, log_debug, ChessGameError
+from app.utils.tracing import traced
+from app.utils.profiling import record_engine_wait
+from app.Domains.Engine.models import TopStockfishMoves
+
+load_dotenv()
+
+ENGINE_JOB_STREAM = os.getenv("ENGINE_JOB_STREAM", "engine:jobs")
+ENGINE_CONSUMER_GROUP = os.getenv("ENGINE_CONSUMER_GROUP", "engine-workers")
+ENGINE_RESULT_PREFIX = "engine:result:"
+# Seconds a caller waits for a worker before giving up
+ENGINE_JOB_TIMEOUT = float(os.getenv("ENGINE_JOB_TIMEOUT", "10"))
+# Jobs waiting in the stream before new ones are rejected
+ENGINE_MAX_QUEUED_JOBS = int(os.getenv("ENGINE_MAX_QUEUED_JOBS", "200"))
+ENGINE_RESULT_TTL = 60
+
+JOB_MOVE = "move"
+JOB_ANALYSIS = "analysis"
+JOB_EVALUATE = "evaluate"
+
+
+class RemoteEngineError(ChessGameError):
+    pass
+
+
+class EngineBusyError(RemoteEngineError):
+    """Raised when the job queue is full, callers should back off"""
+
+    pass
+
+
+class EngineTimeoutError(RemoteEngineError):
+    pass
+
+
+def result_key(request_id: str) -> str:
+    return ENGINE_RESULT_PREFIX + request_id
+
+
+def board_to_job(board: chess.Board) -> dict:
+    """Root position plus moves, so workers keep repetition history"""
+    root = board.root()
+    return {
+        "fen": root.fen(),
+        "moves": [move.uci() for move in board.move_stack],
+    }
+
+
+def board_from_job(job: dict) -> chess.Board:
+    board = chess.Board(job["fen"])
+    for uci in job["moves"]:
+        board.push_uci(uci)
+    return board
+
+
+def info_to_job(info: dict) -> dict:
+    """Score (white's point of view), depth and PV of a search as plain JSON"""
+    reply = {"depth": info.get("depth"), "pv": [m.uci() for m in info.get("pv", [])]}
+    if "score" in info:
+        white = info["score"].white()
+        reply.update(cp=white.score(), mate=white.mate())
+    return reply
+
+
+def info_from_job(data: dict) -> dict:
+    info = {"pv": [chess.Move.from_uci(uci) for uci in data.get("pv", [])]}
+    if data.get("depth") is not None:
+        info["depth"] = data["depth"]
+    if data.get("mate") is not None:
+        info["score"] = chess.engine.PovScore(
+            chess.engine.Mate(data["mate"]), chess.WHITE
+        )
+    elif data.get("cp") is not None:
+        info["score"] = chess.engine.PovScore(chess.engine.Cp(data["cp"]), chess.WHITE)
+    return info
+
+
+class RemoteEngineClient:
+    """Drop-in replacement for StockfishEngine that sends searches to engine
+    workers over a Redis stream and waits for the reply by request id."""
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        timeout: float = ENGINE_JOB_TIMEOUT,
+        max_queued_jobs: int = ENGINE_MAX_QUEUED_JOBS,
+    ):
+        self.redis_client = redis_client
+        self.timeout = timeout
+        self.max_queued_jobs = max_queued_jobs
+
+    def _submit(self, job: dict, timeout: float | None = None) -> dict:
+        timeout = timeout or self.timeout
+        try:
+            # Lag of the consumer group is the number of jobs not yet picked up
+            if self.queued_jobs() >= self.max_queued_jobs:
+                raise EngineBusyError("Engine queue is full, try again shortly")
+
+            request_id = str(uuid.uuid4())
+            job.update(request_id=request_id, deadline=time.time() + timeout)
+            self.redis_client.xadd(ENGINE_JOB_STREAM, {"job": json.dumps(job)})
+
+            with record_engine_wait():
+                reply = self.redis_client.blpop(
+                    [result_key(request_id)], timeout=timeout
+                )
+        except redis.RedisError as re:
+            log_error(f"Engine queue operation failed: {re}")
+            raise RemoteEngineError(f"Engine queue operation failed: {re}")
+
+        if reply is None:
+            raise EngineTimeoutError(
+                f"No engine reply for {job['type']} job within {timeout}s"
+            )
+        result = json.loads(reply[1])
+        if not result.get("ok"):
+            raise RemoteEngineError(f"Engine worker error: {result.get('error')}")
+        return result
+
+    def queued_jobs(self) -> int:
+        try:
+            groups = self.redis_client.xinfo_groups(ENGINE_JOB_STREAM)
+        except redis.ResponseError:
+            return 0  # stream does not exist yet
+        for group in groups:
+            name = group["name"]
+            if isinstance(name, bytes):
+                name = name.decode()
+            if name == ENGINE_CONSUMER_GROUP:
+                lag = group.get("lag")
+                if lag is not None:
+                    return int(lag)
+        return int(self.redis_client.xlen(ENGINE_JOB_STREAM))
+
+    @traced("engine.remote_play")
+    def get_engine_move(
+        self, board: chess.Board, user_elo: str | int, clock: dict | None = None
+    ) -> PlayResult:
+        """Get stockfish engine move for the current board and given elo strength"""
+        job = {"type": JOB_MOVE, "user_elo": str(user_elo), **board_to_job(board)}
+        timeout = None
+        if clock:
+            job["clock"] = clock
+            # a timed search may use up to the mover's remaining clock
+            side = "white_clock" if board.turn == chess.WHITE else "black_clock"
+            timeout = self.timeout + clock[side]
+        result = self._submit(job, timeout=timeout)
+        log_debug("Remote engine move %s", result["move"])
+        info = info_from_job(result.get("info", {}))
+        return PlayResult(chess.Move.from_uci(result["move"]), None, info)
+
+    @traced("engine.remote_analyse")
+    def get_top_stockfish_moves(self, board: chess.Board) -> list[TopStockfishMoves]:
+        job = {"type": JOB_ANALYSIS, **board_to_job(board)}
+        return self._submit(job)["top_moves"]
+
+    @traced("engine.remote_evaluate")
+    def evaluate_positions(self, fens: list[str], depth: int) -> list[dict]:
+        """Fixed depth evaluation of a batch of positions on one worker, see
+        StockfishEngine.evaluate_positions"""
+        job = {"type": JOB_EVALUATE, "fens": fens, "depth": depth}
+        # one reply for the whole batch, so the wait scales with its size
+        return self._submit(job, timeout=self.timeout * max(1, len(fens)))["results"]
+
+    def quit_engine(self):
+        """Workers own the engine processes, nothing to release here"""
+        pass
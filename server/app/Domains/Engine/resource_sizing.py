@@ -0,0 +1,171 @@
+# flake8: noqa
+import os
+import math
+from dataclasses import dataclass, asdict, field
+from dotenv import load_dotenv
+from app.utils.error_handling import log_success, log_debug
+
+load_dotenv()
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+# Share of the memory limit given to engine hash tables when no budget is set
+DEFAULT_BUDGET_SHARE = 0.25
+MIN_HASH_MB = 16
+MAX_HASH_MB = 32768
+
+
+def _env_int(name: str) -> int | None:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def detect_cpu_limit(cgroup_root: str = CGROUP_ROOT) -> float | None:
+    """CPUs allowed by the cgroup quota (v2 cpu.max or v1 cfs quota), None if
+    unlimited"""
+    cpu_max = _read(os.path.join(cgroup_root, "cpu.max"))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max":
+            return int(quota) / int(period or 100000)
+        return None
+    quota = _read(os.path.join(cgroup_root, "cpu", "cpu.cfs_quota_us"))
+    period = _read(os.path.join(cgroup_root, "cpu", "cpu.cfs_period_us"))
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def detect_memory_limit(cgroup_root: str = CGROUP_ROOT) -> int | None:
+    """Bytes allowed by the cgroup (v2 memory.max or v1 limit), falling back to
+    the host's total memory"""
+    for path in (
+        os.path.join(cgroup_root, "memory.max"),
+        os.path.join(cgroup_root, "memory", "memory.limit_in_bytes"),
+    ):
+        value = _read(path)
+        # v1 reports an unlimited group as a huge page-aligned number
+        if value and value != "max" and int(value) < 1 << 60:
+            return int(value)
+    meminfo = _read("/proc/meminfo")
+    for line in (meminfo or "").splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def available_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+@dataclass
+class EngineLayout:
+    """How many engine processes to run and how each is configured"""
+
+    pool_size: int
+    threads: int
+    hash_mb: int
+    cpus: float
+    memory_mb: int | None
+    budget_mb: int
+    # CPU ids each engine process is pinned to, empty when pinning is off
+    affinity: list[list[int]] = field(default_factory=list)
+
+    def options(self) -> dict:
+        return {"Threads": self.threads, "Hash": self.hash_mb}
+
+    def cpus_for(self, slot: int) -> list[int] | None:
+        if not self.affinity:
+            return None
+        return self.affinity[slot % len(self.affinity)]
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _round_hash(mb: float) -> int:
+    """Largest power of two not above mb, within Stockfish's useful range"""
+    mb = max(MIN_HASH_MB, min(MAX_HASH_MB, int(mb)))
+    return 1 << int(math.log2(mb))
+
+
+def plan_engine_layout(
+    engines: int | None = None, cgroup_root: str = CGROUP_ROOT
+) -> EngineLayout:
+    """Splits the CPUs and memory this container may use between engines.
+
+    `engines` fixes the number of processes (1 for the server's own engine),
+    otherwise ENGINE_POOL_SIZE or one single-threaded engine per CPU is
+    planned, which suits the batch pools. ENGINE_THREADS and ENGINE_HASH_MB
+    override the computed values, ENGINE_MEMORY_BUDGET_MB caps the hash memory and
+    ENGINE_RESERVED_CPUS keeps cores free for the web workers."""
+    cpu_ids = available_cpus()
+    quota = detect_cpu_limit(cgroup_root)
+    cpus = min(len(cpu_ids), quota) if quota else len(cpu_ids)
+    reserved = _env_int("ENGINE_RESERVED_CPUS") or 0
+    usable = max(1, math.floor(cpus) - reserved)
+
+    memory = detect_memory_limit(cgroup_root)
+    memory_mb = memory // (1 << 20) if memory else None
+    budget_mb = _env_int("ENGINE_MEMORY_BUDGET_MB") or (
+        int(memory_mb * DEFAULT_BUDGET_SHARE) if memory_mb else 128
+    )
+
+    pool_size = engines or _env_int("ENGINE_POOL_SIZE") or usable
+    threads = _env_int("ENGINE_THREADS") or max(1, usable // pool_size)
+    hash_mb = _env_int("ENGINE_HASH_MB") or _round_hash(budget_mb / pool_size)
+
+    affinity = []
+    if os.getenv("ENGINE_CPU_AFFINITY", "false").lower() == "true":
+        # consecutive CPUs per engine, wrapping when the pool oversubscribes
+        affinity = [
+            sorted(
+                {cpu_ids[(slot * threads + k) % len(cpu_ids)] for k in range(threads)}
+            )
+            for slot in range(pool_size)
+        ]
+
+    return EngineLayout(
+        pool_size=pool_size,
+        threads=threads,
+        hash_mb=hash_mb,
+        cpus=round(cpus, 2),
+        memory_mb=memory_mb,
+        budget_mb=budget_mb,
+        affinity=affinity,
+    )
+
+
+def pin_process(pid: int, cpus: list[int] | None):
+    """Restricts a process to the given CPUs where the platform allows it"""
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        os.sched_setaffinity(pid, cpus)
+        log_debug("Pinned engine %s to CPUs %s", pid, cpus)
+    except OSError as e:
+        log_debug("Could not pin engine %s: %s", pid, e)
+
+
+def log_layout(layout: EngineLayout, context: str):
+    log_success(
+        "%s engine layout: %s x Threads=%s Hash=%sMB (cpus=%s, memory=%sMB, "
+        "budget=%sMB, affinity=%s)",
+        context,
+        layout.pool_size,
+        layout.threads,
+        layout.hash_mb,
+        layout.cpus,
+        layout.memory_mb,
+        layout.budget_mb,
+        layout.affinity or "off",
+    )
@@ -0,0 +1,102 @@
+# flake8: noqa
+import os
+import random
+import threading
+from collections import OrderedDict
+import chess
+import chess.polyglot
+from chess.engine import InfoDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Candidate lines kept per position, Stockfish's skill handicap looks at four
+SKILL_MULTIPV = 4
+ENGINE_SEARCH_CACHE_SIZE = int(os.getenv("ENGINE_SEARCH_CACHE_SIZE", "4096"))
+# 1.0 reproduces Stockfish's spread of weaker moves, 0 always plays the best line
+ENGINE_SKILL_RANDOMNESS = float(os.getenv("ENGINE_SKILL_RANDOMNESS", "1.0"))
+# Fixed seed for reproducible move choices, unset for a random one
+ENGINE_SKILL_SEED = os.getenv("ENGINE_SKILL_SEED")
+
+# Stockfish internal units, a pawn is 208 and UCI centipawns are scaled to 100
+PAWN_VALUE = 208
+MATE_VALUE = 32000
+
+
+class SearchCache:
+    """Per-process LRU of MultiPV search results keyed by Zobrist hash, shared
+    by every game and Elo level that reaches the same position."""
+
+    def __init__(self, max_size: int = ENGINE_SEARCH_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict[int, list[InfoDict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, board: chess.Board) -> list[InfoDict] | None:
+        key = chess.polyglot.zobrist_hash(board)
+        with self._lock:
+            infos = self._entries.get(key)
+            if infos is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return infos
+
+    def put(self, board: chess.Board, infos: list[InfoDict]):
+        if self.max_size <= 0:
+            return
+        key = chess.polyglot.zobrist_hash(board)
+        with self._lock:
+            self._entries[key] = infos
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _internal_value(info: InfoDict) -> int:
+    """Score for the side to move in Stockfish's internal units"""
+    cp = info["score"].relative.score(mate_score=MATE_VALUE * 100 // PAWN_VALUE)
+    return cp * PAWN_VALUE // 100
+
+
+def pick_skill_move(
+    infos: list[InfoDict],
+    skill: int,
+    rng: random.Random,
+    randomness: float = ENGINE_SKILL_RANDOMNESS,
+) -> InfoDict:
+    """Chooses among the candidate lines the way Stockfish's Skill::pick_best
+    does: every line gets a push that grows with how far it trails the best
+    one plus a random share of the spread, and the highest total is played.
+    Returns the InfoDict of the chosen line."""
+    lines = [info for info in infos if info.get("pv") and "score" in info]
+    if not lines:
+        raise ValueError("No candidate lines to choose from")
+    lines.sort(key=_internal_value, reverse=True)
+    lines = lines[:SKILL_MULTIPV]
+    if skill >= 20 or len(lines) == 1:
+        return lines[0]
+
+    values = [_internal_value(info) for info in lines]
+    top = values[0]
+    delta = min(top - values[-1], PAWN_VALUE)
+    weakness = 120 - 2 * skill
+
+    best, max_score = lines[0], None
+    for info, value in zip(lines, values):
+        noise = delta * rng.randrange(int(weakness)) * randomness
+        push = int((weakness * (top - value) + noise) / 128)
+        if max_score is None or value + push >= max_score:
+            max_score = value + push
+            best = info
+    return best
+
+
+def new_skill_rng() -> random.Random:
+    return random.Random(int(ENGINE_SKILL_SEED) if ENGINE_SKILL_SEED else None)
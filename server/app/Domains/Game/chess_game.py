@@ -1,5 +1,7 @@
 # flake8: noqa
 import os
+import time
+from array import array
 from datetime import datetime
 import asyncio
 import chess
@@ -9,12 +11,19 @@ from stockfish import Stockfish, StockfishException
 import random
 from fastapi import Request
 from app.services.redis.redis_services import (
-    redis_delete_game_by_id,
-    redis_get_game_data_by_id,
+    redis_end_game_by_id,
+    RedisGameNotFoundError,
 )
-from app.Domains.Engine.engine_manager import EngineError, StockfishEngine
+from app.Domains.Engine.engine_manager import (
+    EngineError,
+    StockfishEngine,
+    format_engine_eval,
+)
+from app.Domains.Engine.remote_engine import RemoteEngineError
+from app.Domains.Engine.engine_supervisor import EngineUnavailableError
 from app.Domains.Engine.models import TopStockfishMoves
 from app.utils.error_handling import log_error, log_success, ChessGameError, log_debug
+from app.utils.tracing import traced
 from app.Domains.Game.models import EngineMoveResult
 from chess import InvalidMoveError, Move
 from typing import List
@@ -23,51 +32,204 @@ import redis
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.services.mongodb.mongo_services import (
     mongo_get_stale_game_ids,
-    mongo_update_game_by_game_id,
+    mongo_finish_game,
 )
+from app.Domains.Game.game_stats import ABANDONED
 
 load_dotenv()
 
+# A FEN is recorded every this many plies so any position is a short replay away
+GAME_CHECKPOINT_PLIES = int(os.getenv("GAME_CHECKPOINT_PLIES", "16"))
+# Longest chain of conditional premoves a game may queue
+PREMOVE_MAX_DEPTH = int(os.getenv("PREMOVE_MAX_DEPTH", "10"))
+# Condition matching whatever the engine plays
+ANY_ENGINE_MOVE = "*"
+
 
 class ChessServiceError(ChessGameError):
     pass
 
 
+class ClockFlagError(ChessServiceError):
+    """The side to move ran out of time"""
+
+    def __init__(self, color: str):
+        super().__init__(f"{color} lost on time")
+        self.color = color
+
+
+def parse_time_control(spec: str) -> tuple[float, float]:
+    """'5+3' (minutes + increment in seconds) -> (300.0, 3.0)"""
+    try:
+        minutes, _, increment = spec.partition("+")
+        base, increment = float(minutes) * 60, float(increment or 0)
+    except ValueError:
+        raise ChessServiceError(
+            f"Invalid time control {spec!r}, expected minutes+increment"
+        )
+    if base <= 0 or increment < 0:
+        raise ChessServiceError(f"Invalid time control {spec!r}")
+    return base, increment
+
+
+def encode_move(move: chess.Move) -> int:
+    """Packs a move into 15 bits: from square, to square, promotion piece"""
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(code: int) -> chess.Move:
+    return chess.Move(code & 0x3F, (code >> 6) & 0x3F, (code >> 12) or None)
+
+
 class ChessGame:
-    """Handles the game state and Stockfish engine."""
+    """Handles the game state and Stockfish engine.
 
-    def __init__(self, game_id: str, elo_level: str | int):
-        try:
+    The move history is kept once, packed into an array of 16-bit codes, with
+    a FEN checkpoint every GAME_CHECKPOINT_PLIES plies. The chess.Board used
+    for play is replayed from the starting position on first access, so it
+    keeps the full history repetition claims need, and can be dropped again
+    with compact() while the game sits idle in a cache. Checkpoints only serve
+    positions that need no history: the FEN of a compacted game and goto_ply."""
+
+    __slots__ = (
+        "game_id",
+        "elo_level",
+        "_moves",
+        "_checkpoints",
+        "_board",
+        "_premoves",
+        "_clock",
+        "start_fen",
+    )
 
-            self.board = chess.Board()
-            self.move_stack = (
-                []
-            )  # Required to recreate board move by move for the undo functionality
+    def __init__(
+        self, game_id: str, elo_level: str | int, start_fen: str | None = None
+    ):
+        try:
+            # None for the standard starting position
+            self.start_fen = start_fen
+            self._board: chess.Board | None = self._initial_board()
+            # Required to recreate board move by move for the undo functionality
+            self._moves = array("H")
+            # _checkpoints[i] is the FEN after (i + 1) * GAME_CHECKPOINT_PLIES plies
+            self._checkpoints: List[str] = []
+            # Queued {engine move (UCI): reply (UCI)} steps, None when empty
+            self._premoves: List[dict] | None = None
+            # Remaining seconds per side for timed games, None without a clock
+            self._clock: dict | None = None
             self.elo_level = elo_level
             self.game_id = game_id
-            log_success(f"Chess Game instances created for game ID: {game_id} ")
+            log_debug(
+                "Chess Game instance created for game ID: %s",
+                game_id,
+                msg_type="game.instance",
+            )
 
         except Exception as e:
             log_error(f"Failed to initialize chess game: {str(e)}")
             raise ChessServiceError(f"Chess game initialization failed: {str(e)}")
 
+    @property
+    def board(self) -> chess.Board:
+        if self._board is None:
+            self._board = self._replay()
+        return self._board
+
+    @property
+    def user_color(self) -> str:
+        """The user moves first: white, or the side to move of a training
+        position"""
+        return "white" if self._initial_board().turn == chess.WHITE else "black"
+
+    def winner_color(self) -> str:
+        """Color that won the finished position, "none" for draws"""
+        outcome = self.board.outcome()
+        if outcome is None or outcome.winner is None:
+            return "none"
+        return "white" if outcome.winner == chess.WHITE else "black"
+
+    @property
+    def move_stack(self) -> List[chess.Move]:
+        return [decode_move(code) for code in self._moves]
+
+    @property
+    def ply_count(self) -> int:
+        return len(self._moves)
+
+    def moves_since(self, ply: int) -> List[str]:
+        """UCI moves played after the first `ply` plies"""
+        return [decode_move(code).uci() for code in self._moves[ply:]]
+
+    def _initial_board(self) -> chess.Board:
+        return chess.Board(self.start_fen) if self.start_fen else chess.Board()
+
+    def compact(self):
+        """Drops the materialized board, keeping only the packed history"""
+        self._board = None
+
+    def _push(self, move: chess.Move):
+        self.board.push(move)
+        self._moves.append(encode_move(move))
+        if len(self._moves) % GAME_CHECKPOINT_PLIES == 0:
+            self._checkpoints.append(self._board.fen())
+
+    def _replay(self) -> chess.Board:
+        """The board after every move, replayed from the starting position"""
+        return self._board_at(len(self._moves), board=self._initial_board())
+
+    def _board_at(self, ply: int, board: chess.Board | None = None) -> chess.Board:
+        """Position after `ply` plies, seeking from the closest checkpoint
+        unless a starting `board` is given, and recording any checkpoints that
+        are missing on the way. A board from a checkpoint has no history before
+        it, so it is only used to look at the position."""
+        index = 0
+        if board is None:
+            index = min(ply // GAME_CHECKPOINT_PLIES, len(self._checkpoints))
+            board = (
+                chess.Board(self._checkpoints[index - 1])
+                if index
+                else self._initial_board()
+            )
+        for played in range(index * GAME_CHECKPOINT_PLIES, ply):
+            board.push(decode_move(self._moves[played]))
+            if (played + 1) % GAME_CHECKPOINT_PLIES == 0 and (
+                played + 1
+            ) // GAME_CHECKPOINT_PLIES > len(self._checkpoints):
+                self._checkpoints.append(board.fen())
+        return board
+
     def to_dict(self):
         """Converts game object to serializable Dictionary"""
         return {
             "game_id": self.game_id,
             "fen": self.get_fen(),
             "elo_level": self.elo_level,
-            "move_stack": self.move_stack,
+            "start_fen": self.start_fen,
+            "moves": self._moves.tobytes(),
+            "checkpoints": self._checkpoints,
+            "premoves": self._premoves,
+            "clock": self._clock,
         }
 
     @classmethod
+    @traced("game.from_dict")
     def from_dict(cls, data):
         try:
             game = cls(
                 data["game_id"],
                 elo_level=data["elo_level"],
+                start_fen=data.get("start_fen"),
             )
-            game.set_board_from_fen(data["fen"], data["move_stack"])
+            if "moves" in data:
+                game._moves.frombytes(data["moves"])
+                # missing checkpoints are filled in when the board is rebuilt
+                game._checkpoints = list(data.get("checkpoints", []))
+                game._premoves = data.get("premoves")
+                game._clock = data.get("clock")
+                game._board = None  # replayed lazily on first use
+            else:
+                # records written before moves were packed
+                game.set_board_from_fen(data["fen"], data["move_stack"])
             return game
         except Exception as e:
             log_error(f"Error Creating Game from dictionary  data: {str(e)}")
@@ -75,15 +237,37 @@ class ChessGame:
                 f"Error Creating Game from dictionary data:{str(e)}"
             )
 
+    @classmethod
+    @traced("game.from_move_log")
+    def from_move_log(
+        cls,
+        game_id: str,
+        elo_level: str | int,
+        moves: List[str],
+        start_fen: str | None = None,
+    ):
+        """Replays a UCI move log, as kept in Mongo, into a new game"""
+        game = cls(game_id, elo_level=elo_level, start_fen=start_fen)
+        try:
+            for uci in moves:
+                move = chess.Move.from_uci(uci)
+                if not game.board.is_legal(move):
+                    raise ValueError(f"illegal move {uci} at ply {game.ply_count}")
+                game._push(move)
+        except ValueError as e:
+            log_error(f"Corrupt move log for game {game_id}: {e}")
+            raise ChessServiceError(f"Cannot rebuild game {game_id}: {e}")
+        return game
+
     def set_board_from_fen(self, fen: str, move_stack: List[chess.Move]):
         try:
             for move in move_stack:
-                self.board.push(move)
-            self.move_stack = move_stack
+                self._push(move)
         except Exception as e:
-            log_error("Error updating board state:{e}")
+            log_error("Error updating board state: %s", e)
             raise ChessServiceError(f"Error Updating board state:{e}")
 
+    @traced("game.make_user_move")
     def make_user_move(self, move: str):
         """Applies the user's move (in SAN notation)."""
         try:
@@ -92,31 +276,44 @@ class ChessGame:
 
             # Check if the move is legal
             if chess_move in self.board.legal_moves:
+                self._press_clock()
                 # Push the move to the board
-                self.board.push(chess_move)
-                self.move_stack.append(chess_move)
+                self._push(chess_move)
             else:
                 raise ValueError("Illegal move by User")
+        except ClockFlagError:
+            raise
         except Exception as e:
             log_error(f"Error playing user move: {e}")
             raise ChessServiceError(f"Error playing user move: {e}")
 
+    @traced("game.get_engine_move")
     async def get_engine_move(self, engine: StockfishEngine) -> EngineMoveResult:
-        """Gets Stockfish's best move and applies it."""
+        """Gets Stockfish's best move and applies it, along with the evaluation
+        of the search that chose it."""
         # Check if game is over after user move
         if self.board.is_game_over():
-            return None, None, None
+            return None, None, None, None
         try:
-            result = engine.get_engine_move(board=self.board, user_elo=self.elo_level)
+            # Searches and remote job replies block, keep them off the event loop
+            result = await asyncio.to_thread(
+                engine.get_engine_move,
+                board=self.board,
+                user_elo=self.elo_level,
+                clock=self.engine_clock(),
+            )
             engine_move = result.move.uci()
             # Make move in board
             move = chess.Move.from_uci(engine_move)  # this move is a Move object
             move_san = self.board.san(move)
-            self.board.push(move)
-            self.move_stack.append(move)
+            self._press_clock()
+            self._push(move)
             # also return san move
             is_game_over = self.board.is_game_over()
-            return engine_move, move_san, is_game_over
+            return engine_move, move_san, is_game_over, format_engine_eval(result)
+        except (RemoteEngineError, EngineUnavailableError, ClockFlagError):
+            # Busy / timeout errors are surfaced as is so callers can back off
+            raise
         except InvalidMoveError as e:
             log_error(f"Invalid Move , UCI String invalid: {e}")
             raise ChessServiceError(f"Invalid Move , UCI String invalid: {e}")
@@ -129,6 +326,131 @@ class ChessGame:
             log_error(f"Engine Error: {e}")
             raise ChessServiceError(f"Engine Error: {e}")
 
+    def start_clock(
+        self,
+        base: float,
+        increment: float,
+        white: float | None = None,
+        black: float | None = None,
+    ):
+        """Puts the game under a time control. Remaining times default to the
+        base, and the clock of the side to move runs from now."""
+        self._clock = {
+            "base": base,
+            "increment": increment,
+            "white": base if white is None else white,
+            "black": base if black is None else black,
+            "turn_started": time.time(),
+        }
+
+    @property
+    def clock(self) -> dict | None:
+        """Seconds left per side, with the running clock counted down to now"""
+        if self._clock is None:
+            return None
+        remaining = {"white": self._clock["white"], "black": self._clock["black"]}
+        running = "white" if self.board.turn == chess.WHITE else "black"
+        elapsed = time.time() - self._clock["turn_started"]
+        remaining[running] = max(0.0, remaining[running] - elapsed)
+        return {
+            "white": round(remaining["white"], 1),
+            "black": round(remaining["black"], 1),
+            "increment": self._clock["increment"],
+        }
+
+    def engine_clock(self) -> dict | None:
+        """The clock as passed to the engine's search limit"""
+        clock = self.clock
+        if clock is None:
+            return None
+        return {
+            "white_clock": clock["white"],
+            "black_clock": clock["black"],
+            "white_inc": clock["increment"],
+            "black_inc": clock["increment"],
+        }
+
+    def _press_clock(self):
+        """Charges the side to move for the time since its turn began and adds
+        the increment. Raises ClockFlagError when that time ran out."""
+        if self._clock is None:
+            return
+        color = "white" if self.board.turn == chess.WHITE else "black"
+        now = time.time()
+        remaining = self._clock[color] - (now - self._clock["turn_started"])
+        self._clock["turn_started"] = now
+        if remaining <= 0:
+            self._clock[color] = 0.0
+            raise ClockFlagError(color)
+        self._clock[color] = remaining + self._clock["increment"]
+
+    @property
+    def premoves(self) -> List[dict]:
+        return list(self._premoves or [])
+
+    def set_premoves(self, premoves: List[dict]):
+        """Replaces the premove queue. Each step maps an engine reply in UCI (or
+        "*" for any reply) to the user's answer in UCI. Legality is checked
+        when a step is applied, the position is not known before that."""
+        if len(premoves) > PREMOVE_MAX_DEPTH:
+            raise ChessServiceError(
+                f"At most {PREMOVE_MAX_DEPTH} premoves can be queued"
+            )
+        try:
+            for step in premoves:
+                for condition, reply in step.items():
+                    if condition != ANY_ENGINE_MOVE:
+                        chess.Move.from_uci(condition)
+                    chess.Move.from_uci(reply)
+        except (InvalidMoveError, ValueError) as e:
+            raise ChessServiceError(f"Invalid premove: {e}")
+        self._premoves = [dict(step) for step in premoves] or None
+
+    def next_premove(self, engine_move: str) -> chess.Move | None:
+        """Pops the queued answer to the engine's move. A reply the queue did
+        not foresee, or an answer that is illegal, discards the whole queue."""
+        if not self._premoves:
+            return None
+        step = self._premoves.pop(0)
+        reply = step.get(engine_move, step.get(ANY_ENGINE_MOVE))
+        move = chess.Move.from_uci(reply) if reply else None
+        if move is None or move not in self.board.legal_moves:
+            log_debug("Premove line broken after %s, queue cleared", engine_move)
+            self._premoves = None
+            return None
+        if not self._premoves:
+            self._premoves = None
+        return move
+
+    @traced("game.apply_premoves")
+    async def apply_premoves(
+        self, engine: StockfishEngine, engine_move: str | None
+    ) -> List[dict]:
+        """Plays queued premoves against the engine's replies until the line
+        runs out, breaks or the game ends. Returns one entry per move pair."""
+        played = []
+        while engine_move and not self.board.is_game_over():
+            move = self.next_premove(engine_move)
+            if move is None:
+                break
+            user_san = self.board.san(move)
+            self._press_clock()
+            self._push(move)
+            engine_move, move_san, is_game_over, evaluation = (
+                await self.get_engine_move(engine)
+            )
+            played.append(
+                {
+                    "user_move": user_san,
+                    "stockfish_move": engine_move,
+                    "stockfish_san": move_san,
+                    "is_game_over": is_game_over,
+                    "evaluation": evaluation,
+                }
+            )
+        return played
+
+    @traced("game.get_top_stockfish_moves")
     async def get_top_stockfish_moves(
         self, engine: StockfishEngine
     ) -> TopStockfishMoves:
@@ -136,20 +458,44 @@ class ChessGame:
         try:
             if self.is_game_over():
                 return []
-            top_moves = engine.get_top_stockfish_moves(board=self.board)
+            top_moves = await asyncio.to_thread(
+                engine.get_top_stockfish_moves, board=self.board
+            )
             return top_moves
+        except (RemoteEngineError, EngineUnavailableError):
+            raise
         except Exception as e:
             log_error(f"Error while fetching top moves:{e}")
             raise ChessServiceError(f"Error while fetching top moves:{e}")
 
+    @traced("game.goto_ply")
+    def goto_ply(self, ply: int) -> str:
+        """Rewinds the game to the position after `ply` plies, discarding the
+        moves played after it. Returns the FEN of that position."""
+        current = len(self._moves)
+        if not 0 <= ply <= current:
+            raise ChessServiceError(f"Ply {ply} is outside the game (0-{current})")
+
+        if self._board is not None:
+            for _ in range(current - ply):
+                self._board.pop()
+            fen = self._board.fen()
+        else:
+            # the play board is replayed when it is next needed
+            fen = self._board_at(ply).fen()
+        del self._moves[ply:]
+        del self._checkpoints[ply // GAME_CHECKPOINT_PLIES :]
+        self._premoves = None  # queued for a line that no longer exists
+        return fen
+
+    @traced("game.undo_move")
     def undo_move(self):
         """Undo the last move."""
         try:
-            self.board.pop()  # Engine move undone
-            self.board.pop()  # User move undone
-            self.move_stack.pop()
-            self.move_stack.pop()
-            return self.board.fen()
+            if len(self._moves) < 2:
+                raise IndexError("pop from empty move stack")
+            # Engine move and user move undone
+            return self.goto_ply(len(self._moves) - 2)
         except IndexError as i:
             log_error(f"Index error while takeback , move Stack empty:{i}")
             raise ChessServiceError(
@@ -158,7 +504,10 @@ class ChessGame:
 
     def get_fen(self):
         """Returns the board state in FEN notation."""
-        return self.board.fen()
+        if self._board is None:
+            # a compacted game seeks from its last checkpoint without replaying
+            return self._board_at(len(self._moves)).fen()
+        return self._board.fen()
 
     def is_game_over(self):
         """Checks if the game is over."""
@@ -167,42 +516,58 @@ class ChessGame:
     def quit_game(self):
         """Resets the board"""
         # reset board state
-        self.board = chess.Board()
+        self._board = self._initial_board()
+        self._moves = array("H")
+        self._checkpoints = []
+        self._premoves = None
+        self._clock = None
 
 
 # Dependency Injection to provide a game instance
-def create_and_get_new_chess_game(game_id: str, elo_level: str | int) -> ChessGame:
-    return ChessGame(game_id=game_id, elo_level=elo_level)
+def create_and_get_new_chess_game(
+    game_id: str, elo_level: str | int, start_fen: str | None = None
+) -> ChessGame:
+    if start_fen is not None:
+        try:
+            board = chess.Board(start_fen)
+        except ValueError as e:
+            raise ChessServiceError(f"Invalid FEN {start_fen}: {e}")
+        if not board.is_valid() or board.is_game_over():
+            raise ChessServiceError(f"Cannot start a game from {start_fen}")
+    return ChessGame(game_id=game_id, elo_level=elo_level, start_fen=start_fen)
 
 
-async def close_stale_games(
-    app, mongo_client: AsyncIOMotorClient, redis_client: redis.Redis
-):
+async def close_stale_games(app):
+    """Ends games idle for too long, every half hour. The clients are read from
+    app.state on each pass, they may connect after startup or not at all."""
     while True:
+        mongo_client: AsyncIOMotorClient | None = app.state.mongo_client
+        redis_client: redis.Redis | None = app.state.redis_client
         try:
+            if mongo_client is None or redis_client is None:
+                raise ChessServiceError("Redis or Mongo is not connected")
             log_debug("Running Stale Game Removal Service....")
             stale_game_ids: List[str] = await mongo_get_stale_game_ids(
                 mongo_client=mongo_client
             )
             for game_id in stale_game_ids:
-                game: ChessGame = ChessGame.from_dict(
-                    redis_get_game_data_by_id(
-                        game_id=game_id, redis_client=redis_client
-                    ),
-                )
-
-                # Free the engine instance
-                game.quit_game()
-                # delte from redis
-                redis_delete_game_by_id(game_id=game_id, redis_client=redis_client)
+                try:
+                    # Read and delete from redis in one round-trip
+                    game: ChessGame = ChessGame.from_dict(
+                        redis_end_game_by_id(
+                            game_id=game_id, redis_client=redis_client
+                        ),
+                    )
+                    # Free the engine instance
+                    game.quit_game()
+                except RedisGameNotFoundError:
+                    # Already expired from Redis, only Mongo needs closing
+                    pass
                 # Mark game as over in mongo
-                result = await mongo_update_game_by_game_id(
+                await mongo_finish_game(
                     game_id=game_id,
                     mongo_client=mongo_client,
-                    update_data={
-                        "is_over": True,
-                        "modified_at": datetime.now(),
-                    },
+                    outcome=ABANDONED,
                 )
                 log_success(
                     f"Removed stale game engine instance for game_id: {game_id}"
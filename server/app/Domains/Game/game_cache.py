@@ -0,0 +1,217 @@
+import os
+import threading
+from collections import OrderedDict
+import redis
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.Domains.Game.chess_game import (
+    ChessGame,
+    create_and_get_new_chess_game,
+    parse_time_control,
+)
+from app.services.redis.redis_services import (
+    redis_create_new_game_id,
+    redis_set_game_by_id,
+    redis_get_game_record_if_changed,
+    redis_commit_game_by_id,
+    redis_restore_game_by_id,
+    RedisGameNotFoundError,
+)
+from app.services.mongodb.mongo_services import (
+    mongo_create_game,
+    mongo_get_game_by_game_id,
+)
+from app.services.mongodb.models.mongo_models import Game
+from app.utils.error_handling import log_success
+from app.utils.tracing import traced
+
+load_dotenv()
+
+HOT_GAME_CACHE_SIZE = int(os.getenv("HOT_GAME_CACHE_SIZE", "1024"))
+# Cached games that keep their replayed board. Beyond this many the least
+# recently used ones are compacted to their packed move history.
+HOT_GAME_BOARDS = int(os.getenv("HOT_GAME_BOARDS", "256"))
+
+
+class HotGameCache:
+    """Bounded LRU of live ChessGame objects for this worker process.
+
+    Entries are checked out while a request uses them, so two concurrent
+    requests never share a mutable game, and are only checked back in with
+    the version Redis acknowledged. Only the `max_boards` most recently used
+    keep their board, the rest are compacted so a large cache stays small."""
+
+    def __init__(
+        self,
+        max_size: int = HOT_GAME_CACHE_SIZE,
+        max_boards: int = HOT_GAME_BOARDS,
+    ):
+        self.max_size = max_size
+        self.max_boards = max_boards
+        self._games: OrderedDict[str, tuple[ChessGame, int]] = OrderedDict()
+        # ids of cached games holding a board, least recently used first
+        self._boards: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def checkout(self, game_id: str) -> tuple[ChessGame, int] | None:
+        with self._lock:
+            self._boards.pop(game_id, None)
+            return self._games.pop(game_id, None)
+
+    def checkin(self, game_id: str, game: ChessGame, version: int):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._games[game_id] = (game, version)
+            self._games.move_to_end(game_id)
+            self._boards[game_id] = None
+            self._boards.move_to_end(game_id)
+            while len(self._games) > self.max_size:
+                evicted, _ = self._games.popitem(last=False)
+                self._boards.pop(evicted, None)
+            while len(self._boards) > max(self.max_boards, 0):
+                compacted, _ = self._boards.popitem(last=False)
+                self._games[compacted][0].compact()
+
+    def evict(self, game_id: str):
+        with self._lock:
+            self._boards.pop(game_id, None)
+            self._games.pop(game_id, None)
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+
+hot_games = HotGameCache()
+
+
+@traced("game.load")
+def load_game(game_id: str, redis_client: redis.Redis) -> tuple[ChessGame, int]:
+    """Returns the game and its version, reusing the cached object when Redis
+    still holds the same version. Hand it back with release_game or
+    commit_game, otherwise it simply drops out of the cache."""
+    cached = hot_games.checkout(game_id)
+    known_version = cached[1] if cached else 0
+    data, version = redis_get_game_record_if_changed(
+        game_id=game_id, redis_client=redis_client, known_version=known_version
+    )
+    if data is None:
+        hot_games.hits += 1
+        return cached[0], version
+    hot_games.misses += 1
+    return ChessGame.from_dict(data), version
+
+
+@traced("game.restore")
+async def restore_game(
+    game_id: str, redis_client: redis.Redis, mongo_client: AsyncIOMotorClient
+) -> tuple[ChessGame, int]:
+    """Rebuilds a game Redis no longer holds from its Mongo record and move
+    log. Finished or unknown games stay not found. Queued premoves are not
+    kept in Mongo and are lost."""
+    doc = await mongo_get_game_by_game_id(game_id=game_id, mongo_client=mongo_client)
+    if doc is None or doc.get("is_over"):
+        raise RedisGameNotFoundError(f"Game not found: {game_id}")
+    game = ChessGame.from_move_log(
+        game_id=game_id,
+        elo_level=doc["user_elo"],
+        moves=doc.get("moves", []),
+        start_fen=doc.get("start_fen"),
+    )
+    if doc.get("time_control"):
+        # clocks resume from the last move Mongo saw
+        clock = doc.get("clock") or {}
+        game.start_clock(
+            *parse_time_control(doc["time_control"]),
+            white=clock.get("white"),
+            black=clock.get("black"),
+        )
+    version, restored = redis_restore_game_by_id(
+        game_id=game_id, redis_client=redis_client, data=game.to_dict()
+    )
+    if not restored:
+        # another request restored it first and may already have moved on
+        return load_game(game_id=game_id, redis_client=redis_client)
+    log_success(
+        "Restored game %s from Mongo (%s plies)",
+        game_id,
+        game.ply_count,
+        msg_type="game.restore",
+    )
+    return game, version
+
+
+async def load_or_restore_game(
+    game_id: str,
+    redis_client: redis.Redis,
+    mongo_client: AsyncIOMotorClient | None,
+) -> tuple[ChessGame, int]:
+    """load_game that falls back to Mongo when the game was evicted or
+    expired from Redis"""
+    try:
+        return load_game(game_id=game_id, redis_client=redis_client)
+    except RedisGameNotFoundError:
+        if mongo_client is None:
+            raise
+    return await restore_game(
+        game_id=game_id, redis_client=redis_client, mongo_client=mongo_client
+    )
+
+
+async def create_game(
+    redis_client: redis.Redis,
+    mongo_client: AsyncIOMotorClient,
+    user_elo: str | int,
+    time_control: str | None = None,
+    start_fen: str | None = None,
+) -> ChessGame:
+    """Starts a game in Redis, caches it and records it in Mongo"""
+    game_id = redis_create_new_game_id(redis_client=redis_client)
+    game = create_and_get_new_chess_game(
+        game_id=game_id, elo_level=user_elo, start_fen=start_fen
+    )
+    if time_control is not None:
+        game.start_clock(*parse_time_control(time_control))
+    version = redis_set_game_by_id(
+        game_id=game_id, redis_client=redis_client, data=game.to_dict()
+    )
+    release_game(game=game, version=version)
+    await mongo_create_game(
+        mongo_client=mongo_client,
+        data=Game(
+            game_id=game_id,
+            user_elo=user_elo,
+            fen=game.get_fen(),
+            start_fen=start_fen,
+            time_control=time_control,
+            clock=game.clock,
+        ),
+    )
+    return game
+
+
+def release_game(game: ChessGame, version: int):
+    """Returns an unmodified game to the cache"""
+    hot_games.checkin(game.game_id, game, version)
+
+
+def commit_game(game: ChessGame, version: int, redis_client: redis.Redis) -> int:
+    """Writes the game with compare-and-set and caches it at the new version"""
+    new_version = redis_commit_game_by_id(
+        game_id=game.game_id,
+        redis_client=redis_client,
+        expected_version=version,
+        data=game.to_dict(),
+    )
+    hot_games.checkin(game.game_id, game, new_version)
+    return new_version
+
+
+def finish_game(game_id: str, version: int, redis_client: redis.Redis):
+    """Deletes a finished game with compare-and-set and forgets it locally"""
+    hot_games.evict(game_id)
+    redis_commit_game_by_id(
+        game_id=game_id, redis_client=redis_client, expected_version=version
+    )
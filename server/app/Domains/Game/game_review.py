@@ -0,0 +1,218 @@
+# flake8: noqa
+import os
+import math
+import time
+import asyncio
+import chess
+import redis
+from dotenv import load_dotenv
+from app.services.redis.redis_services import (
+    redis_claim_review,
+    redis_set_review,
+)
+from app.utils.error_handling import log_error, log_success, ChessGameError
+
+load_dotenv()
+
+REVIEW_DEPTH = int(os.getenv("REVIEW_DEPTH", "14"))
+# Positions per engine request, smaller chunks report progress more often
+REVIEW_CHUNK_SIZE = int(os.getenv("REVIEW_CHUNK_SIZE", "8"))
+# Chunks of one review searched at once. Reviews share the server's engine at
+# background priority, a player's move is searched before the next position.
+# Raise this when ENGINE_MODE=remote spreads them over several engine workers.
+REVIEW_PARALLEL_CHUNKS = max(1, int(os.getenv("REVIEW_PARALLEL_CHUNKS", "1")))
+# A running review older than this is considered dead and may be restarted
+REVIEW_JOB_TIMEOUT = int(os.getenv("REVIEW_JOB_TIMEOUT", "600"))
+
+# Scores are capped like mate-free evaluations so one blunder into mate does
+# not dominate the averages
+MAX_CP = 1000
+MATE_CP = 10000
+# Drop in winning chances (on a -1..1 scale) for each label
+CLASSIFICATION = [(0.3, "blunder"), (0.2, "mistake"), (0.1, "inaccuracy")]
+
+
+class GameReviewError(ChessGameError):
+    pass
+
+
+# Keeps running jobs referenced until they finish
+_running_jobs: set[asyncio.Task] = set()
+
+
+def _white_cp(result: dict, board: chess.Board) -> int:
+    """Evaluation of a position from white's view in centipawns"""
+    if board.is_checkmate():
+        return -MATE_CP if board.turn == chess.WHITE else MATE_CP
+    if board.is_game_over():
+        return 0
+    if result.get("score") is not None:
+        return int(result["score"])
+    mate = result.get("mate") or 0
+    return MATE_CP if mate > 0 else -MATE_CP
+
+
+def winning_chances(cp: int) -> float:
+    """-1..1, the same logistic curve lichess uses"""
+    return 2 / (1 + math.exp(-0.00368208 * cp)) - 1
+
+
+def move_accuracy(win_before: float, win_after: float) -> float:
+    """0..100 from the drop in win percentage caused by a move"""
+    drop = max(0.0, win_before - win_after)
+    return max(0.0, min(100.0, 103.1668 * math.exp(-0.04354 * drop) - 3.1669))
+
+
+def build_review(moves: list[str], boards: list[chess.Board], evals: list[dict]):
+    """Turns one evaluation per position into per-move results. The search of
+    position i gives the best move there and, seen from the other side, the
+    value of the move that led to it, so each position is searched once."""
+    white_cp = [_white_cp(evals[i], boards[i]) for i in range(len(boards))]
+    per_move = []
+    accuracies = {"white": [], "black": []}
+    for ply, uci in enumerate(moves):
+        mover = "white" if boards[ply].turn == chess.WHITE else "black"
+        sign = 1 if mover == "white" else -1
+        before = max(-MAX_CP, min(MAX_CP, sign * white_cp[ply]))
+        after = max(-MAX_CP, min(MAX_CP, sign * white_cp[ply + 1]))
+        best_moves = evals[ply].get("moves") or []
+        best = best_moves[0] if best_moves else None
+        if uci == best:
+            # the two searches differ by a ply of depth, not by move quality
+            after = before
+
+        loss = max(0, before - after)
+        chance_drop = winning_chances(before) - winning_chances(after)
+        label = "best" if uci == best else "good"
+        if uci != best:
+            for threshold, name in CLASSIFICATION:
+                if chance_drop >= threshold:
+                    label = name
+                    break
+
+        accuracy = move_accuracy(
+            50 + 50 * winning_chances(before), 50 + 50 * winning_chances(after)
+        )
+        accuracies[mover].append(accuracy)
+        per_move.append(
+            {
+                "ply": ply + 1,
+                "move": uci,
+                "san": boards[ply].san(chess.Move.from_uci(uci)),
+                "color": mover,
+                "eval": white_cp[ply + 1] / 100,
+                "best_move": best,
+                "cp_loss": loss,
+                "classification": label,
+                "accuracy": round(accuracy, 1),
+            }
+        )
+
+    summary = {}
+    for color, values in accuracies.items():
+        side_moves = [m for m in per_move if m["color"] == color]
+        summary[color] = {
+            "accuracy": round(sum(values) / len(values), 1) if values else None,
+            "average_cp_loss": (
+                round(sum(m["cp_loss"] for m in side_moves) / len(side_moves))
+                if side_moves
+                else None
+            ),
+            **{
+                name: sum(1 for m in side_moves if m["classification"] == name)
+                for _, name in CLASSIFICATION
+            },
+        }
+    return {"moves": per_move, "summary": summary}
+
+
+async def _run_review(
+    game_id: str,
+    moves: list[str],
+    redis_client: redis.Redis,
+    engine,
+    start_fen: str | None = None,
+):
+    started = time.time()
+    try:
+        board = chess.Board(start_fen) if start_fen else chess.Board()
+        boards = [board.copy(stack=False)]
+        for uci in moves:
+            board.push_uci(uci)
+            boards.append(board.copy(stack=False))
+        fens = [b.fen() for b in boards]
+
+        # The local engine or the engine workers, whichever serves games
+        slots = asyncio.Semaphore(REVIEW_PARALLEL_CHUNKS)
+
+        async def evaluate_chunk(start: int) -> tuple[int, list[dict]]:
+            async with slots:
+                return start, await asyncio.to_thread(
+                    engine.evaluate_positions,
+                    fens=fens[start : start + REVIEW_CHUNK_SIZE],
+                    depth=REVIEW_DEPTH,
+                )
+
+        futures = [
+            evaluate_chunk(start) for start in range(0, len(fens), REVIEW_CHUNK_SIZE)
+        ]
+
+        evals: list[dict | None] = [None] * len(fens)
+        done = 0
+        for future in asyncio.as_completed(futures):
+            start, results = await future
+            for offset, result in enumerate(results):
+                if result["error"] is not None:
+                    raise GameReviewError(result["error"])
+                evals[start + offset] = result
+            done += len(results)
+            redis_set_review(
+                game_id,
+                redis_client,
+                {"status": "running", "progress": done / len(fens), "started": started},
+                ttl=REVIEW_JOB_TIMEOUT,
+            )
+
+        review = build_review(moves, boards, evals)
+        redis_set_review(
+            game_id,
+            redis_client,
+            {"status": "done", "progress": 1.0, "depth": REVIEW_DEPTH, **review},
+        )
+        log_success(
+            "Reviewed game %s: %s positions in %.1fs",
+            game_id,
+            len(fens),
+            time.time() - started,
+        )
+    except Exception as e:
+        log_error(f"Game review failed for {game_id}: {e}")
+        # Failed reviews expire quickly so they can be requested again
+        redis_set_review(
+            game_id, redis_client, {"status": "failed", "error": str(e)}, ttl=60
+        )
+
+
+def start_game_review(
+    game_id: str,
+    moves: list[str],
+    redis_client: redis.Redis,
+    engine,
+    start_fen: str | None = None,
+) -> bool:
+    """Queues a background review on `engine` (a StockfishEngine or
+    RemoteEngineClient) unless one exists for the game already"""
+    claimed = redis_claim_review(
+        game_id,
+        redis_client,
+        {"status": "queued", "progress": 0.0},
+        ttl=REVIEW_JOB_TIMEOUT,
+    )
+    if not claimed:
+        return False
+    task = asyncio.create_task(
+        _run_review(game_id, moves, redis_client, engine, start_fen)
+    )
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return True
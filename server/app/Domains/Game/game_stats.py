@@ -0,0 +1,81 @@
+# flake8: noqa
+"""Game statistics served from rollup documents.
+
+Each finished game adds itself to three rollups with `$inc` upserts when it
+ends: the overall totals, its engine Elo and the day it ended. Reading stats is
+then a handful of document lookups however many games there are. The rollups
+can be rebuilt from the games collection with one aggregation:
+
+    python -m app.Domains.Game.game_stats --backfill
+"""
+
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+USER_WIN = "user_win"
+ENGINE_WIN = "engine_win"
+DRAW = "draw"
+# Ended by the user or the stale sweep before a result
+ABANDONED = "abandoned"
+WINNERS = {USER_WIN: "User", ENGINE_WIN: "Computer", DRAW: "Draw"}
+# Longest per-day history /stats/ returns
+MAX_STATS_DAYS = 366
+
+
+def game_outcome(win_color: str, user_color: str) -> str:
+    """Result of a finished game from the user's side"""
+    if win_color == "none":
+        return DRAW
+    return USER_WIN if win_color == user_color else ENGINE_WIN
+
+
+def stats_day(when: datetime) -> str:
+    return when.strftime("%Y-%m-%d")
+
+
+def recent_days(days: int, today: datetime | None = None) -> list[str]:
+    """Day keys of the last `days` days, oldest first"""
+    today = today or datetime.now()
+    return [stats_day(today - timedelta(days=i)) for i in reversed(range(days))]
+
+
+def summarize(rollup: dict | None) -> dict:
+    """Counters of one rollup with the derived rates and averages"""
+    rollup = rollup or {}
+    games = rollup.get("games", 0)
+    summary = {
+        "games": games,
+        "user_wins": rollup.get("user_wins", 0),
+        "engine_wins": rollup.get("engine_wins", 0),
+        "draws": rollup.get("draws", 0),
+        "abandoned": rollup.get("abandoned", 0),
+    }
+    summary["win_rate"] = round(summary["user_wins"] / games, 4) if games else None
+    summary["avg_plies"] = round(rollup.get("plies", 0) / games, 1) if games else None
+    summary["avg_seconds"] = (
+        round(rollup.get("seconds", 0) / games, 1) if games else None
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    from app.services.mongodb.mongo_setup import get_mongo_client
+    from app.services.mongodb.mongo_services import mongo_rebuild_game_stats
+
+    parser = argparse.ArgumentParser(description="Game statistics rollups")
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="rebuild every rollup from the finished games",
+    )
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.print_help()
+        raise SystemExit(0)
+
+    async def backfill():
+        mongo_client = await get_mongo_client()
+        print(await mongo_rebuild_game_stats(mongo_client=mongo_client))
+
+    asyncio.run(backfill())
@@ -0,0 +1,66 @@
+# flake8: noqa
+import random
+import argparse
+import tracemalloc
+import chess
+from app.Domains.Game.chess_game import ChessGame
+
+
+class LegacyGame:
+    """Previous layout: a full Board plus a parallel list of Move objects"""
+
+    def __init__(self, moves: list[chess.Move]):
+        self.game_id = "legacy"
+        self.elo_level = "1500"
+        self.board = chess.Board()
+        self.move_stack = []
+        for move in moves:
+            self.board.push(move)
+            self.move_stack.append(move)
+
+
+def random_game(plies: int, seed: int) -> list[chess.Move]:
+    rng = random.Random(seed)
+    board = chess.Board()
+    moves = []
+    while len(moves) < plies and not board.is_game_over():
+        move = rng.choice(list(board.legal_moves))
+        board.push(move)
+        moves.append(move)
+    return moves
+
+
+def build_game(moves: list[chess.Move], layout: str):
+    if layout == "legacy":
+        return LegacyGame(moves)
+    game = ChessGame("bench", elo_level="1500")
+    for move in moves:
+        game._push(move)
+    if layout == "compact":
+        game.compact()
+    return game
+
+
+def bytes_per_game(plies: int, layout: str, games: int) -> float:
+    histories = [random_game(plies, seed) for seed in range(games)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    live = [build_game(moves, layout) for moves in histories]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del live
+    return allocated / games
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory held per active game")
+    parser.add_argument("--games", type=int, default=500)
+    parser.add_argument("--plies", type=int, nargs="+", default=[20, 80, 200])
+    args = parser.parse_args()
+
+    layouts = ("legacy", "materialized", "compact")
+    print(f"{'plies':>6}" + "".join(f"{name:>14}" for name in layouts))
+    for plies in args.plies:
+        row = [bytes_per_game(plies, layout, args.games) for layout in layouts]
+        print(f"{plies:>6}" + "".join(f"{value:>14,.0f}" for value in row))
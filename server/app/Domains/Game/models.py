@@ -3,9 +3,16 @@ from pydantic import BaseModel
 
 class MoveInput(BaseModel):
     move: str  # User move in UCI notation (e.g., "e2e4")
+    # Conditional replies, e.g. [{"e7e5": "g1f3", "*": "d2d4"}], see ChessGame
+    premoves: list[dict[str, str]] | None = None
+
+
+class PremovesInput(BaseModel):
+    premoves: list[dict[str, str]]  # an empty list clears the queue
 
 
 class EngineMoveResult(BaseModel):
     engine_move: str | None
     move_san: str | None
     is_game_over: bool | None
+    evaluation: dict | None = None
@@ -0,0 +1,64 @@
+# flake8: noqa
+import chess
+import chess.pgn
+from typing import AsyncIterator
+from app.utils.error_handling import log_error
+from app.Domains.Game.game_stats import DRAW
+
+RESULTS = {"white": "1-0", "black": "0-1"}
+DRAW_RESULT = "1/2-1/2"
+
+
+def pgn_result(doc: dict) -> str:
+    """Result tag of a game. Draws store win_color "none" like abandoned and
+    unfinished games, so they are told apart by their recorded outcome."""
+    if doc.get("outcome") == DRAW:
+        return DRAW_RESULT
+    return RESULTS.get(doc.get("win_color"), "*")
+
+
+def game_to_pgn(doc: dict) -> str:
+    """Renders a Mongo game document and its move log as one PGN game"""
+    pgn = chess.pgn.Game()
+    if doc.get("start_fen"):
+        # training games start from a position instead of the initial setup
+        pgn.setup(doc["start_fen"])
+    pgn.headers["Event"] = "Chess with Beth"
+    pgn.headers["Site"] = "chess-with-beth"
+    created_at = doc.get("created_at")
+    if created_at is not None:
+        pgn.headers["Date"] = created_at.strftime("%Y.%m.%d")
+    # The user moves first: white from the initial setup, either side from a
+    # training position
+    user = doc.get("user_id") or "User"
+    engine = f"Stockfish {doc.get('user_elo', '')}".strip()
+    if pgn.board().turn == chess.WHITE:
+        pgn.headers["White"], pgn.headers["Black"] = user, engine
+    else:
+        pgn.headers["White"], pgn.headers["Black"] = engine, user
+    # Abandoned and unfinished games have no result
+    pgn.headers["Result"] = pgn_result(doc)
+    pgn.headers["GameId"] = doc["game_id"]
+
+    node = pgn
+    try:
+        for uci in doc.get("moves", []):
+            node = node.add_variation(chess.Move.from_uci(uci))
+    except (ValueError, AssertionError) as e:
+        # Keep what was readable rather than failing a whole export
+        log_error(f"Corrupt move log for game {doc['game_id']}: {e}")
+        pgn.headers["Annotator"] = "move log truncated"
+    if "outcome" not in doc and doc.get("is_over"):
+        # finished before outcomes were recorded, a draw shows on the board
+        final = node.board().outcome()
+        if final is not None and final.winner is None:
+            pgn.headers["Result"] = DRAW_RESULT
+
+    exporter = chess.pgn.StringExporter(headers=True, variations=False)
+    return pgn.accept(exporter) + "\n\n"
+
+
+async def stream_pgn(games: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """PGN text one game at a time, so exports run in constant memory"""
+    async for doc in games:
+        yield game_to_pgn(doc)
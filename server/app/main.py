@@ -1,70 +1,129 @@
+import time
 import asyncio
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers.chess import chess_router
+from app.routers.admin import admin_router
+from app.routers.training import training_router
 from app.services.redis.redis_setup import get_redis_client
 from contextlib import asynccontextmanager
 from app.utils.error_handling import log_success, log_error
 from app.Domains.Engine.engine_manager import StockfishEngine
+from app.Domains.Engine.remote_engine import RemoteEngineClient
 from app.services.mongodb.mongo_setup import get_mongo_client
 import os
 from dotenv import load_dotenv
 from app.Domains.Game.chess_game import close_stale_games
+from app.utils.tracing import setup_tracing, shutdown_tracing, trace_requests
+from app.utils.profiling import profile_requests
 
 load_dotenv()
+setup_tracing()
+
+# "local" spawns Stockfish in this process, "remote" sends jobs to engine workers
+ENGINE_MODE = os.getenv("ENGINE_MODE", "local").lower()
 # app = FastAPI()
 
 
+# Seconds startup waits for each of Redis, Mongo and the engine. One that is
+# late keeps connecting in the background and /readyz reports it until then.
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", "10"))
+# app.state attribute of each subsystem
+SUBSYSTEMS = ("redis_client", "mongo_client", "stockfish_engine")
+
+
+async def start_redis():
+    redis_client = await asyncio.to_thread(get_redis_client)
+    if redis_client is None:
+        raise ConnectionError("Redis is not reachable")
+    return redis_client
+
+
+async def start_mongo():
+    mongo_client = await get_mongo_client()
+    await mongo_client.admin.command("ping")
+    return mongo_client
+
+
+async def start_engine(redis_task: asyncio.Task):
+    if ENGINE_MODE == "remote":
+        # jobs go through Redis, so the client waits for it
+        return RemoteEngineClient(redis_client=await redis_task)
+    return await asyncio.to_thread(StockfishEngine)
+
+
+def install_subsystem(app: FastAPI, name: str, task: asyncio.Task, started: float):
+    """Puts a finished startup task's result in app.state and records it"""
+    status = {"ready": False, "seconds": round(time.perf_counter() - started, 3)}
+    if task.cancelled():
+        status["error"] = "cancelled"
+    elif task.exception() is not None:
+        status["error"] = str(task.exception())
+        log_error(f"{name} failed to start: {task.exception()}")
+    else:
+        setattr(app.state, name, task.result())
+        status["ready"] = True
+        log_success("%s ready in %.2fs", name, status["seconds"])
+    app.state.startup[name] = status
+
+
+async def start_subsystems(app: FastAPI, timeout: float = STARTUP_TIMEOUT):
+    """Connects Redis and Mongo and starts the engine concurrently, waiting at
+    most `timeout` for them together"""
+    started = time.perf_counter()
+    redis_task = asyncio.create_task(start_redis())
+    tasks = {
+        "redis_client": redis_task,
+        "mongo_client": asyncio.create_task(start_mongo()),
+        "stockfish_engine": asyncio.create_task(start_engine(redis_task)),
+    }
+    app.state.startup = {name: {"ready": False} for name in tasks}
+    app.state.startup_tasks = tasks
+    for name, task in tasks.items():
+        task.add_done_callback(
+            lambda task, name=name: install_subsystem(app, name, task, started)
+        )
+    await asyncio.wait(tasks.values(), timeout=timeout)
+    for name, task in tasks.items():
+        if not task.done():
+            log_error(f"{name} not ready after {timeout}s, still starting")
+    log_success("Startup finished in %.2fs", time.perf_counter() - started)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting up...")
+    for name in SUBSYSTEMS:
+        setattr(app.state, name, None)
+    await start_subsystems(app)
 
-    # Initialize Redis client as centralized state
-    app.state.redis_client = get_redis_client()
-    redis_client = app.state.redis_client
-    try:
-        pong = redis_client.ping()
-        if pong:
-            log_success("Redis connected.")
-    except Exception as e:
-        log_error(f"Error connecting to Redis: {e}")
-
-    # Engine
-    app.state.stockfish_engine = StockfishEngine()
-    log_success("Stockfish Engine initialized.")
-
-    # Mongo client
-    try:
-        app.state.mongo_client = await get_mongo_client()
-        mongo_client = app.state.mongo_client
-        if mongo_client is not None:
-            mongo_client.admin.command("ping")
-        log_success("Mongo Client connected. Ping Successfull.")
-    except Exception as e:
-        log_error(f"Error while connecting to mongo client:{e}")
-
-    # Service to remove stale games :
-    app.state.stale_tasl = asyncio.create_task(
-        close_stale_games(
-            app,
-            mongo_client=mongo_client,
-            redis_client=app.state.redis_client,
-        )
-    )
+    # Service to remove stale games, it picks up late clients from app.state
+    app.state.stale_task = asyncio.create_task(close_stale_games(app))
 
     yield
 
-    app.state.redis_client.close()
-    app.state.mongo_client.close()
-    app.state.stockfish_engine.quit_engine()
-    log_success("Redis Client Service disconnected.")
-    log_success("Mongo Client Service closed")
-    log_success("Stockfish Engine Service closed")
+    app.state.stale_task.cancel()
+    for task in app.state.startup_tasks.values():
+        task.cancel()
+    if app.state.redis_client is not None:
+        app.state.redis_client.close()
+        log_success("Redis Client Service disconnected.")
+    if app.state.mongo_client is not None:
+        app.state.mongo_client.close()
+        log_success("Mongo Client Service closed")
+    if app.state.stockfish_engine is not None:
+        app.state.stockfish_engine.quit_engine()
+        log_success("Stockfish Engine Service closed")
+    shutdown_tracing()
 
 
 app = FastAPI(lifespan=lifespan)
 
 
+app.middleware("http")(profile_requests)
+app.middleware("http")(trace_requests)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[os.getenv("VITE_URL")],  # Frontend URL
@@ -74,4 +133,30 @@ app.add_middleware(
 )
 
 app.include_router(chess_router, prefix="/api")
+app.include_router(admin_router, prefix="/api/admin")
+app.include_router(training_router, prefix="/api/training")
 app.current_game = None
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop answers"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz(request: Request):
+    """Readiness: Redis, Mongo and the engine are all available"""
+    state = request.app.state
+    subsystems = {
+        name: {
+            **getattr(state, "startup", {}).get(name, {}),
+            "ready": getattr(state, name, None) is not None,
+        }
+        for name in SUBSYSTEMS
+    }
+    ready = all(status["ready"] for status in subsystems.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "starting", "subsystems": subsystems},
+        status_code=200 if ready else 503,
+    )
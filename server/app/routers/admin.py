@@ -0,0 +1,97 @@
+# flake8: noqa
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import FileResponse
+from app.utils.error_handling import log_error
+from app.utils.profiling import (
+    list_captures,
+    get_capture_path,
+    is_admin_token,
+    ProfilerError,
+)
+from app.utils.rate_limiting import (
+    RateLimit,
+    RateLimitError,
+    effective_limits,
+    invalidate_limits,
+    validate_limit_name,
+)
+from app.services.redis.redis_services import (
+    redis_set_rate_limit_overrides,
+    redis_delete_rate_limit_override,
+    RedisServiceError,
+)
+
+admin_router = APIRouter()
+
+
+def require_admin(x_admin_token: str | None = Header(default=None)):
+    """Rejects requests without the configured admin token"""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@admin_router.get("/profiles", dependencies=[Depends(require_admin)])
+async def get_profiles():
+    """Lists stored profile captures, newest first."""
+    return {"captures": list_captures()}
+
+
+@admin_router.get(
+    "/profiles/{endpoint}/{capture_id}", dependencies=[Depends(require_admin)]
+)
+async def download_profile(endpoint: str, capture_id: str, fmt: str = "speedscope"):
+    """Downloads a capture as speedscope JSON or a pyinstrument HTML flamegraph."""
+    try:
+        path = get_capture_path(endpoint=endpoint, capture_id=capture_id, fmt=fmt)
+    except ProfilerError as p:
+        log_error(f"Error while fetching profile capture: {p}")
+        raise HTTPException(status_code=404, detail=str(p))
+
+    media_type = "application/json" if fmt == "speedscope" else "text/html"
+    return FileResponse(path, media_type=media_type, filename=path.split("/")[-1])
+
+
+@admin_router.get("/engine", dependencies=[Depends(require_admin)])
+async def get_engine_stats(request: Request):
+    """Engine supervisor counters: restarts, crashes, watchdog kills, retries."""
+    engine = request.app.state.stockfish_engine
+    if not hasattr(engine, "engine_stats"):
+        return {"mode": "remote", "engine": None}
+    return {"mode": "local", "engine": engine.engine_stats()}
+
+
+@admin_router.get("/rate_limits", dependencies=[Depends(require_admin)])
+async def get_rate_limits(request: Request):
+    """Limits in force, as burst/seconds per scope and subject."""
+    limits = effective_limits(request.app.state.redis_client)
+    return {name: str(limit) for name, limit in sorted(limits.items())}
+
+
+@admin_router.put("/rate_limits", dependencies=[Depends(require_admin)])
+async def set_rate_limits(limits: dict[str, str], request: Request):
+    """Overrides limits for every worker, e.g. {"analysis.client": "20/60"}.
+    Workers pick the change up within RATE_LIMIT_CONFIG_TTL seconds."""
+    try:
+        for name, spec in limits.items():
+            validate_limit_name(name)
+            limits[name] = str(RateLimit.parse(spec))
+        redis_set_rate_limit_overrides(request.app.state.redis_client, limits)
+    except RateLimitError as r:
+        raise HTTPException(status_code=400, detail=str(r))
+    except RedisServiceError as re:
+        raise HTTPException(status_code=500, detail=str(re))
+    invalidate_limits()
+    return await get_rate_limits(request)
+
+
+@admin_router.delete("/rate_limits/{name}", dependencies=[Depends(require_admin)])
+async def reset_rate_limit(name: str, request: Request):
+    """Drops a runtime override, restoring the configured default."""
+    try:
+        removed = redis_delete_rate_limit_override(request.app.state.redis_client, name)
+    except RedisServiceError as re:
+        raise HTTPException(status_code=500, detail=str(re))
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"No override for {name}")
+    invalidate_limits()
+    return await get_rate_limits(request)
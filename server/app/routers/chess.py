@@ -1,45 +1,143 @@
 # flake8: noqa
 from typing import List
 from fastapi import APIRouter, Request, Depends, HTTPException
-from app.Domains.Game.models import MoveInput
+from fastapi.responses import StreamingResponse
+from app.Domains.Game.models import MoveInput, PremovesInput
 from app.Domains.Game.chess_game import (
     ChessGame,
-    create_and_get_new_chess_game,
     ChessServiceError,
+    ClockFlagError,
 )
 from app.utils.DIFY.voice_to_move_llm import voice_to_move, DifyServiceError
 from app.services.redis.redis_setup import (
     get_redis_client,
 )
 from app.services.redis.redis_services import (
-    redis_get_game_data_by_id,
-    redis_create_new_game_id,
-    redis_set_game_by_id,
+    redis_end_game_by_id,
     RedisServiceError,
+    RedisConflictError,
+    RedisGameNotFoundError,
     redis_delete_game_by_id,
+    redis_get_cached_analysis,
+    redis_set_cached_analysis,
+    redis_get_review,
+)
+from app.Domains.Game.game_cache import (
+    load_game,
+    load_or_restore_game,
+    create_game,
+    release_game,
+    commit_game,
+    finish_game,
+    hot_games,
 )
 from app.Domains.Engine.engine_manager import StockfishEngine
+from app.Domains.Engine.engine_supervisor import EngineUnavailableError
+from app.Domains.Engine.remote_engine import (
+    EngineBusyError,
+    EngineTimeoutError,
+    RemoteEngineError,
+)
 
 from app.utils.error_handling import log_error, log_success, ChessGameError, log_debug
 from app.utils.DIFY.ai_analysis_llm import run_ai_analysis
+from app.utils.tracing import traced
+from app.utils.rate_limiting import rate_limited
 from app.services.mongodb.mongo_services import (
-    mongo_create_game,
     mongo_delete_game_by_game_id,
-    mongo_update_game_by_game_id,
+    mongo_record_moves,
+    mongo_finish_game,
+    mongo_get_game_stats,
+    mongo_iter_games,
+    mongo_get_game_by_game_id,
     MongoServiceError,
 )
+from app.Domains.Game.pgn_export import stream_pgn
+from app.Domains.Game.game_review import start_game_review
+from app.Domains.Game.game_stats import (
+    ABANDONED,
+    WINNERS,
+    MAX_STATS_DAYS,
+    game_outcome,
+    recent_days,
+    summarize,
+)
 from datetime import datetime
-from app.services.mongodb.models.mongo_models import Game
 
 chess_router = APIRouter()
 
 
-@chess_router.post("/start_game/")
+def engine_http_error(
+    error: RemoteEngineError | EngineUnavailableError,
+) -> HTTPException:
+    """Maps engine failures to 503 (busy or restarting) / 504 (timeout) / 502"""
+    log_error(f"Engine error: {error}")
+    if isinstance(error, (EngineBusyError, EngineUnavailableError)):
+        return HTTPException(
+            status_code=503, detail=str(error), headers={"Retry-After": "1"}
+        )
+    if isinstance(error, EngineTimeoutError):
+        return HTTPException(status_code=504, detail=str(error))
+    return HTTPException(status_code=502, detail=str(error))
+
+
+async def get_cached_top_moves(
+    game: ChessGame, engine: StockfishEngine, redis_client
+) -> List:
+    """Top moves from the shared analysis cache, analysing on a miss"""
+    fen = game.get_fen()
+    top_moves = redis_get_cached_analysis(fen=fen, redis_client=redis_client)
+    if top_moves is None:
+        top_moves = await game.get_top_stockfish_moves(engine=engine)
+        if top_moves:
+            redis_set_cached_analysis(
+                fen=fen, redis_client=redis_client, top_moves=top_moves
+            )
+    return top_moves
+
+
+async def finish_on_time(
+    game: ChessGame,
+    version: int,
+    flag: ClockFlagError,
+    start_ply: int,
+    redis_client,
+    mongo_client,
+) -> dict:
+    """Ends a game whose side to move ran out of time, keeping the moves
+    played before the flag fell"""
+    win_color = "black" if flag.color == "white" else "white"
+    outcome = game_outcome(win_color, game.user_color)
+    fen, clock = game.get_fen(), game.clock
+    new_moves = game.moves_since(start_ply)
+    game.quit_game()
+    finish_game(game_id=game.game_id, version=version, redis_client=redis_client)
+    await mongo_finish_game(
+        game_id=game.game_id,
+        mongo_client=mongo_client,
+        outcome=outcome,
+        moves=new_moves,
+        update_data={"fen": fen, "win_color": win_color, "clock": clock},
+    )
+    return {
+        "message": f"Game Over, {flag.color} lost on time",
+        "board_fen": fen,
+        "game_id": game.game_id,
+        "is_game_over": True,
+        "winner": WINNERS[outcome],
+        "clock": clock,
+    }
+
+
+@chess_router.post("/start_game/", dependencies=[Depends(rate_limited("move"))])
+@traced("router.start_game")
 async def start_new_game(
     request: Request,
     user_elo: int | str,
+    time_control: str | None = None,
 ):
-    """Start a new chess game."""
+    """Start a new chess game. `time_control` as minutes+increment, e.g. 5+3,
+    puts both sides on a clock; without it the engine thinks a fixed time."""
 
     redis_client = request.app.state.redis_client
     mongo_client = request.app.state.mongo_client
@@ -57,28 +155,24 @@ async def start_new_game(
         raise HTTPException(status_code=500, detail="Stockfish Connection Failed")
     # Create a new redis state and get the unique game id
     try:
-        game_id = redis_create_new_game_id(redis_client=redis_client)
-        # now we create a new ChessGame instance
-        game: ChessGame = create_and_get_new_chess_game(
-            game_id=game_id, elo_level=user_elo
-        )
-        # now we insert this in redis
-        redis_set_game_by_id(
-            game_id=game_id, redis_client=redis_client, data=game.to_dict()
+        # stored in redis and recorded in mongo
+        game = await create_game(
+            redis_client=redis_client,
+            mongo_client=mongo_client,
+            user_elo=user_elo,
+            time_control=time_control,
         )
-        # game.reset()
-
-        # Add game in mongo
-        game_data = Game(game_id=game_id, user_elo=user_elo, fen=game.get_fen())
-        result = await mongo_create_game(mongo_client=mongo_client, data=game_data)
 
         return {
             "message": "New game started",
             "board_fen": game.get_fen(),
-            "game_id": game_id,
+            "game_id": game.game_id,
             "StockFish_Elo": user_elo,
+            "clock": game.clock,
         }
 
+    except ChessServiceError as c:
+        raise HTTPException(status_code=400, detail=str(c))
     except RedisServiceError as e:
         log_error(f"Redis operation failed:{str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -90,7 +184,8 @@ async def start_new_game(
         )
 
 
-@chess_router.post("/play_move/")
+@chess_router.post("/play_move/", dependencies=[Depends(rate_limited("move"))])
+@traced("router.play_move")
 async def play_user_move(
     move_input: MoveInput,
     request: Request,
@@ -114,33 +209,67 @@ async def play_user_move(
             log_error(f"Stockfish Engine not Initialized")
             raise HTTPException(status_code=500, detail="Stockfish Connection Failed")
 
-        game_data = redis_get_game_data_by_id(
-            game_id=game_id, redis_client=redis_client
+        # cached game object when this worker holds the current version
+        game, version = await load_or_restore_game(
+            game_id=game_id,
+            redis_client=redis_client,
+            mongo_client=mongo_client,
         )
-        # reconstruct game instance using the game_data
-        game = ChessGame.from_dict(game_data)
-        # make move
-        game.make_user_move(move_input.move)
+        start_ply = game.ply_count
+        try:
+            # make move
+            game.make_user_move(move_input.move)
+            if move_input.premoves is not None:
+                game.set_premoves(move_input.premoves)
+
+            # evaluation comes from the same search that picked the engine move
+            stockfish_move, stockfish_move_san, is_game_over, evaluation = (
+                await game.get_engine_move(engine=stockfish_engine)
+            )
 
-        stockfish_move, stockfish_move_san, is_game_over = await game.get_engine_move(
-            engine=stockfish_engine
-        )
+            # Queued premoves answer the engine right away, saving a request each
+            premoves_played = await game.apply_premoves(
+                engine=stockfish_engine, engine_move=stockfish_move
+            )
+        except ClockFlagError as flag:
+            return await finish_on_time(
+                game=game,
+                version=version,
+                flag=flag,
+                start_ply=start_ply,
+                redis_client=redis_client,
+                mongo_client=mongo_client,
+            )
+        if premoves_played:
+            last = premoves_played[-1]
+            stockfish_move = last["stockfish_move"]
+            stockfish_move_san = last["stockfish_san"]
+            is_game_over = last["is_game_over"]
+            evaluation = last["evaluation"]
+        # everything played in this request goes to the Mongo move log at once
+        new_moves = game.moves_since(start_ply)
 
         if not stockfish_move or not stockfish_move_san:
             # Game over after user move
+            win_color = game.winner_color()
+            outcome = game_outcome(win_color, game.user_color)
+            # the final position, read before quit_game resets the board
+            fen = game.get_fen()
             game.quit_game()
-            redis_delete_game_by_id(game_id=game_id, redis_client=redis_client)
+            finish_game(game_id=game_id, version=version, redis_client=redis_client)
 
             # Use dictionary instead of Game model
             game_data_dict = {
-                "modified_at": datetime.now(),
-                "fen": game.get_fen(),
-                "is_over": True,
-                "win_color": "white",
+                "fen": fen,
+                "win_color": win_color,
             }
 
-            result = await mongo_update_game_by_game_id(
-                game_id=game_id, mongo_client=mongo_client, update_data=game_data_dict
+            await mongo_finish_game(
+                game_id=game_id,
+                mongo_client=mongo_client,
+                outcome=outcome,
+                moves=new_moves,
+                update_data=game_data_dict,
             )
 
             return {
@@ -148,27 +277,34 @@ async def play_user_move(
                 "user_move": move_input.move,
                 "stockfish_move": None,
                 "stockfish_san": None,
-                "board_fen": game.get_fen(),
+                "premoves_played": premoves_played,
+                "board_fen": fen,
                 "game_id": game.game_id,
                 "is_game_over": True,
-                "winner": "User",
+                "winner": WINNERS[outcome],
             }
 
         if is_game_over:
             # Game over after engine move
+            win_color = game.winner_color()
+            outcome = game_outcome(win_color, game.user_color)
+            # the final position, read before quit_game resets the board
+            fen = game.get_fen()
             game.quit_game()
-            redis_delete_game_by_id(game_id=game_id, redis_client=redis_client)
+            finish_game(game_id=game_id, version=version, redis_client=redis_client)
 
             # Use dictionary instead of Game model
             game_data_dict = {
-                "modified_at": datetime.now(),
-                "fen": game.get_fen(),
-                "is_over": True,
-                "win_color": "black",
+                "fen": fen,
+                "win_color": win_color,
             }
 
-            result = await mongo_update_game_by_game_id(
-                game_id=game_id, mongo_client=mongo_client, update_data=game_data_dict
+            await mongo_finish_game(
+                game_id=game_id,
+                mongo_client=mongo_client,
+                outcome=outcome,
+                moves=new_moves,
+                update_data=game_data_dict,
             )
 
             return {
@@ -176,25 +312,29 @@ async def play_user_move(
                 "user_move": move_input.move,
                 "stockfish_move": stockfish_move,
                 "stockfish_san": stockfish_move_san,
-                "board_fen": game.get_fen(),
+                "evaluation": evaluation,
+                "premoves_played": premoves_played,
+                "board_fen": fen,
                 "game_id": game.game_id,
                 "is_game_over": True,
-                "winner": "Computer",
+                "winner": WINNERS[outcome],
             }
 
-        # Now update back in redis
-        redis_set_game_by_id(
-            game_id=game_id, redis_client=redis_client, data=game.to_dict()
-        )
+        # Now update back in redis, rejected if another request got there first
+        commit_game(game=game, version=version, redis_client=redis_client)
         # Update in mongo using dictionary
 
         game_data_dict = {
             "modified_at": datetime.now(),
             "fen": game.get_fen(),
+            "clock": game.clock,
         }
 
-        result = await mongo_update_game_by_game_id(
-            game_id=game_id, mongo_client=mongo_client, update_data=game_data_dict
+        result = await mongo_record_moves(
+            game_id=game_id,
+            mongo_client=mongo_client,
+            moves=new_moves,
+            update_data=game_data_dict,
         )
 
         return {
@@ -202,13 +342,21 @@ async def play_user_move(
             "user_move": move_input.move,
             "stockfish_move": stockfish_move,
             "stockfish_san": stockfish_move_san,
+            "evaluation": evaluation,
+            "premoves_played": premoves_played,
+            "premoves_queued": game.premoves,
             "board_fen": game.get_fen(),
             "game_id": game.game_id,
             "is_game_over": False,
+            "clock": game.clock,
         }
+    except RedisConflictError as c:
+        raise HTTPException(status_code=409, detail=str(c))
     except RedisServiceError as e:
         log_error(f"Redis operation failed:{str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    except (RemoteEngineError, EngineUnavailableError) as r:
+        raise engine_http_error(r)
     except ValueError as v:
         log_error(f"Error while playing move: {v}")
         raise HTTPException(status_code=400, detail=f"Invalid or illegal move {v}")
@@ -217,7 +365,45 @@ async def play_user_move(
         raise HTTPException(status_code=400, detail=f"Failed to play move: {e}")
 
 
+@chess_router.post("/premoves/", dependencies=[Depends(rate_limited("move"))])
+@traced("router.set_premoves")
+async def set_premoves(
+    premoves_input: PremovesInput,
+    request: Request,
+    game_id: str,
+):
+    """Queues conditional replies to the engine's next moves."""
+    try:
+        redis_client = request.app.state.redis_client
+        if not redis_client:
+            log_error("Redis Connection Failed")
+            raise HTTPException(status_code=500, detail="Redis Connection Failed")
+
+        game, version = await load_or_restore_game(
+            game_id=game_id,
+            redis_client=redis_client,
+            mongo_client=request.app.state.mongo_client,
+        )
+        try:
+            game.set_premoves(premoves_input.premoves)
+        except ChessServiceError as c:
+            release_game(game=game, version=version)
+            raise HTTPException(status_code=400, detail=str(c))
+        commit_game(game=game, version=version, redis_client=redis_client)
+        return {
+            "message": "Premoves queued",
+            "premoves_queued": game.premoves,
+            "game_id": game_id,
+        }
+    except RedisConflictError as c:
+        raise HTTPException(status_code=409, detail=str(c))
+    except RedisServiceError as re:
+        log_error(f"Redis operation failed: {str(re)}")
+        raise HTTPException(status_code=500, detail=str(re))
+
+
 @chess_router.post("/end_game/")
+@traced("router.end_game")
 async def end_game(
     request: Request,
     game_id: str,
@@ -241,27 +427,23 @@ async def end_game(
             log_error(f"Stockfish Engine not Initialized")
             raise HTTPException(status_code=500, detail="Stockfish Connection Failed")
 
-        game_data = redis_get_game_data_by_id(
-            game_id=game_id, redis_client=redis_client
-        )
-
-        # reconstruct game instance using the game_data
-        game = ChessGame.from_dict(game_data)
-
-        game.quit_game()
-
-        # delete game from redis
-        message = redis_delete_game_by_id(game_id=game_id, redis_client=redis_client)
-
-        # Mark game over in mongo
+        # read and delete the game from redis in one round-trip
+        hot_games.evict(game_id)
+        try:
+            game_data = redis_end_game_by_id(game_id=game_id, redis_client=redis_client)
+            # reconstruct game instance using the game_data
+            game = ChessGame.from_dict(game_data)
+            game.quit_game()
+        except RedisGameNotFoundError:
+            # expired from Redis, only the Mongo record is left to close
+            pass
+        message = "Game Ended"
 
-        result = await mongo_update_game_by_game_id(
+        # Mark game over in mongo, counted once even when ended twice
+        await mongo_finish_game(
             game_id=game_id,
             mongo_client=mongo_client,
-            update_data={
-                "is_over": True,
-                "modified_at": datetime.now(),
-            },
+            outcome=ABANDONED,
         )
         return {"message": message}
 
@@ -271,7 +453,8 @@ async def end_game(
         raise HTTPException(status_code=500, detail=f"Error ending game:{e}")
 
 
-@chess_router.post("/undo_move/")
+@chess_router.post("/undo_move/", dependencies=[Depends(rate_limited("move"))])
+@traced("router.undo_move")
 async def undo_move(
     request: Request,
     game_id: str,
@@ -288,19 +471,17 @@ async def undo_move(
             log_error("Mongo Connection Failed")
             raise HTTPException(status_code=500, detail="Mongo Connection Failed")
 
-        game_data = redis_get_game_data_by_id(
-            game_id=game_id, redis_client=redis_client
+        game, version = await load_or_restore_game(
+            game_id=game_id,
+            redis_client=redis_client,
+            mongo_client=mongo_client,
         )
-        # reconstruct game instance using the game_data
-        game = ChessGame.from_dict(game_data)
 
         fen_after_undo = game.undo_move()
 
         # Now also update redis
 
-        redis_set_game_by_id(
-            game_id=game_id, redis_client=redis_client, data=game.to_dict()
-        )
+        commit_game(game=game, version=version, redis_client=redis_client)
 
         # Update mongo
 
@@ -309,14 +490,21 @@ async def undo_move(
             "fen": game.get_fen(),
         }
 
-        result = await mongo_update_game_by_game_id(
-            game_id=game_id, mongo_client=mongo_client, update_data=game_data_dict
+        # Takebacks cut the move log back to the current line
+        result = await mongo_record_moves(
+            game_id=game_id,
+            mongo_client=mongo_client,
+            moves=[],
+            update_data=game_data_dict,
+            keep_plies=game.ply_count,
         )
         return {
             "message": "Move undone",
             "board_fen_after_undo": fen_after_undo,
             "game_id": game_id,
         }
+    except RedisConflictError as c:
+        raise HTTPException(status_code=409, detail=str(c))
     except RedisServiceError as re:
         log_error(f"Redis operation failed: {str(re)}")
         raise HTTPException(status_code=500, detail=str(re))
@@ -325,7 +513,69 @@ async def undo_move(
         raise HTTPException(status_code=500, detail=str(c))
 
 
-@chess_router.get("/get_ai_analysis")
+@chess_router.post("/goto_ply/", dependencies=[Depends(rate_limited("move"))])
+@traced("router.goto_ply")
+async def goto_ply(
+    request: Request,
+    game_id: str,
+    ply: int,
+):
+    """Rewinds the game to the position after the given number of plies."""
+    try:
+        redis_client = request.app.state.redis_client
+        mongo_client = request.app.state.mongo_client
+        if not redis_client:
+            log_error("Redis Connection Failed")
+            raise HTTPException(status_code=500, detail="Redis Connection Failed")
+
+        if not mongo_client:
+            log_error("Mongo Connection Failed")
+            raise HTTPException(status_code=500, detail="Mongo Connection Failed")
+
+        game, version = await load_or_restore_game(
+            game_id=game_id,
+            redis_client=redis_client,
+            mongo_client=mongo_client,
+        )
+        if not 0 <= ply <= game.ply_count:
+            release_game(game=game, version=version)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Ply must be between 0 and {game.ply_count}",
+            )
+
+        fen = game.goto_ply(ply)
+        commit_game(game=game, version=version, redis_client=redis_client)
+
+        game_data_dict = {
+            "modified_at": datetime.now(),
+            "fen": fen,
+        }
+        await mongo_record_moves(
+            game_id=game_id,
+            mongo_client=mongo_client,
+            moves=[],
+            update_data=game_data_dict,
+            keep_plies=ply,
+        )
+        return {
+            "message": "Moved to ply",
+            "ply": ply,
+            "board_fen": fen,
+            "game_id": game_id,
+        }
+    except RedisConflictError as c:
+        raise HTTPException(status_code=409, detail=str(c))
+    except RedisServiceError as re:
+        log_error(f"Redis operation failed: {str(re)}")
+        raise HTTPException(status_code=500, detail=str(re))
+    except ChessServiceError as c:
+        log_error(f"Chess service error: {str(c)}")
+        raise HTTPException(status_code=500, detail=str(c))
+
+
+@chess_router.get("/get_ai_analysis", dependencies=[Depends(rate_limited("llm"))])
+@traced("router.get_ai_analysis")
 async def get_ai_analysis(
     game_id: str,
     request: Request,
@@ -343,17 +593,19 @@ async def get_ai_analysis(
             log_error(f"Stockfish Engine not Initialized")
             raise HTTPException(status_code=500, detail="Stockfish Connection Failed")
 
-        game_data = redis_get_game_data_by_id(
-            game_id=game_id, redis_client=redis_client
+        game, version = await load_or_restore_game(
+            game_id=game_id,
+            redis_client=redis_client,
+            mongo_client=request.app.state.mongo_client,
         )
 
-        # reconstruct game instance using the game_data
-        game = ChessGame.from_dict(game_data)
-
         # First get top moves:
-        top_moves: List = await game.get_top_stockfish_moves(engine=stockfish_engine)
+        top_moves: List = await get_cached_top_moves(
+            game=game, engine=stockfish_engine, redis_client=redis_client
+        )
         fen = game.get_fen()
         turn = game.board.turn
+        release_game(game=game, version=version)
         analysis = run_ai_analysis(str(top_moves), fen, turn)
 
         return {
@@ -362,6 +614,8 @@ async def get_ai_analysis(
             "top_moves": top_moves,
             "analysis": analysis,
         }
+    except (RemoteEngineError, EngineUnavailableError) as r:
+        raise engine_http_error(r)
     except Exception as e:
         log_error(f"Error while generating Analysis from dify:{e}")
         raise HTTPException(
@@ -369,7 +623,8 @@ async def get_ai_analysis(
         )
 
 
-@chess_router.get("/get_top_moves")
+@chess_router.get("/get_top_moves", dependencies=[Depends(rate_limited("analysis"))])
+@traced("router.get_top_moves")
 async def get_top_moves(
     game_id: str,
     request: Request,
@@ -377,25 +632,32 @@ async def get_top_moves(
     """Gets Maximum of 3 top moves at the position"""
     try:
         redis_client = request.app.state.redis_client
+        stockfish_engine = request.app.state.stockfish_engine
         if not redis_client:
             log_error("Redis Connection Failed")
             raise HTTPException(status_code=500, detail="Redis Connection Failed")
 
-        game_data = redis_get_game_data_by_id(
-            game_id=game_id, redis_client=redis_client
+        game, version = await load_or_restore_game(
+            game_id=game_id,
+            redis_client=redis_client,
+            mongo_client=request.app.state.mongo_client,
         )
 
-        # reconstruct game instance using the game_data
-        game = ChessGame.from_dict(game_data)
-
-        top_moves: List = await game.get_top_stockfish_moves(engine=StockfishEngine)
+        top_moves: List = await get_cached_top_moves(
+            game=game, engine=stockfish_engine, redis_client=redis_client
+        )
+        fen = game.get_fen()
+        release_game(game=game, version=version)
 
-        return {game_id: game_id, "top_moves": top_moves, "fen": game.get_fen()}
+        return {game_id: game_id, "top_moves": top_moves, "fen": fen}
+    except (RemoteEngineError, EngineUnavailableError) as r:
+        raise engine_http_error(r)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching top moves:{e}")
 
 
-@chess_router.post("/voice_to_move_san/")
+@chess_router.post("/voice_to_move_san/", dependencies=[Depends(rate_limited("llm"))])
+@traced("router.voice_to_move_san")
 def voice_to_move_san(
     user_input: str,
     request: Request,
@@ -408,15 +670,11 @@ def voice_to_move_san(
             log_error("Redis Connection Failed")
             raise HTTPException(status_code=500, detail="Redis Connection Failed")
 
-        game_data = redis_get_game_data_by_id(
-            game_id=game_id, redis_client=redis_client
-        )
-
-        # reconstruct game instance using the game_data
-        game = ChessGame.from_dict(game_data)
+        game, version = load_game(game_id=game_id, redis_client=redis_client)
 
         # Get current FEN
         current_fen = game.get_fen()
+        release_game(game=game, version=version)
         response = voice_to_move(user_input, current_fen)
         return {"message": response.strip()}
 
@@ -431,3 +689,142 @@ def voice_to_move_san(
         raise HTTPException(
             status_code=500, detail=f"Error while converting move to SAN: {d}"
         )
+
+
+@chess_router.get("/export_pgn")
+@traced("router.export_pgn")
+async def export_pgn(
+    request: Request,
+    user_id: str | None = None,
+    finished_only: bool = False,
+    after: str | None = None,
+    limit: int | None = None,
+):
+    """Streams games as PGN, ordered by game id. Pass the GameId of the last
+    game received as `after` to fetch the next page."""
+    mongo_client = request.app.state.mongo_client
+    if not mongo_client:
+        log_error("Mongo Connection Failed")
+        raise HTTPException(status_code=500, detail="Mongo Connection Failed")
+
+    query = {}
+    if user_id is not None:
+        query["user_id"] = user_id
+    if finished_only:
+        query["is_over"] = True
+
+    games = mongo_iter_games(
+        mongo_client=mongo_client, query=query, after=after, limit=limit
+    )
+    return StreamingResponse(
+        stream_pgn(games),
+        media_type="application/x-chess-pgn",
+        headers={"Content-Disposition": 'attachment; filename="games.pgn"'},
+    )
+
+
+@chess_router.post("/game_review/", dependencies=[Depends(rate_limited("analysis"))])
+@traced("router.start_game_review")
+async def start_review(game_id: str, request: Request):
+    """Starts a background review of every move in a finished game. Poll
+    GET /game_review/ for progress and the result."""
+    try:
+        redis_client = request.app.state.redis_client
+        mongo_client = request.app.state.mongo_client
+        stockfish_engine = request.app.state.stockfish_engine
+        if not redis_client:
+            log_error("Redis Connection Failed")
+            raise HTTPException(status_code=500, detail="Redis Connection Failed")
+
+        doc = await mongo_get_game_by_game_id(
+            game_id=game_id, mongo_client=mongo_client
+        )
+        if doc is None:
+            raise HTTPException(status_code=404, detail="Game not found")
+        # reviews are cached by game id, so only a finished game has one
+        if not doc.get("is_over"):
+            raise HTTPException(status_code=409, detail="Game is still in progress")
+
+        existing = redis_get_review(game_id=game_id, redis_client=redis_client)
+        if existing is not None:
+            return {"game_id": game_id, **existing}
+
+        moves = doc.get("moves", [])
+        if not moves:
+            raise HTTPException(status_code=400, detail="Game has no moves to review")
+
+        if not stockfish_engine:
+            log_error(f"Stockfish Engine not Initialized")
+            raise HTTPException(status_code=500, detail="Stockfish Connection Failed")
+
+        start_game_review(
+            game_id=game_id,
+            moves=moves,
+            redis_client=redis_client,
+            engine=stockfish_engine,
+            start_fen=doc.get("start_fen"),
+        )
+        review = redis_get_review(game_id=game_id, redis_client=redis_client)
+        return {"game_id": game_id, **(review or {"status": "queued"})}
+    except HTTPException:
+        raise
+    except (RedisServiceError, MongoServiceError) as e:
+        log_error(f"Could not start game review: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@chess_router.get("/game_review/")
+@traced("router.get_game_review")
+async def get_review(game_id: str, request: Request):
+    """Status of a game review, with per-move results once it is done"""
+    try:
+        redis_client = request.app.state.redis_client
+        if not redis_client:
+            log_error("Redis Connection Failed")
+            raise HTTPException(status_code=500, detail="Redis Connection Failed")
+
+        review = redis_get_review(game_id=game_id, redis_client=redis_client)
+        if review is None:
+            raise HTTPException(status_code=404, detail="No review for this game")
+        return {"game_id": game_id, **review}
+    except RedisServiceError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@chess_router.get("/stats/")
+@traced("router.stats")
+async def get_stats(
+    request: Request,
+    user_elo: int | str | None = None,
+    days: int = 30,
+):
+    """Totals, per engine Elo (one Elo with `user_elo`) and per day for the
+    last `days` days, read from the rollups kept as games end"""
+    mongo_client = request.app.state.mongo_client
+    if not mongo_client:
+        log_error("Mongo Connection Failed")
+        raise HTTPException(status_code=500, detail="Mongo Connection Failed")
+    if not 0 <= days <= MAX_STATS_DAYS:
+        raise HTTPException(
+            status_code=400, detail=f"days must be between 0 and {MAX_STATS_DAYS}"
+        )
+
+    day_keys = recent_days(days)
+    try:
+        rollups = await mongo_get_game_stats(
+            mongo_client=mongo_client, user_elo=user_elo, days=day_keys
+        )
+    except MongoServiceError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    by_elo = sorted(
+        (doc for doc in rollups.values() if doc.get("scope") == "elo"),
+        key=lambda doc: (len(doc["key"]), doc["key"]),
+    )
+    return {
+        "all": summarize(rollups.get("all")),
+        "by_elo": [{"user_elo": doc["key"], **summarize(doc)} for doc in by_elo],
+        "per_day": [
+            {"day": day, **summarize(rollups.get(f"day:{day}"))} for day in day_keys
+        ],
+    }
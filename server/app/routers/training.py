@@ -0,0 +1,118 @@
+# flake8: noqa
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request
+from app.Domains.Game.chess_game import ChessServiceError
+from app.Domains.Game.game_cache import create_game
+from app.services.redis.redis_services import RedisServiceError
+from app.utils.rate_limiting import rate_limited
+from app.utils.error_handling import log_error
+
+training_router = APIRouter()
+
+
+def _pick_position(
+    opening: str | None,
+    min_score: float | None,
+    max_score: float | None,
+    mate_in: int | None,
+    mate: bool,
+) -> dict:
+    # numpy and the positions store load with the first training request. Runs
+    # in a thread, the first pick of a filter may scan a column.
+    from app.utils.ChessPositions.training_index import (
+        get_training_index,
+        TrainingIndexError,
+    )
+    from app.utils.ChessPositions.positions_store import PositionsStoreError
+
+    try:
+        return get_training_index().pick(
+            opening=opening,
+            min_score=min_score,
+            max_score=max_score,
+            mate_in=mate_in,
+            mate_only=mate,
+        )
+    except TrainingIndexError as t:
+        raise HTTPException(status_code=404, detail=str(t))
+    except PositionsStoreError as p:
+        log_error(f"Positions dataset unavailable: {p}")
+        raise HTTPException(status_code=503, detail="Positions dataset unavailable")
+
+
+@training_router.get("/position")
+async def get_training_position(
+    opening: str | None = None,
+    min_score: float | None = None,
+    max_score: float | None = None,
+    mate_in: int | None = None,
+    mate: bool = False,
+):
+    """A random position matching the filters. Scores are from White's view,
+    `mate_in` is signed like the dataset (negative when Black mates)."""
+    return await asyncio.to_thread(
+        _pick_position, opening, min_score, max_score, mate_in, mate
+    )
+
+
+@training_router.get("/openings")
+async def get_training_openings():
+    """Opening names accepted by the `opening` filter."""
+    from app.utils.ChessPositions.training_index import get_training_index
+    from app.utils.ChessPositions.positions_store import PositionsStoreError
+
+    try:
+        index = await asyncio.to_thread(get_training_index)
+        return {"openings": index.store.openings}
+    except PositionsStoreError as p:
+        log_error(f"Positions dataset unavailable: {p}")
+        raise HTTPException(status_code=503, detail="Positions dataset unavailable")
+
+
+@training_router.post("/start/", dependencies=[Depends(rate_limited("move"))])
+async def start_training_game(
+    request: Request,
+    user_elo: int | str,
+    opening: str | None = None,
+    min_score: float | None = None,
+    max_score: float | None = None,
+    mate_in: int | None = None,
+    mate: bool = False,
+    time_control: str | None = None,
+):
+    """Start a game against the engine from a random matching position."""
+    redis_client = request.app.state.redis_client
+    mongo_client = request.app.state.mongo_client
+    if not redis_client:
+        log_error("Redis Connection Failed")
+        raise HTTPException(status_code=500, detail="Redis Connection Failed")
+
+    if not mongo_client:
+        log_error("Mongo Connection Failed")
+        raise HTTPException(status_code=500, detail="Mongo Connection Failed")
+
+    position = await asyncio.to_thread(
+        _pick_position, opening, min_score, max_score, mate_in, mate
+    )
+    try:
+        game = await create_game(
+            redis_client=redis_client,
+            mongo_client=mongo_client,
+            user_elo=user_elo,
+            time_control=time_control,
+            start_fen=position["fen"],
+        )
+    except ChessServiceError as c:
+        raise HTTPException(status_code=400, detail=str(c))
+    except RedisServiceError as e:
+        log_error(f"Redis operation failed:{str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "message": "Training game started",
+        "board_fen": game.get_fen(),
+        "game_id": game.game_id,
+        "StockFish_Elo": user_elo,
+        "clock": game.clock,
+        "position": position,
+    }
@@ -0,0 +1,321 @@
+# flake8: noqa
+"""Game-affinity front end for running several API worker processes.
+
+Every request that names a game (the `game_id` query parameter or an
+`X-Game-Id` header) is sent to the worker owning that id on a consistent
+hash ring, so the worker's hot-game cache, analysis LRU and engine hash table
+see the whole game. Other requests are spread round-robin. Workers that exit
+or stop accepting connections leave the ring and are respawned; only their
+share of games moves, and the moved games are simply reloaded from Redis by
+their new worker.
+
+    python -m app.services.affinity.dispatcher --workers 4 --port 8000
+
+Behind a proxy that can hash on its own, skip the dispatcher and run the
+workers directly, e.g. nginx:
+
+    upstream chess_api {
+        hash $http_x_game_id$arg_game_id consistent;
+        server 127.0.0.1:8100;
+        server 127.0.0.1:8101;
+    }
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import itertools
+import subprocess
+from contextlib import asynccontextmanager
+import httpx
+import uvicorn
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from app.services.affinity.hash_ring import HashRing, DEFAULT_VNODES
+from app.Domains.Engine.resource_sizing import plan_engine_layout, log_layout
+from app.utils.error_handling import log_error, log_success, log_debug
+
+load_dotenv()
+
+API_WORKERS = int(os.getenv("API_WORKERS", "2"))
+DISPATCHER_HOST = os.getenv("DISPATCHER_HOST", "0.0.0.0")
+DISPATCHER_PORT = int(os.getenv("DISPATCHER_PORT", "8000"))
+# Worker i listens on 127.0.0.1:WORKER_BASE_PORT + i
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))
+WORKER_APP = os.getenv("WORKER_APP", "app.main:app")
+WORKER_HEALTH_INTERVAL = float(os.getenv("WORKER_HEALTH_INTERVAL", "1"))
+WORKER_RESTART_BACKOFF = float(os.getenv("WORKER_RESTART_BACKOFF", "1"))
+WORKER_RESTART_MAX_BACKOFF = float(os.getenv("WORKER_RESTART_MAX_BACKOFF", "30"))
+AFFINITY_VNODES = int(os.getenv("AFFINITY_VNODES", str(DEFAULT_VNODES)))
+GAME_ID_HEADER = "x-game-id"
+FORWARDED_FOR_HEADER = "x-forwarded-for"
+
+# Connection-level headers that must not be forwarded
+HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+}
+
+
+class Worker:
+    """One uvicorn process serving the API on a local port"""
+
+    def __init__(self, name: str, port: int):
+        self.name = name
+        self.port = port
+        self.process: subprocess.Popen | None = None
+        self.client = httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", timeout=None
+        )
+        self.in_ring = False
+        self.restarts = 0
+        self.failures = 0  # consecutive, drives the respawn backoff
+        self.next_spawn = 0.0
+        self.requests = 0
+
+
+def routing_key(request: Request) -> str | None:
+    return request.headers.get(GAME_ID_HEADER) or request.query_params.get("game_id")
+
+
+class WorkerPool:
+    """Spawns the workers and keeps the ring in line with the healthy ones"""
+
+    def __init__(self, count: int, base_port: int = WORKER_BASE_PORT):
+        self.workers = {
+            f"worker-{i}": Worker(f"worker-{i}", base_port + i) for i in range(count)
+        }
+        self.ring = HashRing(vnodes=AFFINITY_VNODES)
+        self._round_robin = itertools.count()
+        self.env = self._worker_env(count)
+
+    @staticmethod
+    def _worker_env(count: int) -> dict:
+        """Splits the engine CPU and hash budget between the worker processes,
+        keeping any explicit ENGINE_THREADS / ENGINE_HASH_MB"""
+        layout = plan_engine_layout(engines=count)
+        log_layout(layout, "Per-worker")
+        env = dict(os.environ)
+        env.setdefault("ENGINE_THREADS", str(layout.threads))
+        env.setdefault("ENGINE_HASH_MB", str(layout.hash_mb))
+        # every request reaches the workers from the dispatcher's address, the
+        # client is the one it appends to X-Forwarded-For
+        env.setdefault("RATE_LIMIT_TRUST_PROXY", "true")
+        return env
+
+    def spawn(self, worker: Worker):
+        worker.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                WORKER_APP,
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(worker.port),
+            ],
+            env={**self.env, "API_WORKER_ID": worker.name},
+        )
+        log_debug("Spawned %s (pid %s)", worker.name, worker.process.pid)
+
+    def leave(self, worker: Worker, reason: str):
+        if worker.in_ring:
+            worker.in_ring = False
+            self.ring.remove(worker.name)
+            log_error(f"{worker.name} left the ring: {reason}")
+
+    def join(self, worker: Worker):
+        if not worker.in_ring:
+            worker.in_ring = True
+            worker.failures = 0
+            self.ring.add(worker.name)
+            log_success("%s joined the ring on port %s", worker.name, worker.port)
+
+    async def _accepting(self, worker: Worker) -> bool:
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection("127.0.0.1", worker.port), timeout=1
+            )
+            writer.close()
+            return True
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+    async def check(self, worker: Worker):
+        if worker.process is None or worker.process.poll() is not None:
+            if worker.process is not None:
+                self.leave(worker, f"exited with {worker.process.returncode}")
+                worker.process = None
+                worker.failures += 1
+                worker.next_spawn = time.monotonic() + min(
+                    WORKER_RESTART_BACKOFF * 2 ** (worker.failures - 1),
+                    WORKER_RESTART_MAX_BACKOFF,
+                )
+            if time.monotonic() >= worker.next_spawn:
+                if worker.failures:
+                    worker.restarts += 1
+                self.spawn(worker)
+            return
+        if await self._accepting(worker):
+            self.join(worker)
+        else:
+            self.leave(worker, "not accepting connections")
+
+    async def supervise(self):
+        while True:
+            await asyncio.gather(*(self.check(w) for w in self.workers.values()))
+            await asyncio.sleep(WORKER_HEALTH_INTERVAL)
+
+    def candidates(self, key: str | None) -> list[Worker]:
+        """Workers to try in order: the key's owner then its ring successors,
+        or one round-robin pick for requests without a game"""
+        if key is not None:
+            names = self.ring.nodes_for(key)
+        else:
+            nodes = self.ring.nodes
+            names = [nodes[next(self._round_robin) % len(nodes)]] if nodes else []
+        return [self.workers[name] for name in names]
+
+    async def stop(self):
+        for worker in self.workers.values():
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.terminate()
+        for worker in self.workers.values():
+            if worker.process is not None:
+                try:
+                    await asyncio.to_thread(worker.process.wait, 10)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+            await worker.client.aclose()
+
+    def status(self) -> dict:
+        return {
+            "ring": self.ring.nodes,
+            "workers": [
+                {
+                    "name": w.name,
+                    "port": w.port,
+                    "pid": w.process.pid if w.process else None,
+                    "in_ring": w.in_ring,
+                    "restarts": w.restarts,
+                    "requests": w.requests,
+                }
+                for w in self.workers.values()
+            ],
+        }
+
+
+def forwarded_for(request: Request) -> str:
+    """X-Forwarded-For with the caller's address appended"""
+    client = request.client.host if request.client else "unknown"
+    previous = request.headers.get(FORWARDED_FOR_HEADER)
+    return f"{previous}, {client}" if previous else client
+
+
+async def forward(request: Request):
+    pool: WorkerPool = request.app.state.pool
+    headers = [
+        (name, value)
+        for name, value in request.headers.items()
+        if name.lower() not in HOP_HEADERS and name.lower() != FORWARDED_FOR_HEADER
+    ]
+    headers.append((FORWARDED_FOR_HEADER, forwarded_for(request)))
+    body = await request.body()
+    path = request.url.path
+    if request.url.query:
+        path += "?" + request.url.query
+    for worker in pool.candidates(routing_key(request)):
+        upstream = worker.client.build_request(
+            request.method,
+            path,
+            headers=headers,
+            content=body,
+        )
+        try:
+            response = await worker.client.send(upstream, stream=True)
+        except httpx.ConnectError as e:
+            # nothing reached the worker, so even a POST is safe to resend
+            pool.leave(worker, f"connect failed: {e}")
+            continue
+        except httpx.TransportError as e:
+            log_error(f"{worker.name} failed mid-request: {e}")
+            return JSONResponse({"detail": "API worker failed"}, status_code=502)
+        worker.requests += 1
+        response_headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in HOP_HEADERS - {"content-length"}
+        }
+        response_headers["x-api-worker"] = worker.name
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers=response_headers,
+            background=BackgroundTask(response.aclose),
+        )
+    return JSONResponse(
+        {"detail": "No API worker available"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+async def dispatcher_status(request: Request):
+    return JSONResponse(request.app.state.pool.status())
+
+
+def create_dispatcher(workers: int = API_WORKERS) -> Starlette:
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        pool = app.state.pool = WorkerPool(workers)
+        supervisor = asyncio.create_task(pool.supervise())
+        log_success("Dispatcher started with %s workers", workers)
+        yield
+        supervisor.cancel()
+        await pool.stop()
+        log_success("Dispatcher stopped")
+
+    return Starlette(
+        routes=[
+            Route("/_dispatcher/status", dispatcher_status),
+            Route(
+                "/{path:path}",
+                forward,
+                methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+            ),
+        ],
+        lifespan=lifespan,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run API workers behind a game-affinity dispatcher"
+    )
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    parser.add_argument("--host", default=DISPATCHER_HOST)
+    parser.add_argument("--port", type=int, default=DISPATCHER_PORT)
+    args = parser.parse_args()
+    # the peer address is what forward() appends to X-Forwarded-For, so it
+    # must not be replaced by the header a client sent
+    uvicorn.run(
+        create_dispatcher(args.workers),
+        host=args.host,
+        port=args.port,
+        proxy_headers=False,
+    )
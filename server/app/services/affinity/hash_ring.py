@@ -0,0 +1,80 @@
+# flake8: noqa
+import bisect
+import hashlib
+import threading
+from typing import Iterable
+
+# Points per node on the ring, more points spread games more evenly
+DEFAULT_VNODES = 128
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping game ids to worker names.
+
+    Adding or removing a node only moves the games whose points fall next to
+    that node's points, about 1/N of them, so the other workers keep their
+    warm caches through a rebalance."""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = DEFAULT_VNODES):
+        self.vnodes = vnodes
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        self._nodes: set[str] = set()
+        self._lock = threading.Lock()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        with self._lock:
+            if node in self._nodes:
+                return
+            self._nodes.add(node)
+            for i in range(self.vnodes):
+                point = _hash(f"{node}#{i}")
+                index = bisect.bisect(self._points, point)
+                self._points.insert(index, point)
+                self._owners.insert(index, node)
+
+    def remove(self, node: str):
+        with self._lock:
+            if node not in self._nodes:
+                return
+            self._nodes.discard(node)
+            kept = [
+                (point, owner)
+                for point, owner in zip(self._points, self._owners)
+                if owner != node
+            ]
+            self._points = [point for point, _ in kept]
+            self._owners = [owner for _, owner in kept]
+
+    def nodes_for(self, key: str) -> list[str]:
+        """Distinct nodes in ring order starting at the key's owner, the
+        fallbacks to try when the owner does not answer"""
+        with self._lock:
+            if not self._points:
+                return []
+            start = bisect.bisect(self._points, _hash(key)) % len(self._points)
+            found = []
+            for offset in range(len(self._points)):
+                owner = self._owners[(start + offset) % len(self._points)]
+                if owner not in found:
+                    found.append(owner)
+                    if len(found) == len(self._nodes):
+                        break
+            return found
+
+    def node_for(self, key: str) -> str | None:
+        nodes = self.nodes_for(key)
+        return nodes[0] if nodes else None
+
+    @property
+    def nodes(self) -> list[str]:
+        return sorted(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
@@ -33,6 +33,13 @@ class Game(BaseModel):
     win_color: Color = Field(default=Color.none)
     user_elo: str | int
     user_id: str = Field(default="")
+    # Append-only move log in UCI, written with $push as moves are played
+    moves: list[str] = Field(default_factory=list)
+    # Position the game started from, None for the standard setup
+    start_fen: str | None = None
+    # "minutes+increment" for timed games, with the last known clock
+    time_control: str | None = None
+    clock: dict | None = None
 
     class Config:
         populate_by_name = True
@@ -1,4 +1,5 @@
 from app.utils.error_handling import log_debug, log_success, log_error, ChessGameError
+from app.utils.tracing import traced
 import asyncio
 from app.services.mongodb.models.mongo_models import Game
 from fastapi import HTTPException
@@ -6,9 +7,25 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from app.services.mongodb.mongo_setup import get_mongo_client
 from datetime import datetime, timedelta
 import redis
-from typing import List
+from typing import List, AsyncIterator
+from pymongo import ReturnDocument, UpdateOne
+from app.Domains.Game.game_stats import (
+    USER_WIN,
+    ENGINE_WIN,
+    DRAW,
+    ABANDONED,
+    stats_day,
+)
 
 db_name = "chess-with-beth"
+stats_collection = "game_stats"
+# Rollup counter incremented for each outcome
+OUTCOME_FIELDS = {
+    USER_WIN: "user_wins",
+    ENGINE_WIN: "engine_wins",
+    DRAW: "draws",
+    ABANDONED: "abandoned",
+}
 
 
 class MongoServiceError(ChessGameError):
@@ -17,6 +34,7 @@ class MongoServiceError(ChessGameError):
     pass
 
 
+@traced("mongo.create_game")
 async def mongo_create_game(mongo_client: AsyncIOMotorClient, data: Game):
     try:
         insert_data = data.model_dump(by_alias=True)
@@ -39,6 +57,7 @@ async def mongo_create_game(mongo_client: AsyncIOMotorClient, data: Game):
         )
 
 
+@traced("mongo.update_game")
 async def mongo_update_game_by_game_id(
     game_id: str, mongo_client: AsyncIOMotorClient, update_data: Game | dict
 ):
@@ -74,13 +93,284 @@ async def mongo_update_game_by_game_id(
         if result.matched_count == 0:
             raise MongoServiceError(f"No game found with game_id: {game_id}")
 
-        log_success(f"Updated game with game_id in Mongo: {game_id}")
+        log_success(
+            "Updated game with game_id in Mongo: %s", game_id, msg_type="mongo.update"
+        )
         return result
     except Exception as e:
         log_error(f"Error updating game with game_id: {game_id}: {e}")
         raise MongoServiceError(f"Error updating game with game_id: {game_id}: {e}")
 
 
+@traced("mongo.get_game")
+async def mongo_get_game_by_game_id(
+    game_id: str, mongo_client: AsyncIOMotorClient
+) -> dict | None:
+    try:
+        db = mongo_client[db_name]
+        collection = db["games"]
+        return await collection.find_one({"game_id": game_id}, projection={"_id": 0})
+    except Exception as e:
+        log_error(f"Error fetching game with game_id: {game_id}: {e}")
+        raise MongoServiceError(f"Error fetching game with game_id: {game_id}: {e}")
+
+
+@traced("mongo.record_moves")
+async def mongo_record_moves(
+    game_id: str,
+    mongo_client: AsyncIOMotorClient,
+    moves: List[str],
+    update_data: dict,
+    keep_plies: int | None = None,
+):
+    """Appends the moves (UCI) played in one request to the game's move log and
+    applies update_data in the same round trip. keep_plies first cuts the log
+    back to that many moves, for takebacks."""
+    try:
+        push = {"$each": moves}
+        if keep_plies is not None:
+            push["$slice"] = keep_plies + len(moves)
+
+        update = {"$set": update_data}
+        if moves or keep_plies is not None:
+            update["$push"] = {"moves": push}
+
+        db = mongo_client[db_name]
+        collection = db["games"]
+        result = await collection.update_one({"game_id": game_id}, update)
+
+        if result.matched_count == 0:
+            raise MongoServiceError(f"No game found with game_id: {game_id}")
+
+        log_success(
+            "Recorded %s moves for game in Mongo: %s",
+            len(moves),
+            game_id,
+            msg_type="mongo.update",
+        )
+        return result
+    except Exception as e:
+        log_error(f"Error recording moves for game_id: {game_id}: {e}")
+        raise MongoServiceError(f"Error recording moves for game_id: {game_id}: {e}")
+
+
+@traced("mongo.finish_game")
+async def mongo_finish_game(
+    game_id: str,
+    mongo_client: AsyncIOMotorClient,
+    outcome: str,
+    moves: List[str] | None = None,
+    update_data: dict | None = None,
+) -> bool:
+    """Appends the last moves (UCI), marks the game over with its outcome and
+    adds it to the stats rollups. Only the call that ends a running game
+    counts it, so returns False for a game that had already ended."""
+    try:
+        fields = {
+            "modified_at": datetime.now(),
+            **(update_data or {}),
+            "is_over": True,
+            "outcome": outcome,
+        }
+        update = {"$set": fields}
+        if moves:
+            update["$push"] = {"moves": {"$each": moves}}
+
+        db = mongo_client[db_name]
+        collection = db["games"]
+        game = await collection.find_one_and_update(
+            {"game_id": game_id, "is_over": False},
+            update,
+            projection={"_id": 0, "user_elo": 1, "created_at": 1, "moves": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if game is None:
+            if await collection.count_documents({"game_id": game_id}, limit=1) == 0:
+                raise MongoServiceError(f"No game found with game_id: {game_id}")
+            log_debug(
+                "Game already over in Mongo: %s", game_id, msg_type="mongo.update"
+            )
+            return False
+    except Exception as e:
+        log_error(f"Error finishing game with game_id: {game_id}: {e}")
+        raise MongoServiceError(f"Error finishing game with game_id: {game_id}: {e}")
+
+    ended_at = fields["modified_at"]
+    created_at = game.get("created_at")
+    increments = {
+        "games": 1,
+        OUTCOME_FIELDS[outcome]: 1,
+        "plies": len(game.get("moves", [])),
+        "seconds": (
+            max((ended_at - created_at).total_seconds(), 0) if created_at else 0
+        ),
+    }
+    rollups = {
+        "all": ("all", None),
+        f"elo:{game['user_elo']}": ("elo", str(game["user_elo"])),
+        f"day:{stats_day(ended_at)}": ("day", stats_day(ended_at)),
+    }
+    try:
+        await db[stats_collection].bulk_write(
+            [
+                UpdateOne(
+                    {"_id": rollup_id},
+                    {
+                        "$inc": increments,
+                        "$setOnInsert": {"scope": scope, "key": key},
+                    },
+                    upsert=True,
+                )
+                for rollup_id, (scope, key) in rollups.items()
+            ],
+            ordered=False,
+        )
+    except Exception as e:
+        # the game itself is recorded, a backfill brings the rollups back in line
+        log_error(f"Error updating stats rollups for game_id: {game_id}: {e}")
+    log_success(
+        "Finished game in Mongo: %s (%s)", game_id, outcome, msg_type="mongo.update"
+    )
+    return True
+
+
+async def mongo_get_game_stats(
+    mongo_client: AsyncIOMotorClient,
+    user_elo: str | int | None = None,
+    days: List[str] = (),
+) -> dict:
+    """Rollups by id: "all", the Elo ones (only `user_elo` when given) and the
+    requested day keys. Reads rollup documents only, never the games."""
+    try:
+        collection = mongo_client[db_name][stats_collection]
+        query = {"$or": [{"_id": "all"}, {"_id": {"$in": [f"day:{d}" for d in days]}}]}
+        if user_elo is None:
+            query["$or"].append({"scope": "elo"})
+        else:
+            query["$or"].append({"_id": f"elo:{user_elo}"})
+        return {doc["_id"]: doc async for doc in collection.find(query)}
+    except Exception as e:
+        log_error(f"Error while reading game stats: {e}")
+        raise MongoServiceError(f"Error while reading game stats: {e}")
+
+
+def _count_outcome(outcome: str) -> dict:
+    return {"$sum": {"$cond": [{"$eq": ["$outcome", outcome]}, 1, 0]}}
+
+
+# One pass over the finished games producing every rollup. Games ended before
+# outcomes were recorded had the user on white and no draws.
+_ROLLUP_GROUP = {
+    "games": {"$sum": 1},
+    **{field: _count_outcome(outcome) for outcome, field in OUTCOME_FIELDS.items()},
+    "plies": {"$sum": "$plies"},
+    "seconds": {"$sum": "$seconds"},
+}
+STATS_BACKFILL_PIPELINE = [
+    {"$match": {"is_over": True}},
+    {
+        "$project": {
+            "elo": {"$toString": "$user_elo"},
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$modified_at"}},
+            "outcome": {
+                "$ifNull": [
+                    "$outcome",
+                    {
+                        "$switch": {
+                            "branches": [
+                                {
+                                    "case": {"$eq": ["$win_color", "white"]},
+                                    "then": USER_WIN,
+                                },
+                                {
+                                    "case": {"$eq": ["$win_color", "black"]},
+                                    "then": ENGINE_WIN,
+                                },
+                            ],
+                            "default": ABANDONED,
+                        }
+                    },
+                ]
+            },
+            "plies": {"$size": {"$ifNull": ["$moves", []]}},
+            "seconds": {
+                "$max": [
+                    {"$divide": [{"$subtract": ["$modified_at", "$created_at"]}, 1000]},
+                    0,
+                ]
+            },
+        }
+    },
+    {
+        "$facet": {
+            "all": [{"$group": {"_id": None, **_ROLLUP_GROUP}}],
+            "elo": [{"$group": {"_id": "$elo", **_ROLLUP_GROUP}}],
+            "day": [{"$group": {"_id": "$day", **_ROLLUP_GROUP}}],
+        }
+    },
+]
+
+
+async def mongo_rebuild_game_stats(mongo_client: AsyncIOMotorClient) -> dict:
+    """Recomputes every rollup from the games collection and swaps them in
+    at once. Returns the number of rollups per scope."""
+    try:
+        db = mongo_client[db_name]
+        result = await db["games"].aggregate(STATS_BACKFILL_PIPELINE).to_list(1)
+        facets = result[0] if result else {}
+        rollups = []
+        for scope in ("all", "elo", "day"):
+            for group in facets.get(scope, []):
+                key = group.pop("_id")
+                group["_id"] = "all" if scope == "all" else f"{scope}:{key}"
+                rollups.append({**group, "scope": scope, "key": key})
+
+        staging = db[f"{stats_collection}_rebuild"]
+        await staging.drop()
+        if rollups:
+            await staging.insert_many(rollups)
+            await staging.rename(stats_collection, dropTarget=True)
+        else:
+            await db[stats_collection].drop()
+
+        counts = {scope: len(facets.get(scope, [])) for scope in ("all", "elo", "day")}
+        log_success("Rebuilt game stats rollups: %s", counts, msg_type="mongo.stats")
+        return counts
+    except Exception as e:
+        log_error(f"Error while rebuilding game stats: {e}")
+        raise MongoServiceError(f"Error while rebuilding game stats: {e}")
+
+
+async def mongo_iter_games(
+    mongo_client: AsyncIOMotorClient,
+    query: dict,
+    after: str | None = None,
+    limit: int | None = None,
+    batch_size: int = 200,
+) -> AsyncIterator[dict]:
+    """Yields games ordered by game_id from a cursor, a batch at a time.
+    Pass the last game_id seen as `after` to continue from there."""
+    try:
+        if after:
+            query = {**query, "game_id": {"$gt": after}}
+        db = mongo_client[db_name]
+        collection = db["games"]
+        cursor = collection.find(
+            query,
+            projection={"_id": 0},
+            sort=[("game_id", 1)],
+            batch_size=batch_size,
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+        async for game in cursor:
+            yield game
+    except Exception as e:
+        log_error(f"Error while reading games: {e}")
+        raise MongoServiceError(f"Error while reading games: {e}")
+
+
+@traced("mongo.delete_game")
 async def mongo_delete_game_by_game_id(game_id: str, mongo_client: AsyncIOMotorClient):
     try:
         db = mongo_client[db_name]
@@ -88,13 +378,16 @@ async def mongo_delete_game_by_game_id(game_id: str, mongo_client: AsyncIOMotorC
 
         result = await collection.delete_one({"game_id": game_id})
 
-        log_success(f"Deleted game with game_id from Mongo: {game_id}")
+        log_success(
+            "Deleted game with game_id from Mongo: %s", game_id, msg_type="mongo.delete"
+        )
         return result
     except Exception as e:
         log_error(f"Error while delete game with game_id : {game_id}")
         raise MongoServiceError(f"Error while delete game with game_id : {game_id}")
 
 
+@traced("mongo.get_stale_game_ids")
 async def mongo_get_stale_game_ids(mongo_client: AsyncIOMotorClient) -> List[str]:
     """Returns game ids of the games that have been inactive for at least an hour"""
 
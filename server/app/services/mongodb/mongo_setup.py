@@ -2,7 +2,6 @@ import os
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.utils.error_handling import log_debug, log_success, log_error
-from fastapi import HTTPException
 import urllib.parse
 import asyncio
 from pymongo.server_api import ServerApi
@@ -12,13 +11,13 @@ load_dotenv()
 
 async def get_mongo_client():
     try:
-        username = urllib.parse.quote_plus(os.getenv("MONGO_DB_USERNAME", None))
-        password = urllib.parse.quote_plus(os.getenv("MONGO_DB_PASSWORD", None))
+        username = os.getenv("MONGO_DB_USERNAME")
+        password = os.getenv("MONGO_DB_PASSWORD")
 
         if not username or not password:
-            raise HTTPException(
-                f"Mongo db Username and Password not present in env file"
-            )
+            raise ValueError("Mongo db Username and Password not present in env file")
+        username = urllib.parse.quote_plus(username)
+        password = urllib.parse.quote_plus(password)
 
         host = os.getenv("MONGO_DB_HOST", "127.0.0.1")
         uri = f"mongodb+srv://{username}:{password}@{host}?retryWrites=true&w=majority&appName=Cluster-SD"
@@ -29,4 +28,4 @@ async def get_mongo_client():
         return mongo_client
     except Exception as e:
         log_error(f"Error while connecting to mongo db:{e}")
-        raise HTTPException(f"Error while connecting to mongo client: {e}")
+        raise ConnectionError(f"Error while connecting to mongo client: {e}")
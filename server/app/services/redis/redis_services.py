@@ -1,8 +1,10 @@
+import os
 import redis
 import uuid
 import pickle
 import json
 from app.utils.error_handling import log_error, log_success, ChessGameError
+from app.utils.tracing import traced
 
 
 class RedisServiceError(ChessGameError):
@@ -11,55 +13,547 @@ class RedisServiceError(ChessGameError):
     pass
 
 
+class RedisConflictError(RedisServiceError):
+    """The game changed between read and commit"""
+
+    pass
+
+
+class RedisGameNotFoundError(RedisServiceError):
+    """The game is not (or no longer) in Redis"""
+
+    pass
+
+
+GAME_KEY_PREFIX = "game:"
+# Games expire after this many idle seconds (0 keeps them forever), Mongo holds
+# enough to rebuild them, so Redis can evict them like any cache entry
+GAME_TTL = int(os.getenv("GAME_TTL", str(6 * 3600)))
+COMMIT_NOT_FOUND = -1
+COMMIT_CONFLICT = -2
+# Every time a game record is written from scratch (created, restored from
+# Mongo, migrated) its version starts at the next multiple of the stride from
+# a global counter. A worker holding a cached copy from before an eviction can
+# then never see its version come round again.
+GAME_VERSION_COUNTER = "games:version_epoch"
+GAME_VERSION_STRIDE = 1 << 20
+
+# Writes a new game record at a fresh version. KEYS: game key, version counter.
+# ARGV: data, ttl. Returns the version.
+SET_GAME_LUA = """
+local version = string.format('%%d', redis.call('INCR', KEYS[2]) * %(stride)d)
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'v', version, 'data', ARGV[1])
+if tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return version
+""" % {"stride": GAME_VERSION_STRIDE}
+
+# Compare-and-set on the game version. ARGV: expected version, data, delete flag,
+# ttl. Versions are written with string.format, as an argument Lua would print
+# a large number with an exponent.
+COMMIT_GAME_LUA = """
+local version = redis.call('HGET', KEYS[1], 'v')
+if not version then
+    return -1
+end
+if version ~= ARGV[1] then
+    return -2
+end
+if ARGV[3] == '1' then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+local next_version = tonumber(version) + 1
+redis.call('HSET', KEYS[1], 'v', string.format('%d', next_version), 'data', ARGV[2])
+if tonumber(ARGV[4]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+end
+return next_version
+"""
+
+# Returns nil when missing, {version} when unchanged, else {version, data}.
+# Reading a game also pushes back its expiry (ARGV[2], 0 for none)
+GET_GAME_IF_CHANGED_LUA = """
+local version = redis.call('HGET', KEYS[1], 'v')
+if not version then
+    return false
+end
+if tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if version == ARGV[1] then
+    return {version}
+end
+return {version, redis.call('HGET', KEYS[1], 'data')}
+"""
+
+# Writes a rebuilt game only if no other request restored it first.
+# KEYS: game key, version counter. ARGV: data, ttl.
+# Returns {version now stored, 1 if this call wrote it}.
+RESTORE_GAME_LUA = """
+local version = redis.call('HGET', KEYS[1], 'v')
+if version then
+    return {version, 0}
+end
+version = string.format('%%d', redis.call('INCR', KEYS[2]) * %(stride)d)
+redis.call('HSET', KEYS[1], 'v', version, 'data', ARGV[1])
+if tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return {version, 1}
+""" % {"stride": GAME_VERSION_STRIDE}
+
+# Moves a game saved before versioning (a pickled string under the bare game id,
+# or under game:<id>) into the versioned hash. KEYS: game key, legacy key,
+# version counter. ARGV: ttl. Returns 1 when a game was migrated.
+MIGRATE_LEGACY_GAME_LUA = """
+local key_type = redis.call('TYPE', KEYS[1])['ok']
+local source
+if key_type == 'string' then
+    source = KEYS[1]
+elseif key_type == 'none' and redis.call('TYPE', KEYS[2])['ok'] == 'string' then
+    source = KEYS[2]
+else
+    return 0
+end
+local data = redis.call('GET', source)
+redis.call('DEL', source)
+local version = string.format('%%d', redis.call('INCR', KEYS[3]) * %(stride)d)
+redis.call('HSET', KEYS[1], 'v', version, 'data', data)
+if tonumber(ARGV[1]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return 1
+""" % {"stride": GAME_VERSION_STRIDE}
+# Reads and deletes a game record. Returns nil when there is none, a legacy
+# string record fails the HGET with WRONGTYPE before anything is deleted.
+END_GAME_LUA = """
+local data = redis.call('HGET', KEYS[1], 'data')
+if not data then
+    return false
+end
+redis.call('DEL', KEYS[1])
+return data
+"""
+_scripts = {}
+
+
+ANALYSIS_KEY_PREFIX = "analysis:"
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def analysis_cache_key(fen: str) -> str:
+    """Move counters are dropped so transpositions share one entry"""
+    return ANALYSIS_KEY_PREFIX + " ".join(fen.split()[:4])
+
+
 def redis_create_new_game_id(redis_client: redis.Redis) -> str:
     try:
         game_id = str(uuid.uuid4())
-        log_success(f"Created game ID: {game_id}")
+        log_success("Created game ID: %s", game_id, msg_type="game.create")
         return game_id
     except Exception as e:
         log_error(str(e))
         raise RedisServiceError(f"Failed to create game ID: {str(e)}")
 
 
+def game_key(game_id: str) -> str:
+    return GAME_KEY_PREFIX + game_id
+
+
+def _load_game_data(game_data) -> dict:
+    if not isinstance(game_data, bytes):
+        log_error(f"Game data is not bytes: {type(game_data)}")
+        raise RedisServiceError("Invalid game data format")
+    try:
+        data = pickle.loads(game_data)
+    except pickle.UnpicklingError as pe:
+        log_error(f"Failed to deserialize game data: {str(pe)}")
+        raise RedisServiceError(f"Failed to deserialize game data: {str(pe)}")
+    if not isinstance(data, dict):
+        raise RedisServiceError("Invalid game data format")
+    return data
+
+
+def _script(redis_client: redis.Redis, source: str):
+    """Registered once, then called through EVALSHA"""
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = redis_client.register_script(source)
+    return script
+
+
+@traced("redis.migrate_legacy_game")
+def redis_migrate_legacy_game(game_id: str, redis_client: redis.Redis) -> bool:
+    """Rewrites a game stored by older releases as a plain pickled string into
+    the versioned hash, returns whether there was one"""
+    # Only ids without a colon were used as bare keys, so no other key is touched
+    legacy_key = game_id if ":" not in game_id else game_key(game_id)
+    try:
+        migrated = _script(redis_client, MIGRATE_LEGACY_GAME_LUA)(
+            keys=[game_key(game_id), legacy_key, GAME_VERSION_COUNTER],
+            args=[GAME_TTL],
+            client=redis_client,
+        )
+    except redis.RedisError as re:
+        log_error(f"Legacy game migration failed: {re}")
+        raise RedisServiceError(f"Legacy game migration failed: {re}")
+    if migrated:
+        log_success("Migrated legacy game record %s", game_id)
+    return bool(migrated)
+
+
+def _read_game(game_id: str, redis_client: redis.Redis, read):
+    """Runs read(), which returns None for a missing game, and once more after
+    migrating a legacy record when the game is missing or in the old format"""
+    try:
+        reply = read()
+    except redis.ResponseError as re:
+        if "WRONGTYPE" not in str(re):
+            raise
+        reply = None
+    if reply is None and redis_migrate_legacy_game(game_id, redis_client):
+        reply = read()
+    return reply
+
+
+@traced("redis.set_game")
 def redis_set_game_by_id(game_id: str, redis_client: redis.Redis, data: dict):
+    """Creates (or overwrites) a game record, returns its version"""
     try:
         serialized_data = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
-        redis_client.set(name=game_id, value=serialized_data)
+        return int(
+            _script(redis_client, SET_GAME_LUA)(
+                keys=[game_key(game_id), GAME_VERSION_COUNTER],
+                args=[serialized_data, GAME_TTL],
+                client=redis_client,
+            )
+        )
     except Exception as e:
         log_error(str(e))
         raise RedisServiceError(f"Failed to save game: {str(e)}")
 
 
-def redis_get_game_data_by_id(game_id: str, redis_client: redis.Redis) -> dict:
+@traced("redis.get_game")
+def redis_get_game_record_by_id(
+    game_id: str, redis_client: redis.Redis
+) -> tuple[dict, int]:
+    """Game data together with its version, in one round-trip"""
+
+    def read():
+        game_data, version = redis_client.hmget(game_key(game_id), ["data", "v"])
+        return (game_data, version) if game_data else None
+
     try:
-        game_data = redis_client.get(name=game_id)
-        if not game_data:
-            log_error(f"Game with ID {game_id} not found")
-            raise RedisServiceError(f"Game not found: {game_id}")
-
-        try:
-            if not isinstance(game_data, bytes):
-                log_error(f"Deserialized data is not a dictionary: {type(data)}")
-                raise RedisServiceError("Invalid game data format")
-
-            # Add error handling for deserialization
-            data = pickle.loads(game_data)
-            if not isinstance(data, dict):
-                raise RedisServiceError("Invalid game data format")
-            return data
-        except pickle.UnpicklingError as pe:
-            log_error(f"Failed to deserialize game data: {str(pe)}")
-            raise RedisServiceError(f"Failed to deserialize game data: {str(pe)}")
+        record = _read_game(game_id, redis_client, read)
+    except redis.RedisError as re:
+        log_error(f"Redis operation failed: {str(re)}")
+        raise RedisServiceError(f"Redis operation failed: {str(re)}")
 
+    if record is None:
+        log_error(f"Game with ID {game_id} not found")
+        raise RedisGameNotFoundError(f"Game not found: {game_id}")
+    game_data, version = record
+    return _load_game_data(game_data), int(version)
+
+
+@traced("redis.get_game_if_changed")
+def redis_get_game_record_if_changed(
+    game_id: str, redis_client: redis.Redis, known_version: int
+) -> tuple[dict | None, int]:
+    """Like redis_get_game_record_by_id but skips the payload (returns None)
+    when the stored version still equals known_version"""
+    try:
+        reply = _read_game(
+            game_id,
+            redis_client,
+            lambda: _script(redis_client, GET_GAME_IF_CHANGED_LUA)(
+                keys=[game_key(game_id)],
+                args=[known_version, GAME_TTL],
+                client=redis_client,
+            ),
+        )
     except redis.RedisError as re:
         log_error(f"Redis operation failed: {str(re)}")
         raise RedisServiceError(f"Redis operation failed: {str(re)}")
 
+    if not reply:
+        log_error(f"Game with ID {game_id} not found")
+        raise RedisGameNotFoundError(f"Game not found: {game_id}")
+    if len(reply) == 1:
+        return None, int(reply[0])
+    return _load_game_data(reply[1]), int(reply[0])
+
+
+def redis_get_game_data_by_id(game_id: str, redis_client: redis.Redis) -> dict:
+    data, _ = redis_get_game_record_by_id(game_id=game_id, redis_client=redis_client)
+    return data
+
+
+@traced("redis.commit_game")
+def redis_commit_game_by_id(
+    game_id: str,
+    redis_client: redis.Redis,
+    expected_version: int,
+    data: dict | None = None,
+) -> int:
+    """Atomically replaces the game (or deletes it when data is None) if it is
+    still at expected_version. Returns the new version, 0 after a delete."""
+    try:
+        serialized_data = (
+            b""
+            if data is None
+            else pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        result = _script(redis_client, COMMIT_GAME_LUA)(
+            keys=[game_key(game_id)],
+            args=[
+                expected_version,
+                serialized_data,
+                1 if data is None else 0,
+                GAME_TTL,
+            ],
+            client=redis_client,
+        )
+    except redis.RedisError as re:
+        log_error(f"Redis commit failed: {re}")
+        raise RedisServiceError(f"Redis commit failed: {re}")
+
+    if result == COMMIT_NOT_FOUND:
+        raise RedisGameNotFoundError(f"Game not found: {game_id}")
+    if result == COMMIT_CONFLICT:
+        log_error(f"Concurrent update rejected for game {game_id}")
+        raise RedisConflictError(
+            f"Game {game_id} was modified by another request, reload and retry"
+        )
+    return int(result)
+
+
+@traced("redis.restore_game")
+def redis_restore_game_by_id(
+    game_id: str, redis_client: redis.Redis, data: dict
+) -> tuple[int, bool]:
+    """Stores a game rebuilt from Mongo unless it is already back in Redis.
+    Returns the version now stored and whether it is this game's."""
+    try:
+        serialized_data = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        version, restored = _script(redis_client, RESTORE_GAME_LUA)(
+            keys=[game_key(game_id), GAME_VERSION_COUNTER],
+            args=[serialized_data, GAME_TTL],
+            client=redis_client,
+        )
+        return int(version), bool(restored)
+    except redis.RedisError as re:
+        log_error(f"Redis restore failed: {re}")
+        raise RedisServiceError(f"Redis restore failed: {re}")
+
 
+@traced("redis.delete_game")
 def redis_delete_game_by_id(game_id: str, redis_client: redis.Redis) -> str:
     try:
-        redis_client.delete(game_id)
+        redis_client.delete(game_key(game_id))
         return "Game Ended"
     except redis.RedisError as re:
         log_error(f"Redis delte operation failed: {re}")
         raise RedisServiceError(f"Redis delete operation failed")
+
+
+@traced("redis.end_game")
+def redis_end_game_by_id(game_id: str, redis_client: redis.Redis) -> dict:
+    """Reads and deletes the game in one script call, legacy records are
+    migrated only when that call finds nothing"""
+    try:
+        game_data = _read_game(
+            game_id,
+            redis_client,
+            lambda: _script(redis_client, END_GAME_LUA)(
+                keys=[game_key(game_id)], client=redis_client
+            ),
+        )
+    except redis.RedisError as re:
+        log_error(f"Redis end game failed: {re}")
+        raise RedisServiceError(f"Redis end game failed: {re}")
+
+    if not game_data:
+        log_error(f"Game with ID {game_id} not found")
+        raise RedisGameNotFoundError(f"Game not found: {game_id}")
+    return _load_game_data(game_data)
+
+
+@traced("redis.get_analysis")
+def redis_get_cached_analysis(fen: str, redis_client: redis.Redis) -> list | None:
+    """Cached top moves for a position, None on a miss"""
+    try:
+        cached = redis_client.get(analysis_cache_key(fen))
+        if cached is None:
+            return None
+        return json.loads(cached)
+    except (redis.RedisError, ValueError) as e:
+        log_error(f"Failed to read cached analysis: {e}")
+        raise RedisServiceError(f"Failed to read cached analysis: {e}")
+
+
+@traced("redis.set_analysis")
+def redis_set_cached_analysis(
+    fen: str,
+    redis_client: redis.Redis,
+    top_moves: list,
+    ttl: int = ANALYSIS_CACHE_TTL,
+):
+    try:
+        redis_client.set(analysis_cache_key(fen), json.dumps(top_moves), ex=ttl)
+    except redis.RedisError as e:
+        log_error(f"Failed to cache analysis: {e}")
+        raise RedisServiceError(f"Failed to cache analysis: {e}")
+
+
+def redis_seed_analysis_cache(
+    entries: dict[str, list], redis_client: redis.Redis, ttl: int = ANALYSIS_CACHE_TTL
+) -> int:
+    """Writes many {fen: top_moves} entries in one pipelined round-trip"""
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for fen, top_moves in entries.items():
+            pipe.set(analysis_cache_key(fen), json.dumps(top_moves), ex=ttl)
+        pipe.execute()
+        return len(entries)
+    except redis.RedisError as e:
+        log_error(f"Failed to seed analysis cache: {e}")
+        raise RedisServiceError(f"Failed to seed analysis cache: {e}")
+
+
+REVIEW_KEY_PREFIX = "review:"
+REVIEW_CACHE_TTL = int(os.getenv("REVIEW_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+def review_key(game_id: str) -> str:
+    return REVIEW_KEY_PREFIX + game_id
+
+
+def redis_claim_review(
+    game_id: str, redis_client: redis.Redis, review: dict, ttl: int
+) -> bool:
+    """Stores the initial review state unless a review already exists, so only
+    one job runs per game. `ttl` bounds how long a crashed job blocks retries."""
+    try:
+        return bool(
+            redis_client.set(review_key(game_id), json.dumps(review), nx=True, ex=ttl)
+        )
+    except redis.RedisError as e:
+        log_error(f"Failed to claim game review: {e}")
+        raise RedisServiceError(f"Failed to claim game review: {e}")
+
+
+def redis_get_review(game_id: str, redis_client: redis.Redis) -> dict | None:
+    try:
+        cached = redis_client.get(review_key(game_id))
+        return None if cached is None else json.loads(cached)
+    except (redis.RedisError, ValueError) as e:
+        log_error(f"Failed to read game review: {e}")
+        raise RedisServiceError(f"Failed to read game review: {e}")
+
+
+def redis_set_review(
+    game_id: str,
+    redis_client: redis.Redis,
+    review: dict,
+    ttl: int = REVIEW_CACHE_TTL,
+):
+    try:
+        redis_client.set(review_key(game_id), json.dumps(review), ex=ttl)
+    except redis.RedisError as e:
+        log_error(f"Failed to store game review: {e}")
+        raise RedisServiceError(f"Failed to store game review: {e}")
+
+
+RATE_LIMIT_KEY_PREFIX = "ratelimit:"
+RATE_LIMIT_CONFIG_KEY = "ratelimit:config"
+
+# Token buckets checked and charged together, so a request either passes all
+# of them or touches none. KEYS: buckets. ARGV: cost, then capacity and refill
+# rate (tokens/s) for each bucket. Returns "0" when admitted, otherwise the
+# seconds until every bucket holds enough tokens (as a string, Lua numbers
+# would be truncated to integers).
+TOKEN_BUCKET_LUA = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    tokens = math.min(capacity, tokens + elapsed * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    redis.call('HSET', key, 'tokens', levels[i] - cost, 'ts', now)
+    -- an untouched bucket is full again after capacity / rate seconds
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+end
+return '0'
+"""
+
+
+def rate_limit_key(scope: str, subject: str) -> str:
+    return f"{RATE_LIMIT_KEY_PREFIX}{scope}:{subject}"
+
+
+def redis_take_tokens(
+    redis_client: redis.Redis,
+    buckets: list[tuple[str, float, float]],
+    cost: float = 1,
+) -> float:
+    """Charges `cost` to every (key, capacity, tokens per second) bucket in one
+    round-trip. Returns 0 when admitted, else the seconds to wait."""
+    args = [cost]
+    for _, capacity, rate in buckets:
+        args += [capacity, rate]
+    try:
+        wait = _script(redis_client, TOKEN_BUCKET_LUA)(
+            keys=[key for key, _, _ in buckets], args=args, client=redis_client
+        )
+        return float(wait)
+    except redis.RedisError as re:
+        log_error(f"Rate limit check failed: {re}")
+        raise RedisServiceError(f"Rate limit check failed: {re}")
+
+
+def redis_get_rate_limit_overrides(redis_client: redis.Redis) -> dict[str, str]:
+    try:
+        return {
+            name.decode(): value.decode()
+            for name, value in redis_client.hgetall(RATE_LIMIT_CONFIG_KEY).items()
+        }
+    except redis.RedisError as re:
+        log_error(f"Failed to read rate limits: {re}")
+        raise RedisServiceError(f"Failed to read rate limits: {re}")
+
+
+def redis_set_rate_limit_overrides(redis_client: redis.Redis, limits: dict[str, str]):
+    try:
+        redis_client.hset(RATE_LIMIT_CONFIG_KEY, mapping=limits)
+    except redis.RedisError as re:
+        log_error(f"Failed to store rate limits: {re}")
+        raise RedisServiceError(f"Failed to store rate limits: {re}")
+
+
+def redis_delete_rate_limit_override(redis_client: redis.Redis, name: str) -> bool:
+    try:
+        return bool(redis_client.hdel(RATE_LIMIT_CONFIG_KEY, name))
+    except redis.RedisError as re:
+        log_error(f"Failed to reset rate limit: {re}")
+        raise RedisServiceError(f"Failed to reset rate limit: {re}")
@@ -1,14 +1,20 @@
-import pandas as pd
-import numpy as np
-import os
+from app.utils.ChessPositions.positions_store import get_positions_store
 
-# Get current file's directory
-current_dir = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(current_dir, 'positions.csv')
+# Positions are served from the memory-mapped store built out of positions.csv
+# by `python -m app.utils.ChessPositions.positions_store`. Nothing is read until
+# the store is first queried.
 
-chess_df = pd.read_csv(file_path)
-print(chess_df.iloc[0])
 
-# fetch out fen, score mate, opening.
+def get_chess_positions():
+    """Returns the positions store, raising PositionsStoreError when it has not
+    been built. The CSV is never converted here."""
+    store = get_positions_store()
+    store.meta  # fails fast when the store has not been built
+    return store
+
 
-  
\ No newline at end of file
+if __name__ == "__main__":
+    store = get_chess_positions()
+    print(store.row(0))
+
+# fetch out fen, score mate, opening.
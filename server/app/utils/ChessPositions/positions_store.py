@@ -0,0 +1,325 @@
+# flake8: noqa
+import os
+import json
+import hashlib
+import argparse
+import threading
+import numpy as np
+from app.utils.error_handling import log_success, log_error, ChessGameError
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV_PATH = os.path.join(current_dir, "positions.csv")
+DEFAULT_STORE_DIR = os.getenv(
+    "POSITIONS_STORE_DIR", os.path.join(current_dir, "positions_store")
+)
+
+STORE_VERSION = 1
+FEN_WIDTH = 100  # longest legal FEN is ~90 bytes
+NO_MATE = 0
+NO_OPENING = -1
+
+# Accepted CSV header names for each column (matched case-insensitively)
+_COLUMN_CANDIDATES = {
+    "fen": ["fen"],
+    "score": ["score", "eval", "evaluation", "cp"],
+    "mate": ["mate", "mate_in"],
+    "opening": ["opening", "opening_name", "eco"],
+}
+
+
+class PositionsStoreError(ChessGameError):
+    pass
+
+
+def fen_key(fen: str) -> str:
+    """Placement, side to move, castling and en passant. Move counters are ignored."""
+    return " ".join(fen.split()[:4])
+
+
+def fen_hash(fen: str) -> int:
+    digest = hashlib.blake2b(fen_key(fen).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _resolve_columns(header: list[str]) -> dict[str, str | None]:
+    lowered = {h.lower().strip(): h for h in header}
+    resolved = {}
+    for column, candidates in _COLUMN_CANDIDATES.items():
+        resolved[column] = next((lowered[c] for c in candidates if c in lowered), None)
+    if resolved["fen"] is None:
+        raise PositionsStoreError(f"No FEN column found in CSV header: {header}")
+    return resolved
+
+
+def _build_fen_table(hashes: np.ndarray, fens: np.ndarray) -> np.ndarray:
+    """Open addressing (linear probing) table mapping fen hash -> row id."""
+    size = 1
+    while size < 2 * max(len(hashes), 1):
+        size <<= 1
+    mask = size - 1
+    table = [-1] * size
+    hash_list = hashes.tolist()
+    for row, h in enumerate(hash_list):
+        slot = h & mask
+        while table[slot] != -1:
+            other = table[slot]
+            if hash_list[other] == h and fen_key(fens[other].decode()) == fen_key(
+                fens[row].decode()
+            ):
+                break  # duplicate position, the first row wins
+            slot = (slot + 1) & mask
+        else:
+            table[slot] = row
+    return np.array(table, dtype=np.int64)
+
+
+def _build_group_index(codes: np.ndarray, n_groups: int):
+    """CSR style index: rows of group g are rows[offsets[g]:offsets[g + 1]]"""
+    order = np.argsort(codes, kind="stable").astype(np.int64)
+    counts = np.bincount(codes[codes >= 0], minlength=n_groups)
+    offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    # Rows without a group sort first, skip them
+    skipped = int(np.count_nonzero(codes < 0))
+    return order[skipped:], offsets
+
+
+def convert_csv_to_store(
+    csv_path: str = DEFAULT_CSV_PATH,
+    store_dir: str = DEFAULT_STORE_DIR,
+    chunksize: int = 100_000,
+) -> dict:
+    """One-time conversion of positions.csv into memory-mappable .npy columns."""
+    import pandas as pd
+
+    if not os.path.isfile(csv_path):
+        raise PositionsStoreError(f"Positions CSV not found: {csv_path}")
+
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+    columns = _resolve_columns(header)
+    usecols = [c for c in columns.values() if c is not None]
+
+    fens, scores, mates, opening_codes = [], [], [], []
+    openings: dict[str, int] = {}
+
+    for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=chunksize):
+        fens.append(chunk[columns["fen"]].astype(str).to_numpy(dtype=f"S{FEN_WIDTH}"))
+
+        if columns["score"] is not None:
+            score = pd.to_numeric(chunk[columns["score"]], errors="coerce")
+            scores.append(score.to_numpy(dtype=np.float32, na_value=np.nan))
+        else:
+            scores.append(np.full(len(chunk), np.nan, dtype=np.float32))
+
+        if columns["mate"] is not None:
+            mate = pd.to_numeric(chunk[columns["mate"]], errors="coerce").fillna(
+                NO_MATE
+            )
+            mates.append(mate.to_numpy(dtype=np.int16))
+        else:
+            mates.append(np.full(len(chunk), NO_MATE, dtype=np.int16))
+
+        if columns["opening"] is not None:
+            codes = np.array(
+                [
+                    (
+                        openings.setdefault(o, len(openings))
+                        if isinstance(o, str)
+                        else NO_OPENING
+                    )
+                    for o in chunk[columns["opening"]].tolist()
+                ],
+                dtype=np.int32,
+            )
+            opening_codes.append(codes)
+        else:
+            opening_codes.append(np.full(len(chunk), NO_OPENING, dtype=np.int32))
+
+    fen_col = np.concatenate(fens) if fens else np.array([], dtype=f"S{FEN_WIDTH}")
+    score_col = np.concatenate(scores) if scores else np.array([], dtype=np.float32)
+    mate_col = np.concatenate(mates) if mates else np.array([], dtype=np.int16)
+    opening_col = (
+        np.concatenate(opening_codes) if opening_codes else np.array([], dtype=np.int32)
+    )
+
+    hashes = np.array([fen_hash(f.decode()) for f in fen_col], dtype=np.uint64)
+    fen_table = _build_fen_table(hashes, fen_col)
+    opening_rows, opening_offsets = _build_group_index(opening_col, len(openings))
+    # Rows ordered by score (NaN last) for range queries through searchsorted
+    score_order = np.argsort(score_col, kind="stable").astype(np.int64)
+    score_sorted = score_col[score_order]
+
+    os.makedirs(store_dir, exist_ok=True)
+    arrays = {
+        "fen": fen_col,
+        "score": score_col,
+        "mate": mate_col,
+        "opening": opening_col,
+        "fen_hash": hashes,
+        "fen_table": fen_table,
+        "opening_rows": opening_rows,
+        "opening_offsets": opening_offsets,
+        "score_order": score_order,
+        "score_sorted": score_sorted,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(store_dir, f"{name}.npy"), array)
+
+    meta = {
+        "version": STORE_VERSION,
+        "rows": int(len(fen_col)),
+        "source": os.path.abspath(csv_path),
+        "openings": list(openings.keys()),
+    }
+    with open(os.path.join(store_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    log_success(
+        "Converted %s positions (%s openings) into %s",
+        meta["rows"],
+        len(openings),
+        store_dir,
+    )
+    return meta
+
+
+class PositionsStore:
+    """Read-only view over the converted store. Columns are memory-mapped
+    on first use, so constructing the object costs nothing."""
+
+    def __init__(self, store_dir: str = DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        self._columns: dict[str, np.ndarray] = {}
+        self._meta: dict | None = None
+        self._opening_codes: dict[str, int] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def meta(self) -> dict:
+        if self._meta is None:
+            meta_path = os.path.join(self.store_dir, "meta.json")
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except FileNotFoundError:
+                raise PositionsStoreError(
+                    f"Positions store not found at {self.store_dir}, run the converter first"
+                )
+            if meta.get("version") != STORE_VERSION:
+                raise PositionsStoreError(
+                    f"Positions store version {meta.get('version')} is not supported"
+                )
+            self._meta = meta
+        return self._meta
+
+    def _column(self, name: str) -> np.ndarray:
+        column = self._columns.get(name)
+        if column is None:
+            with self._lock:
+                column = self._columns.get(name)
+                if column is None:
+                    self.meta  # validates the store before mapping anything
+                    column = np.load(
+                        os.path.join(self.store_dir, f"{name}.npy"), mmap_mode="r"
+                    )
+                    self._columns[name] = column
+        return column
+
+    def column(self, name: str) -> np.ndarray:
+        """Memory-mapped column or index array by file name, e.g. 'fen'"""
+        return self._column(name)
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    @property
+    def openings(self) -> list[str]:
+        return self.meta["openings"]
+
+    def row(self, row_id: int) -> dict:
+        opening_code = int(self._column("opening")[row_id])
+        score = float(self._column("score")[row_id])
+        mate = int(self._column("mate")[row_id])
+        return {
+            "id": int(row_id),
+            "fen": self._column("fen")[row_id].decode(),
+            "score": None if np.isnan(score) else score,
+            "mate": None if mate == NO_MATE else mate,
+            "opening": (
+                None if opening_code == NO_OPENING else self.openings[opening_code]
+            ),
+        }
+
+    def lookup_fen(self, fen: str) -> dict | None:
+        """O(1) lookup of a position by FEN (move counters ignored)"""
+        table = self._column("fen_table")
+        hashes = self._column("fen_hash")
+        fens = self._column("fen")
+        if len(table) == 0:
+            return None
+        h = fen_hash(fen)
+        key = fen_key(fen)
+        mask = len(table) - 1
+        slot = h & mask
+        while True:
+            row_id = int(table[slot])
+            if row_id == -1:
+                return None
+            if int(hashes[row_id]) == h and fen_key(fens[row_id].decode()) == key:
+                return self.row(row_id)
+            slot = (slot + 1) & mask
+
+    def opening_code(self, opening: str) -> int | None:
+        if self._opening_codes is None:
+            self._opening_codes = {name: i for i, name in enumerate(self.openings)}
+        return self._opening_codes.get(opening)
+
+    def rows_for_opening(self, opening: str) -> np.ndarray:
+        """Row ids of all positions from an opening, an O(1) slice of the index"""
+        code = self.opening_code(opening)
+        if code is None:
+            return np.array([], dtype=np.int64)
+        offsets = self._column("opening_offsets")
+        return self._column("opening_rows")[offsets[code] : offsets[code + 1]]
+
+    def rows_in_eval_range(self, min_score: float, max_score: float) -> np.ndarray:
+        """Row ids with min_score <= score <= max_score, via binary search"""
+        order = self._column("score_order")
+        # NaN scores sort last, so they never fall inside a finite range
+        sorted_scores = self._column("score_sorted")
+        lo = np.searchsorted(sorted_scores, min_score, side="left")
+        hi = np.searchsorted(sorted_scores, max_score, side="right")
+        return order[lo:hi]
+
+    def rows_with_mate(self, mate_in: int | None = None) -> np.ndarray:
+        """Row ids with a forced mate, optionally exactly mate in N (signed)"""
+        mates = self._column("mate")
+        if mate_in is None:
+            return np.flatnonzero(mates != NO_MATE)
+        return np.flatnonzero(mates == mate_in)
+
+
+_store: PositionsStore | None = None
+
+
+def get_positions_store() -> PositionsStore:
+    """Shared lazily opened store"""
+    global _store
+    if _store is None:
+        _store = PositionsStore()
+    return _store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert positions.csv into the memory-mapped positions store"
+    )
+    parser.add_argument("--csv", default=DEFAULT_CSV_PATH)
+    parser.add_argument("--out", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args()
+    try:
+        convert_csv_to_store(args.csv, args.out, args.chunksize)
+    except PositionsStoreError as p:
+        log_error("Error while converting positions: %s", p)
+        raise SystemExit(1)
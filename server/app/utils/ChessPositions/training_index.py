@@ -0,0 +1,170 @@
+# flake8: noqa
+import os
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+from app.utils.ChessPositions.positions_store import (
+    PositionsStore,
+    NO_MATE,
+)
+from app.utils.ChessPositions.analysis import get_chess_positions
+from app.utils.error_handling import log_success, ChessGameError
+
+load_dotenv()
+
+# Random draws from the smallest matching set before intersecting the sets
+TRAINING_MAX_REJECTIONS = int(os.getenv("TRAINING_MAX_REJECTIONS", "64"))
+# Combined filters whose intersected row ids are kept
+TRAINING_FILTER_CACHE_SIZE = int(os.getenv("TRAINING_FILTER_CACHE_SIZE", "128"))
+
+
+class TrainingIndexError(ChessGameError):
+    pass
+
+
+class TrainingIndex:
+    """Random training positions by opening, eval range and mate distance.
+
+    Each filter maps to an array of row ids: the store's opening slices and
+    score order, plus one array per mate distance built here on first use.
+    A pick draws uniformly from the smallest matching array and checks the
+    other filters on that one row, so no request scans the dataset. Sparse
+    combinations fall back to an intersection that is cached."""
+
+    def __init__(self, store: PositionsStore, seed: int | None = None):
+        self.store = store
+        self._rng = np.random.default_rng(seed)
+        self._mate_rows: dict[int, np.ndarray] | None = None
+        self._any_mate: np.ndarray | None = None
+        self._combined: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build_mate_index(self):
+        with self._lock:
+            if self._mate_rows is not None:
+                return
+            mates = np.asarray(self.store.column("mate"))
+            rows = np.flatnonzero(mates != NO_MATE)
+            # group rows by mate distance, each group a slice of one array
+            order = rows[np.argsort(mates[rows], kind="stable")]
+            values, starts = np.unique(mates[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            self._mate_rows = {
+                int(value): order[start:end]
+                for value, start, end in zip(values, starts, ends)
+            }
+            self._any_mate = rows
+            log_success(
+                "Training mate index built: %s positions, %s distances",
+                len(rows),
+                len(values),
+            )
+
+    def _candidate_sets(
+        self,
+        opening: str | None,
+        min_score: float | None,
+        max_score: float | None,
+        mate_in: int | None,
+        mate_only: bool,
+    ) -> list[np.ndarray]:
+        sets = []
+        if opening is not None:
+            sets.append(self.store.rows_for_opening(opening))
+        if min_score is not None or max_score is not None:
+            sets.append(
+                self.store.rows_in_eval_range(
+                    -math.inf if min_score is None else min_score,
+                    math.inf if max_score is None else max_score,
+                )
+            )
+        if mate_in is not None or mate_only:
+            self._build_mate_index()
+            if mate_in is not None:
+                empty = np.array([], dtype=np.int64)
+                sets.append(self._mate_rows.get(mate_in, empty))
+            else:
+                sets.append(self._any_mate)
+        return sets
+
+    def _matches(self, row: int, filters: dict) -> bool:
+        if filters["opening"] is not None:
+            code = self.store.opening_code(filters["opening"])
+            if int(self.store.column("opening")[row]) != code:
+                return False
+        score = float(self.store.column("score")[row])
+        if filters["min_score"] is not None and not score >= filters["min_score"]:
+            return False
+        if filters["max_score"] is not None and not score <= filters["max_score"]:
+            return False
+        mate = int(self.store.column("mate")[row])
+        if filters["mate_in"] is not None and mate != filters["mate_in"]:
+            return False
+        if filters["mate_only"] and mate == NO_MATE:
+            return False
+        return True
+
+    def _intersection(self, key: tuple, sets: list[np.ndarray]) -> np.ndarray:
+        with self._lock:
+            rows = self._combined.get(key)
+            if rows is not None:
+                self._combined.move_to_end(key)
+                return rows
+        rows = sets[0]
+        for other in sets[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        with self._lock:
+            self._combined[key] = rows
+            while len(self._combined) > TRAINING_FILTER_CACHE_SIZE:
+                self._combined.popitem(last=False)
+        return rows
+
+    def pick(
+        self,
+        opening: str | None = None,
+        min_score: float | None = None,
+        max_score: float | None = None,
+        mate_in: int | None = None,
+        mate_only: bool = False,
+    ) -> dict:
+        """One random position matching every given filter"""
+        filters = {
+            "opening": opening,
+            "min_score": min_score,
+            "max_score": max_score,
+            "mate_in": mate_in,
+            "mate_only": mate_only,
+        }
+        sets = sorted(self._candidate_sets(**filters), key=len)
+        if not sets:
+            if len(self.store) == 0:
+                raise TrainingIndexError("The positions dataset is empty")
+            return self.store.row(int(self._rng.integers(len(self.store))))
+
+        smallest = sets[0]
+        if len(smallest) == 0:
+            raise TrainingIndexError("No position matches these filters")
+        for _ in range(TRAINING_MAX_REJECTIONS if len(sets) > 1 else 1):
+            row = int(smallest[self._rng.integers(len(smallest))])
+            if len(sets) == 1 or self._matches(row, filters):
+                return self.store.row(row)
+
+        rows = self._intersection(tuple(filters.values()), sets)
+        if len(rows) == 0:
+            raise TrainingIndexError("No position matches these filters")
+        return self.store.row(int(rows[self._rng.integers(len(rows))]))
+
+
+_index: TrainingIndex | None = None
+
+
+def get_training_index() -> TrainingIndex:
+    """Shared index over the positions store, opened on first use. The store
+    is never converted here, a missing one raises PositionsStoreError until
+    `python -m app.utils.ChessPositions.positions_store` has built it."""
+    global _index
+    if _index is None:
+        _index = TrainingIndex(get_chess_positions())
+    return _index
@@ -1,11 +1,11 @@
 from typing import List
 import chess
-import requests
 import os
 import json
 from dotenv import load_dotenv
 from fastapi import HTTPException
 from app.utils.error_handling import log_debug, log_error, ChessGameError
+from app.utils.tracing import traced
 
 load_dotenv()
 DIFY_API_KEY = os.getenv("DIFY_BETH_APP_KEY")
@@ -15,8 +15,11 @@ class DifyServiceError(ChessGameError):
     pass
 
 
+@traced("dify.ai_analysis")
 def run_ai_analysis(top_moves: str, fen: str, turn: chess.Color) -> str:
     to_play = "White" if turn else "Black"
+    import requests
+
     url = "https://api.dify.ai/v1/chat-messages"
 
     headers = {
@@ -1,9 +1,9 @@
-import requests
 import json
 import os
 from dotenv import load_dotenv
 from fastapi import HTTPException
 from app.utils.error_handling import log_debug, log_success, log_error, ChessGameError
+from app.utils.tracing import traced
 
 load_dotenv()
 DIFY_API_KEY = os.getenv("DIFY_APP_API")
@@ -13,11 +13,14 @@ class DifyServiceError(ChessGameError):
     pass
 
 
+@traced("dify.voice_to_move")
 def voice_to_move(user_input: str, current_fen: str):
     if user_input is None:
         raise HTTPException(status_code=400, detail="User input is required")
 
     """Converts voice input to move in SAN format using LLM."""
+    import requests  # loaded on the first LLM call, not at startup
+
     url = "https://api.dify.ai/v1/chat-messages"
 
     headers = {
@@ -1,29 +1,140 @@
-from colorama import Fore, Style, init
+import os
+import json
+import queue
+import atexit
+import random
 import logging
+from logging.handlers import QueueHandler, QueueListener
+from colorama import Fore, Style, init
+from dotenv import load_dotenv
+from app.utils.tracing import TraceIdFilter
 
 init()
+load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "console"
+# Keep-ratio per message type, e.g. "mongo.update=0.05,game.create=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+_TAG_COLORS = {"SUCCESS": Fore.GREEN, "DEBUG": Fore.BLUE}
 
 
 class ChessGameError(Exception):
     pass
 
 
-def log_error(message: str, error_type: str = "ERROR") -> None:
-    """Log an error message with color"""
-    colored_message = f"{Fore.RED}[{error_type}] {message}{Style.RESET_ALL}"
-    logger.error(colored_message)
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "type": getattr(record, "msg_type", None),
+            "logger": record.name,
+            "module": record.module,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Colored single line output for local development"""
+
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:[trace=%(trace_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "trace_id"):
+            record.trace_id = "-"
+        message = super().format(record)
+        tag = getattr(record, "tag", None)
+        if tag is None:
+            return message
+        color = _TAG_COLORS.get(tag, Fore.RED)
+        return f"{color}[{tag}] {message}{Style.RESET_ALL}"
+
+
+class _InProcessQueueHandler(QueueHandler):
+    """Defers message formatting to the listener thread.
+    The queue never leaves the process so the record can be passed as is."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_sample_rates(raw: str) -> dict[str, float]:
+    rates = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        msg_type, rate = item.split("=", 1)
+        try:
+            rates[msg_type.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def _setup_logging() -> QueueListener:
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        JsonFormatter() if LOG_FORMAT == "json" else ConsoleFormatter()
+    )
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _InProcessQueueHandler(log_queue)
+    # Runs on the calling thread, where the trace context is still active
+    queue_handler.addFilter(TraceIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+_listener = _setup_logging()
+_sample_rates = _parse_sample_rates(LOG_SAMPLE_RATES)
+logger = logging.getLogger(__name__)
+
+
+def _log(level: int, tag: str, message: str, args: tuple, msg_type: str | None):
+    # Level and sampling are checked before any formatting happens
+    if not logger.isEnabledFor(level):
+        return
+    msg_type = msg_type or tag.lower()
+    rate = _sample_rates.get(msg_type, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+    logger.log(
+        level,
+        message,
+        *args,
+        extra={"tag": tag, "msg_type": msg_type},
+        stacklevel=3,
+    )
+
+
+def log_error(
+    message: str, *args, error_type: str = "ERROR", msg_type: str | None = None
+) -> None:
+    """Log an error message, `args` are interpolated lazily with %-style"""
+    _log(logging.ERROR, error_type, message, args, msg_type)
 
 
-def log_success(message: str) -> None:
-    """Log a success message with color"""
-    colored_message = f"{Fore.GREEN}[SUCCESS] {message}{Style.RESET_ALL}"
-    logger.info(colored_message)
+def log_success(message: str, *args, msg_type: str | None = None) -> None:
+    """Log a success message, `args` are interpolated lazily with %-style"""
+    _log(logging.INFO, "SUCCESS", message, args, msg_type)
 
 
-def log_debug(message: str) -> None:
-    """Log a message for dubugging"""
-    colored_messsage = f"{Fore.BLUE}[DEBUG] {message} {Style.RESET_ALL}"
-    logger.info(colored_messsage)
+def log_debug(message: str, *args, msg_type: str | None = None) -> None:
+    """Log a message for debugging, dropped unless LOG_LEVEL is DEBUG"""
+    _log(logging.DEBUG, "DEBUG", message, args, msg_type)
@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from app.utils.error_handling import log_error, log_debug, ChessGameError
+
+load_dotenv()
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0.0"))
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.001"))  # seconds
+PROFILER_MAX_CAPTURES = int(os.getenv("PROFILER_MAX_CAPTURES", "20"))  # per endpoint
+PROFILES_DIR = os.getenv("PROFILES_DIR", "profiles")
+PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN")
+
+PYINSTRUMENT_AVAILABLE = False
+if PROFILER_ENABLED:  # pyinstrument is only imported when it can be used
+    try:
+        from pyinstrument import Profiler
+        from pyinstrument.frame import AWAIT_FRAME_IDENTIFIER
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        PYINSTRUMENT_AVAILABLE = True
+    except ImportError:  # profiling middleware becomes a pass-through
+        pass
+
+# A request carrying this header with the admin token is always profiled
+PROFILE_HEADER = "X-Profile-Request"
+
+# Source paths marking a sample as waiting on the engine, checked first since
+# the remote engine waits through Redis, then as Redis / Mongo I/O. Engine calls
+# normally run in a thread the profiler does not sample, their time comes from
+# record_engine_wait instead.
+_ENGINE_PATHS = ("chess/engine.py", "Engine/remote_engine.py")
+_IO_PATHS = ("/redis/", "/pymongo/", "/motor/")
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_\-][A-Za-z0-9_.\-]*$")
+
+# Per-request counters shared with the engine wrapper, None when not profiling
+_profile_stats: ContextVar[dict | None] = ContextVar("profile_stats", default=None)
+
+
+class ProfilerError(ChessGameError):
+    pass
+
+
+@contextmanager
+def record_engine_wait():
+    """Accounts the wrapped block as time spent waiting on the engine process"""
+    stats = _profile_stats.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats["engine_wait"] += time.perf_counter() - start
+
+
+def endpoint_slug(path: str) -> str:
+    """'/api/play_move/' -> 'api_play_move'"""
+    return "_".join(part for part in path.split("/") if part) or "root"
+
+
+def is_admin_token(token: str | None) -> bool:
+    return bool(PROFILER_ADMIN_TOKEN) and token == PROFILER_ADMIN_TOKEN
+
+
+def _profile_trigger(request) -> str | None:
+    if not PROFILER_ENABLED or not PYINSTRUMENT_AVAILABLE:
+        return None
+    if is_admin_token(request.headers.get(PROFILE_HEADER)):
+        return "admin"
+    if PROFILER_SAMPLE_RATE > 0 and random.random() < PROFILER_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def split_samples(frame_records) -> dict:
+    """Seconds of this request's samples by what its stack was doing.
+
+    The profiler only samples the request's own context: "[await]" samples are
+    time the request sat suspended, everything else ran (or blocked) on its
+    behalf, so python_time excludes other requests' work. "engine" only holds
+    engine calls made on the event loop thread."""
+    split = {"python": 0.0, "engine": 0.0, "io": 0.0, "awaiting": 0.0}
+    for stack, seconds in frame_records:
+        frames = "".join(stack)
+        if any(path in frames for path in _ENGINE_PATHS):
+            split["engine"] += seconds
+        elif any(path in frames for path in _IO_PATHS):
+            split["io"] += seconds
+        elif stack and stack[-1] == AWAIT_FRAME_IDENTIFIER:
+            split["awaiting"] += seconds
+        else:
+            split["python"] += seconds
+    return split
+
+
+def _write_capture(profiler, meta: dict):
+    endpoint_dir = os.path.join(PROFILES_DIR, meta["endpoint"])
+    os.makedirs(endpoint_dir, exist_ok=True)
+
+    base = os.path.join(endpoint_dir, meta["capture_id"])
+    with open(f"{base}.speedscope.json", "w") as f:
+        f.write(profiler.output(renderer=SpeedscopeRenderer()))
+    with open(f"{base}.html", "w") as f:
+        f.write(profiler.output_html())
+    with open(f"{base}.meta.json", "w") as f:
+        json.dump(meta, f)
+
+    # Keep only the newest captures for this endpoint
+    captures = sorted(
+        name[: -len(".meta.json")]
+        for name in os.listdir(endpoint_dir)
+        if name.endswith(".meta.json")
+    )
+    for stale in captures[:-PROFILER_MAX_CAPTURES]:
+        for suffix in (".speedscope.json", ".html", ".meta.json"):
+            try:
+                os.remove(os.path.join(endpoint_dir, stale + suffix))
+            except FileNotFoundError:
+                pass
+
+
+async def profile_requests(request, call_next):
+    """HTTP middleware profiling sampled requests and admin-flagged requests.
+
+    Engine wait (time blocked on Stockfish) is recorded separately from the
+    Python time spent on the event loop thread while serving the request."""
+    trigger = _profile_trigger(request)
+    if trigger is None:
+        return await call_next(request)
+
+    stats = {"engine_wait": 0.0}
+    token = _profile_stats.set(stats)
+    profiler = Profiler(interval=PROFILER_INTERVAL, async_mode="enabled")
+    wall_start = time.perf_counter()
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+        _profile_stats.reset(token)
+
+    wall_time = time.perf_counter() - wall_start
+    split = split_samples(profiler.last_session.frame_records)
+    # Engine calls in a worker thread leave the request suspended, that part
+    # of the await samples is the engine's and not other requests'
+    engine_in_thread = max(0.0, stats["engine_wait"] - split["engine"])
+    meta = {
+        "capture_id": f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}",
+        "endpoint": endpoint_slug(request.url.path),
+        "method": request.method,
+        "path": request.url.path,
+        "trigger": trigger,
+        "status_code": response.status_code,
+        "captured_at": time.time(),
+        "wall_time": wall_time,
+        # measured around each engine call, wherever it ran
+        "engine_wait_time": stats["engine_wait"],
+        # from this request's samples
+        "python_time": split["python"],
+        "io_wait_time": split["io"],
+        "awaiting_other_time": max(0.0, split["awaiting"] - engine_in_thread),
+    }
+    try:
+        await asyncio.to_thread(_write_capture, profiler, meta)
+        log_debug("Stored profile %s for %s", meta["capture_id"], meta["endpoint"])
+    except Exception as e:
+        log_error(f"Error while storing profile capture: {e}")
+
+    response.headers["X-Profile-Capture"] = f"{meta['endpoint']}/{meta['capture_id']}"
+    return response
+
+
+def list_captures() -> list[dict]:
+    """Metadata of all stored captures, newest first"""
+    captures = []
+    if not os.path.isdir(PROFILES_DIR):
+        return captures
+    for endpoint in os.listdir(PROFILES_DIR):
+        endpoint_dir = os.path.join(PROFILES_DIR, endpoint)
+        if not os.path.isdir(endpoint_dir):
+            continue
+        for name in os.listdir(endpoint_dir):
+            if not name.endswith(".meta.json"):
+                continue
+            try:
+                with open(os.path.join(endpoint_dir, name)) as f:
+                    captures.append(json.load(f))
+            except (OSError, ValueError) as e:
+                log_error(f"Skipping unreadable profile metadata {name}: {e}")
+    captures.sort(key=lambda c: c["captured_at"], reverse=True)
+    return captures
+
+
+def get_capture_path(endpoint: str, capture_id: str, fmt: str) -> str:
+    """Resolves a stored capture file, fmt is 'speedscope' or 'html'"""
+    if not _SAFE_NAME.match(endpoint) or not _SAFE_NAME.match(capture_id):
+        raise ProfilerError("Invalid capture reference")
+    suffix = {"speedscope": ".speedscope.json", "html": ".html"}.get(fmt)
+    if suffix is None:
+        raise ProfilerError(f"Unknown capture format: {fmt}")
+    path = os.path.join(PROFILES_DIR, endpoint, capture_id + suffix)
+    if not os.path.isfile(path):
+        raise ProfilerError(f"Capture not found: {endpoint}/{capture_id}")
+    return path
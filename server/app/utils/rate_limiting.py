@@ -0,0 +1,169 @@
+import os
+import math
+import time
+from dataclasses import dataclass
+from fastapi import HTTPException, Request
+from dotenv import load_dotenv
+from app.services.redis.redis_services import (
+    redis_take_tokens,
+    redis_get_rate_limit_overrides,
+    rate_limit_key,
+    RedisServiceError,
+)
+from app.utils.error_handling import log_error, log_debug, ChessGameError
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Take the client from X-Forwarded-For, only behind proxies that append to it.
+# The dispatcher turns this on for its workers.
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+# Proxies in front of the API that append to X-Forwarded-For. The client is the
+# address the outermost of them saw, anything before it can be forged.
+RATE_LIMIT_PROXY_HOPS = max(1, int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1")))
+# Seconds a worker reuses the limits before re-reading the Redis overrides
+RATE_LIMIT_CONFIG_TTL = float(os.getenv("RATE_LIMIT_CONFIG_TTL", "5"))
+
+# "<scope>.<client|game>" -> "<burst>/<seconds>": up to `burst` requests at
+# once, refilled evenly over `seconds`
+DEFAULT_RATE_LIMITS = {
+    "move.client": "60/60",
+    "move.game": "30/60",
+    "analysis.client": "10/60",
+    "analysis.game": "6/60",
+    "llm.client": "5/60",
+    "llm.game": "3/60",
+}
+SUBJECTS = ("client", "game")
+
+
+class RateLimitError(ChessGameError):
+    pass
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    burst: float
+    seconds: float
+
+    @property
+    def per_second(self) -> float:
+        return self.burst / self.seconds
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateLimit":
+        try:
+            burst, seconds = spec.split("/", 1)
+            limit = cls(float(burst), float(seconds))
+        except ValueError:
+            raise RateLimitError(f"Invalid rate limit {spec!r}, expected burst/seconds")
+        if limit.burst <= 0 or limit.seconds <= 0:
+            raise RateLimitError(f"Rate limit {spec!r} must be positive")
+        return limit
+
+    def __str__(self) -> str:
+        return f"{self.burst:g}/{self.seconds:g}"
+
+
+def _parse_env_limits(raw: str) -> dict[str, str]:
+    limits = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        name, spec = item.split("=", 1)
+        limits[name.strip()] = spec.strip()
+    return limits
+
+
+# RATE_LIMITS="analysis.client=20/60,llm.game=1/30" overrides single defaults
+_defaults = {**DEFAULT_RATE_LIMITS, **_parse_env_limits(os.getenv("RATE_LIMITS", ""))}
+_cached: tuple[float, dict[str, RateLimit]] | None = None
+
+
+def validate_limit_name(name: str):
+    scope, _, subject = name.partition(".")
+    if subject not in SUBJECTS or f"{scope}.client" not in _defaults:
+        raise RateLimitError(f"Unknown rate limit {name!r}")
+
+
+def effective_limits(redis_client) -> dict[str, RateLimit]:
+    """Defaults with the runtime overrides stored in Redis applied, cached
+    briefly so the check stays a single round-trip"""
+    global _cached
+    now = time.monotonic()
+    if _cached is not None and _cached[0] > now:
+        return _cached[1]
+    specs = dict(_defaults)
+    try:
+        specs.update(redis_get_rate_limit_overrides(redis_client))
+    except RedisServiceError:
+        pass  # keep enforcing the defaults
+    limits = {}
+    for name, spec in specs.items():
+        try:
+            limits[name] = RateLimit.parse(spec)
+        except RateLimitError as e:
+            log_error(f"Ignoring rate limit {name}: {e}")
+    _cached = (now + RATE_LIMIT_CONFIG_TTL, limits)
+    return limits
+
+
+def invalidate_limits():
+    global _cached
+    _cached = None
+
+
+def client_address(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            hops = [hop.strip() for hop in forwarded.split(",")]
+            return hops[-min(RATE_LIMIT_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limited(scope: str):
+    """Route dependency charging one token to the caller's and the game's
+    bucket for `scope`, answering 429 with Retry-After when either is empty"""
+
+    def check(request: Request):
+        redis_client = request.app.state.redis_client
+        if not RATE_LIMIT_ENABLED or not redis_client:
+            return
+        limits = effective_limits(redis_client)
+        subjects = {"client": client_address(request)}
+        game_id = request.query_params.get("game_id")
+        if game_id:
+            subjects["game"] = game_id
+        buckets = []
+        for subject, value in subjects.items():
+            limit = limits.get(f"{scope}.{subject}")
+            if limit is not None:
+                buckets.append(
+                    (
+                        rate_limit_key(f"{scope}.{subject}", value),
+                        limit.burst,
+                        limit.per_second,
+                    )
+                )
+        if not buckets:
+            return
+        try:
+            wait = redis_take_tokens(redis_client, buckets)
+        except RedisServiceError:
+            return  # admission control never takes the API down with it
+        if wait > 0:
+            log_debug(
+                "Rate limited %s for %s (%.1fs)",
+                scope,
+                subjects,
+                wait,
+                msg_type="rate_limit",
+            )
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many {scope} requests, retry later",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    return check
@@ -0,0 +1,107 @@
+# flake8: noqa
+"""Cold start time of the API, each run in a fresh interpreter.
+
+    python -m app.utils.startup_benchmark --runs 5 --max-import-ms 1500
+
+Reports the time to import app.main and to run the startup half of the
+lifespan (Redis, Mongo and the engine, against whatever the environment points
+to), plus the slowest imports. With a budget the exit code is 1 when the
+median goes over it, so CI can catch a feature that slows cold start down.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+RESULT_PREFIX = "STARTUP_BENCHMARK "
+
+_CHILD = """
+import time
+started = time.perf_counter()
+import app.main as main
+imported = time.perf_counter()
+ready = {}
+if LIFESPAN:
+    import asyncio
+
+    async def start():
+        async with main.app.router.lifespan_context(main.app):
+            return time.perf_counter(), {
+                name: status["ready"] for name, status in main.app.state.startup.items()
+            }
+
+    finished, ready = asyncio.run(start())
+else:
+    finished = imported
+print(RESULT_PREFIX + json.dumps(
+    {"import": imported - started, "startup": finished - imported, "ready": ready}
+), flush=True)
+"""
+
+
+def run_once(lifespan: bool) -> dict:
+    code = f"import json\nLIFESPAN = {lifespan}\nRESULT_PREFIX = {RESULT_PREFIX!r}\n"
+    completed = subprocess.run(
+        [sys.executable, "-c", code + _CHILD],
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX) :])
+    raise RuntimeError(f"Benchmark run failed:\n{completed.stderr[-2000:]}")
+
+
+def slowest_imports(top: int) -> list[tuple[str, float]]:
+    """Modules with the largest cumulative import time, from -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times.append((name.strip(), int(cumulative) / 1000))
+    return sorted(times, key=lambda item: item[1], reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API cold start time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports shown")
+    parser.add_argument(
+        "--no-lifespan", action="store_true", help="only time the import"
+    )
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-startup-ms", type=float)
+    args = parser.parse_args()
+
+    runs = [run_once(not args.no_lifespan) for _ in range(args.runs)]
+    import_ms = statistics.median(run["import"] for run in runs) * 1000
+    startup_ms = statistics.median(run["startup"] for run in runs) * 1000
+    print(f"{'import app.main':<20}{import_ms:>10.0f} ms")
+    if not args.no_lifespan:
+        print(f"{'lifespan startup':<20}{startup_ms:>10.0f} ms")
+        for name, ready in runs[-1]["ready"].items():
+            print(f"  {name:<18}{'ready' if ready else 'not ready':>10}")
+    if args.top:
+        print("\nslowest imports (cumulative)")
+        for name, ms in slowest_imports(args.top):
+            print(f"  {name:<50}{ms:>8.1f} ms")
+
+    over = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        over.append(f"import {import_ms:.0f} ms > {args.max_import_ms:.0f} ms")
+    if args.max_startup_ms is not None and startup_ms > args.max_startup_ms:
+        over.append(f"startup {startup_ms:.0f} ms > {args.max_startup_ms:.0f} ms")
+    if over:
+        print("\nover budget: " + ", ".join(over))
+        raise SystemExit(1)
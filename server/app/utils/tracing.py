@@ -0,0 +1,143 @@
+import os
+import inspect
+import functools
+import logging
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        ConsoleSpanExporter,
+        SpanExporter,
+        SpanExportResult,
+    )
+
+    OTEL_AVAILABLE = True
+except ImportError:  # tracing becomes a no-op when the SDK is not installed
+    OTEL_AVAILABLE = False
+
+load_dotenv()
+
+# "console", "file" or "none"
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "chess-with-beth")
+
+_NO_TRACE_ID = "-"
+
+if OTEL_AVAILABLE:
+
+    class FileSpanExporter(SpanExporter):
+        """Writes finished spans as one JSON document per line"""
+
+        def __init__(self, file_path: str):
+            self.file_path = file_path
+
+        def export(self, spans):
+            try:
+                with open(self.file_path, "a") as f:
+                    for s in spans:
+                        f.write(s.to_json(indent=None) + "\n")
+                return SpanExportResult.SUCCESS
+            except OSError:
+                return SpanExportResult.FAILURE
+
+        def shutdown(self):
+            pass
+
+
+def setup_tracing(exporter: str = TRACING_EXPORTER) -> bool:
+    """Installs a tracer provider with the configured exporter.
+    Returns False when tracing stays disabled."""
+    if not OTEL_AVAILABLE or exporter == "none":
+        return False
+
+    if exporter == "file":
+        span_exporter = FileSpanExporter(TRACING_FILE)
+    elif exporter == "console":
+        span_exporter = ConsoleSpanExporter()
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {exporter}")
+
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(provider)
+    return True
+
+
+def shutdown_tracing():
+    """Flushes pending spans"""
+    if not OTEL_AVAILABLE:
+        return
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Opens a child span of the current span for the duration of the block"""
+    if not OTEL_AVAILABLE:
+        yield None
+        return
+    tracer = trace.get_tracer("chess-with-beth")
+    with tracer.start_as_current_span(name, attributes=attributes) as s:
+        yield s
+
+
+def traced(name: str):
+    """Decorator wrapping a sync or async function in a span"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_trace_id() -> str:
+    """Hex trace id of the active span, or '-' outside of a trace"""
+    if not OTEL_AVAILABLE:
+        return _NO_TRACE_ID
+    ctx = trace.get_current_span().get_span_context()
+    if not ctx.is_valid:
+        return _NO_TRACE_ID
+    return format(ctx.trace_id, "032x")
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds the active trace id to every log record as `trace_id`"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        return True
+
+
+async def trace_requests(request, call_next):
+    """HTTP middleware opening the root span for each request"""
+    with span(
+        f"{request.method} {request.url.path}",
+        **{"http.method": request.method, "http.route": request.url.path},
+    ) as s:
+        response = await call_next(request)
+        if s is not None:
+            s.set_attribute("http.status_code", response.status_code)
+            response.headers["X-Trace-Id"] = current_trace_id()
+        return response
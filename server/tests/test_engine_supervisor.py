@@ -0,0 +1,122 @@
+# flake8: noqa
+"""EngineSupervisor against a minimal UCI engine that takes its time to move.
+
+    cd server && python -m pytest tests
+"""
+
+import sys
+import asyncio
+import textwrap
+import chess
+import chess.engine
+import pytest
+
+from app.Domains.Engine import engine_supervisor
+from app.Domains.Engine.engine_supervisor import EngineSupervisor
+
+SEARCH_SECONDS = 0.4
+
+# Answers every `go` after SEARCH_SECONDS, or at once on `stop`, and logs the
+# commands it receives
+SLOW_UCI = textwrap.dedent("""
+    import sys, threading
+    log = open(sys.argv[1], "a", buffering=1)
+    lock = threading.Lock()
+    pending = []
+
+    def out(line):
+        sys.stdout.write(line + "\\n")
+        sys.stdout.flush()
+
+    def answer(timer):
+        with lock:
+            if timer not in pending:
+                return
+            pending.remove(timer)
+            out("info depth 1 score cp 20 pv e2e4")
+            out("bestmove e2e4")
+
+    for line in sys.stdin:
+        log.write(line)
+        command = line.split()[0] if line.split() else ""
+        if command == "uci":
+            out("id name SlowFish")
+            out("uciok")
+        elif command == "isready":
+            out("readyok")
+        elif command == "go":
+            timer = threading.Timer({delay}, lambda: answer(timer))
+            with lock:
+                pending.append(timer)
+            timer.start()
+        elif command == "stop":
+            for timer in list(pending):
+                timer.cancel()
+                answer(timer)
+        elif command == "quit":
+            break
+    """).format(delay=SEARCH_SECONDS)
+
+
+@pytest.fixture
+def supervisor(tmp_path):
+    script = tmp_path / "slow_uci.py"
+    script.write_text(SLOW_UCI)
+    log = tmp_path / "uci.log"
+    supervisor = EngineSupervisor([sys.executable, str(script), str(log)])
+    supervisor.uci_log = log
+    yield supervisor
+    supervisor.quit()
+
+
+def play(supervisor: EngineSupervisor, limit: chess.engine.Limit):
+    return supervisor.call(
+        lambda engine: engine.play(chess.Board(), limit=limit), limit=limit
+    )
+
+
+def test_concurrent_moves_on_one_engine_run_one_at_a_time(supervisor, monkeypatch):
+    # the second move queues for a whole search, longer than its watchdog
+    monkeypatch.setattr(engine_supervisor, "ENGINE_WATCHDOG_GRACE", 0.2)
+    limit = chess.engine.Limit(time=SEARCH_SECONDS)
+
+    async def main():
+        return await asyncio.gather(
+            asyncio.to_thread(play, supervisor, limit),
+            asyncio.to_thread(play, supervisor, limit),
+        )
+
+    results = asyncio.run(main())
+    assert [result.move.uci() for result in results] == ["e2e4", "e2e4"]
+    commands = [
+        line.split()[0] for line in supervisor.uci_log.read_text().split("\n") if line
+    ]
+    assert commands.count("go") == 2
+    assert "stop" not in commands
+    assert supervisor.watchdog_kills == 0
+    assert supervisor.crashes == 0
+
+
+def test_background_calls_give_way_to_queued_moves(supervisor):
+    limit = chess.engine.Limit(time=SEARCH_SECONDS)
+    finished = []
+
+    def search(name: str, background: bool):
+        supervisor.call(
+            lambda engine: engine.analyse(chess.Board(), limit=limit),
+            limit=limit,
+            background=background,
+        )
+        finished.append(name)
+
+    async def main():
+        first = asyncio.create_task(asyncio.to_thread(search, "move 1", False))
+        await asyncio.sleep(0.1)
+        review = asyncio.create_task(asyncio.to_thread(search, "review", True))
+        await asyncio.sleep(0.1)
+        second = asyncio.create_task(asyncio.to_thread(search, "move 2", False))
+        await asyncio.gather(first, review, second)
+
+    asyncio.run(main())
+    assert finished == ["move 1", "move 2", "review"]
+    assert "stop" not in supervisor.uci_log.read_text()
@@ -0,0 +1,209 @@
+# flake8: noqa
+"""EngineWorker and RemoteEngineClient against an in-process Redis stand-in.
+
+    cd server && python -m pytest tests
+"""
+
+import time
+import asyncio
+import threading
+import chess
+import chess.engine
+import pytest
+from chess.engine import PlayResult
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.Domains.Engine import engine_worker
+from app.Domains.Engine.engine_worker import EngineWorker
+from app.Domains.Engine.remote_engine import (
+    ENGINE_JOB_STREAM,
+    ENGINE_CONSUMER_GROUP,
+    RemoteEngineClient,
+    RemoteEngineError,
+    EngineBusyError,
+    EngineTimeoutError,
+)
+from app.Domains.Game.chess_game import ChessGame
+
+TOP_MOVES = [{"move": "e2e4", "score": "0.3"}, {"move": "d2d4", "score": "0.2"}]
+
+
+class FakeEngine:
+    """Answers like StockfishEngine without a Stockfish process"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.boards = []
+
+    def _search(self, board: chess.Board):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("engine crashed")
+        self.boards.append(board.copy())
+
+    def get_engine_move(self, board, user_elo, clock=None) -> PlayResult:
+        self._search(board)
+        move = next(iter(board.legal_moves))
+        score = chess.engine.PovScore(chess.engine.Cp(25), chess.WHITE)
+        return PlayResult(move, None, {"depth": 12, "pv": [move], "score": score})
+
+    def get_top_stockfish_moves(self, board):
+        self._search(board)
+        return TOP_MOVES
+
+    def evaluate_positions(self, fens, depth):
+        for fen in fens:
+            self._search(chess.Board(fen))
+        return [{"fen": fen, "error": None, "score": 20, "mate": 0} for fen in fens]
+
+
+@pytest.fixture
+def redis_client():
+    client = fakeredis.FakeRedis()
+    yield client
+    client.flushall()
+
+
+def serve(worker: EngineWorker, jobs: int = 1) -> threading.Thread:
+    """Runs the worker in the background until it has processed `jobs`"""
+
+    def run():
+        done = 0
+        while done < jobs:
+            done += worker.run_once(block_ms=50)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_analysis_job_round_trip(redis_client):
+    engine = FakeEngine()
+    worker = EngineWorker(redis_client, engine, consumer_name="w1")
+    client = RemoteEngineClient(redis_client, timeout=5)
+    thread = serve(worker)
+
+    board = chess.Board()
+    board.push_uci("e2e4")
+    assert client.get_top_stockfish_moves(board) == TOP_MOVES
+    thread.join(5)
+    # the worker rebuilds the board from the root, keeping its history
+    assert engine.boards[0].move_stack == board.move_stack
+    assert redis_client.xlen(ENGINE_JOB_STREAM) == 0
+
+
+def test_move_job_round_trip(redis_client):
+    worker = EngineWorker(redis_client, FakeEngine(), consumer_name="w1")
+    client = RemoteEngineClient(redis_client, timeout=5)
+    thread = serve(worker)
+
+    board = chess.Board()
+    result = client.get_engine_move(board, user_elo=1500)
+    thread.join(5)
+    assert result.move in board.legal_moves
+    assert result.info["depth"] == 12
+    assert result.info["score"].white() == chess.engine.Cp(25)
+
+
+def test_evaluate_job_round_trip(redis_client):
+    engine = FakeEngine()
+    worker = EngineWorker(redis_client, engine, consumer_name="w1")
+    client = RemoteEngineClient(redis_client, timeout=5)
+    thread = serve(worker)
+
+    fens = [chess.Board().fen(), chess.STARTING_FEN.replace(" w ", " b ")]
+    results = client.evaluate_positions(fens, depth=10)
+    thread.join(5)
+    assert [result["fen"] for result in results] == fens
+    assert len(engine.boards) == 2
+
+
+def test_worker_error_is_raised_to_the_caller(redis_client):
+    worker = EngineWorker(redis_client, FakeEngine(fail=True), consumer_name="w1")
+    client = RemoteEngineClient(redis_client, timeout=5)
+    thread = serve(worker)
+
+    with pytest.raises(RemoteEngineError, match="engine crashed"):
+        client.get_top_stockfish_moves(chess.Board())
+    thread.join(5)
+
+
+def test_times_out_without_workers(redis_client):
+    EngineWorker(redis_client, FakeEngine(), consumer_name="w1")
+    client = RemoteEngineClient(redis_client, timeout=0.2)
+
+    with pytest.raises(EngineTimeoutError):
+        client.get_top_stockfish_moves(chess.Board())
+
+
+def test_full_queue_is_rejected(redis_client):
+    EngineWorker(redis_client, FakeEngine(), consumer_name="w1")
+    client = RemoteEngineClient(redis_client, timeout=0.1, max_queued_jobs=1)
+
+    with pytest.raises(EngineTimeoutError):
+        client.get_top_stockfish_moves(chess.Board())
+    assert client.queued_jobs() == 1
+    with pytest.raises(EngineBusyError):
+        client.get_top_stockfish_moves(chess.Board())
+
+
+def test_expired_job_is_dropped(redis_client):
+    engine = FakeEngine()
+    worker = EngineWorker(redis_client, engine, consumer_name="w1")
+    client = RemoteEngineClient(redis_client, timeout=0.1)
+
+    with pytest.raises(EngineTimeoutError):
+        client.get_top_stockfish_moves(chess.Board())
+    assert worker.run_once(block_ms=50) == 1
+    assert engine.boards == []
+    assert redis_client.xlen(ENGINE_JOB_STREAM) == 0
+
+
+def test_jobs_of_a_dead_worker_are_reclaimed(redis_client, monkeypatch):
+    monkeypatch.setattr(engine_worker, "RECLAIM_IDLE_MS", 0)
+    EngineWorker(redis_client, FakeEngine(), consumer_name="dead")
+    client = RemoteEngineClient(redis_client, timeout=5)
+
+    result = {}
+    caller = threading.Thread(
+        target=lambda: result.update(top=client.get_top_stockfish_moves(chess.Board()))
+    )
+    caller.start()
+    # the dead worker reads the job and never acknowledges it
+    while not redis_client.xreadgroup(
+        ENGINE_CONSUMER_GROUP, "dead", {ENGINE_JOB_STREAM: ">"}, count=1, block=50
+    ):
+        pass
+
+    survivor = EngineWorker(redis_client, FakeEngine(), consumer_name="alive")
+    assert survivor.reclaim_stale_jobs() == 1
+    caller.join(5)
+    assert result["top"] == TOP_MOVES
+
+
+def test_waiting_on_a_worker_does_not_block_the_event_loop(redis_client):
+    worker = EngineWorker(redis_client, FakeEngine(delay=0.3), consumer_name="w1")
+    client = RemoteEngineClient(redis_client, timeout=5)
+    thread = serve(worker)
+    game = ChessGame(game_id="g1", elo_level=1500)
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        top_moves = await game.get_top_stockfish_moves(engine=client)
+        ticker.cancel()
+        return top_moves, ticks
+
+    top_moves, ticks = asyncio.run(main())
+    thread.join(5)
+    assert top_moves == TOP_MOVES
+    assert ticks >= 10